@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+"""Measure the throughput of evaluate_many against a synthetic procmailrc.
+
+The same synthetic messages are evaluated with each number of workers given by
+--workers, the messages per second and the speedup over the first number are reported.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pyprocmail  # noqa
+from bench_parse import synthetic  # noqa
+
+
+def message(i, recipes):
+    return (
+        b"From user%d@example.com  Mon Jan  1 00:00:00 2015\n"
+        b"From: User <user%d@example.com>\n"
+        b"To: bob@example.org\n"
+        b"Subject: message %d\n"
+        b"\n"
+        b"Hello,\n%s\n"
+    ) % (i % recipes, i % recipes, i, b"some text " * (i % 50))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--recipes", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=32)
+    args = parser.parse_args()
+
+    procmailrc = pyprocmail.parseString(synthetic(args.recipes), backend="fast")
+    variables = {"HOME": "/home/bob"}
+    reference = None
+    for workers in args.workers:
+        messages = (message(i, args.recipes) for i in range(args.messages))
+        begin = time.time()
+        count = sum(1 for _ in pyprocmail.evaluate_many(
+            procmailrc, messages, workers=workers, variables=variables,
+            chunk_size=args.chunk_size
+        ))
+        duration = time.time() - begin
+        if reference is None:
+            reference = duration
+        print("workers %3d: %8.0f messages/s, speedup %.2f" % (
+            workers, count / duration, reference / duration
+        ))
+
+if __name__ == '__main__':
+    main()
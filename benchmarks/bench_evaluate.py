@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+"""Measure the evaluation time of synthetic messages against a synthetic procmailrc.
+
+The messages are evaluated by an engine without and with the literal prefilter index,
+the time per message and the counters of the engine are reported.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pyprocmail  # noqa
+from bench_batch import message  # noqa
+from bench_parse import synthetic  # noqa
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--recipes", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    procmailrc = pyprocmail.parseString(synthetic(args.recipes), backend="fast")
+    messages = [message(i, args.recipes) for i in range(args.messages)]
+    variables = {"HOME": "/home/bob"}
+    for index in (False, True):
+        begin = time.time()
+        engine = pyprocmail.Engine(procmailrc, index=index)
+        setup = time.time() - begin
+        begin = time.time()
+        for data in messages:
+            engine.evaluate(data, variables)
+        duration = time.time() - begin
+        print("index %-5s: setup %6.3fs, %7.3f ms/message" % (
+            index, setup, duration / len(messages) * 1000
+        ))
+        stats = engine.stats()
+        print("    conditions evaluated %d, skipped %d (%d expensive)" % (
+            stats["evaluated"], stats["skipped"], stats["expensive_skipped"]
+        ))
+        if index:
+            print("    recipes skipped by the index: %d" % stats["prefiltered"])
+
+if __name__ == '__main__':
+    main()
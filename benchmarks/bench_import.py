@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+"""Measure the time needed by a fresh interpreter to import pyprocmail.
+
+The modules of the package are only imported on first use. The import of the pyparsing
+grammar is measured too, the import of pyparsing itself being substracted.
+Exit with a non zero status if the median of the import of pyprocmail is above --max-ms.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import time
+begin = time.time()
+import %s
+print(time.time() - begin)
+"""
+
+
+def timeit(module, runs):
+    times = []
+    for _ in range(runs):
+        out = subprocess.check_output(
+            [sys.executable, "-c", SNIPPET % module],
+            cwd=ROOT
+        )
+        times.append(float(out.strip()) * 1000)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    total = timeit("pyprocmail", args.runs)
+    pyparsing = timeit("pyparsing", args.runs)
+    grammar = timeit("pyprocmail.parser", args.runs)
+    print("import pyprocmail: %8.2f ms" % total)
+    print("import pyparsing:  %8.2f ms" % pyparsing)
+    print("grammar only:      %8.2f ms" % (grammar - pyparsing))
+    if args.max_ms is not None and total > args.max_ms:
+        print("FAIL: import takes more than %s ms" % args.max_ms)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+"""Measure the memory used by the AST of a synthetic procmailrc, in bytes per recipe.
+
+The size is the sum of sys.getsizeof over every object reachable from the ProcmailRc
+(nodes, their instance dicts if any, lists, tuples and strings), each object being
+counted once.
+"""
+import argparse
+import gc
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pyprocmail  # noqa
+from bench_parse import synthetic  # noqa
+
+SKIP = (type, types.ModuleType, types.FunctionType, types.ClassType)
+
+
+def deep_size(root):
+    seen = set()
+    stack = [root]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SKIP):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--recipes", type=int, default=10000)
+    args = parser.parse_args()
+
+    text = synthetic(args.recipes)
+    procmailrc = pyprocmail.parseString(text, backend="fast")
+    recipes = 0
+    stack = list(procmailrc)
+    while stack:
+        stmt = stack.pop()
+        if stmt.is_recipe():
+            recipes += 1
+            if stmt.action.is_nested():
+                stack.extend(stmt.action)
+    size = deep_size(procmailrc)
+    print("recipes:          %d" % recipes)
+    print("ast size:         %.2f MB" % (size / 1024.0 / 1024.0))
+    print("bytes per recipe: %d" % (size // recipes))
+
+if __name__ == '__main__':
+    main()
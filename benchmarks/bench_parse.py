@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+"""Measure the parsing time of the bundled examples and of a synthetic procmailrc.
+
+Each input is parsed with the pyparsing grammar and with the fast backend. The best of --runs is reported.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pyprocmail  # noqa
+
+
+def synthetic(recipes):
+    """A procmailrc of `recipes` recipes mixing the common conditions and actions"""
+    lines = [u"# generated", u"MAILDIR=$HOME/Mail", u"DEFAULT=$MAILDIR/inbox/", u""]
+    for i in range(recipes):
+        lines.append(u"#title: rule %d" % i)
+        lines.append(u":0:")
+        lines.append(u"* ^From:.*user%d@example\\.com" % i)
+        lines.append(u"* ! ^Subject:.*\\[spam\\]")
+        if i % 3 == 0:
+            lines.append(u"* > 1000")
+        if i % 5 == 0:
+            lines.append(u"{")
+            lines.append(u"    :0 c")
+            lines.append(u"    | /usr/bin/formail -r")
+            lines.append(u"")
+            lines.append(u"    :0")
+            lines.append(u"    folder%d/" % i)
+            lines.append(u"}")
+        elif i % 2:
+            lines.append(u"folder%d/" % i)
+        else:
+            lines.append(u"! forward%d@example.org" % i)
+        lines.append(u"")
+    return u"\n".join(lines)
+
+
+def best(func, runs):
+    times = []
+    for _ in range(runs):
+        begin = time.time()
+        func()
+        times.append(time.time() - begin)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--recipes", type=int, default=10000)
+    args = parser.parse_args()
+
+    inputs = []
+    for name in ["procmailrc1", "procmailrc2"]:
+        with open(os.path.join(ROOT, "examples", name)) as f:
+            inputs.append((name, f.read().decode("utf-8")))
+    inputs.append(("synthetic (%d recipes)" % args.recipes, synthetic(args.recipes)))
+
+    print("%-28s %12s %12s" % ("input", "pyparsing", "fast"))
+    for name, text in inputs:
+        print("%-28s %9.2f ms %9.2f ms" % (
+            name,
+            best(lambda: pyprocmail.parseString(text), args.runs),
+            best(lambda: pyprocmail.parseString(text, backend="fast"), args.runs),
+        ))
+
+if __name__ == '__main__':
+    main()
@@ -9,4 +9,128 @@
 # Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 # (c) 2015 Valentin Samir
-from procmail import parse, parseString
+
+# The functions of the package import their module on first use, so importing the
+# package costs almost nothing. The classes are created by functions of the same name:
+# import them from their module (`pyprocmail.engine.Engine`...) to subclass them or to
+# use isinstance.
+
+
+def parse(file, charset="utf-8", backend="pyparsing"):
+    """See `procmail.parse`"""
+    import procmail
+    return procmail.parse(file, charset, backend)
+
+
+def parseString(string, backend="pyparsing"):
+    """See `procmail.parseString`"""
+    import procmail
+    return procmail.parseString(string, backend)
+
+
+def iterparse(file, charset="utf-8"):
+    """See `procmail.iterparse`"""
+    import procmail
+    return procmail.iterparse(file, charset)
+
+
+def update(procmailrc, old_text, new_text):
+    """See `procmail.update`"""
+    import procmail
+    return procmail.update(procmailrc, old_text, new_text)
+
+
+def diff(old, new):
+    """See `compare.diff`"""
+    import compare
+    return compare.diff(old, new)
+
+
+def ParseCache(directory, max_size=64 * 1024 * 1024, backend="pyparsing"):
+    """Return a new `cache.ParseCache`"""
+    import cache
+    return cache.ParseCache(directory, max_size, backend)
+
+
+def dumps(procmailrc):
+    """See `serialize.dumps`"""
+    import serialize
+    return serialize.dumps(procmailrc)
+
+
+def loads(data):
+    """See `serialize.loads`"""
+    import serialize
+    return serialize.loads(data)
+
+
+def Engine(procmailrc, executor=None, charset="utf-8", index=True, loader=None):
+    """Return a new `engine.Engine`"""
+    import engine
+    return engine.Engine(procmailrc, executor, charset, index, loader)
+
+
+def evaluate(procmailrc, message, variables=None, executor=None):
+    """See `engine.evaluate`"""
+    import engine
+    return engine.evaluate(procmailrc, message, variables, executor)
+
+
+def evaluate_many(
+    procmailrc, messages, workers=None, variables=None, executor=None, charset="utf-8",
+    chunk_size=32, pending=2, trace=None
+):
+    """See `batch.evaluate_many`"""
+    import batch
+    return batch.evaluate_many(
+        procmailrc, messages, workers, variables, executor, charset, chunk_size, pending,
+        trace
+    )
+
+
+def read_mailbox(path):
+    """See `batch.read_mailbox`"""
+    import batch
+    return batch.read_mailbox(path)
+
+
+def MessageView(data):
+    """Return a new `messageview.MessageView`"""
+    import messageview
+    return messageview.MessageView(data)
+
+
+def SubprocessExecutor(processes=4, timeout=60, shell="/bin/sh", charset="utf-8"):
+    """Return a new `executors.SubprocessExecutor`"""
+    import executors
+    return executors.SubprocessExecutor(processes, timeout, shell, charset)
+
+
+def MemoizingExecutor(executor, max_size=4096):
+    """Return a new `executors.MemoizingExecutor`"""
+    import executors
+    return executors.MemoizingExecutor(executor, max_size)
+
+
+def StubExecutor(table, default=None):
+    """Return a new `executors.StubExecutor`"""
+    import executors
+    return executors.StubExecutor(table, default)
+
+
+def Environment(variables=None, cache=None, hostname=None):
+    """Return a new `environment.Environment`"""
+    import environment
+    return environment.Environment(variables, cache, hostname)
+
+
+def Loader(backend="pyparsing", parse_cache=None):
+    """Return a new `loader.Loader`"""
+    import loader
+    return loader.Loader(backend, parse_cache)
+
+
+def Trace(events=True):
+    """Return a new `tracing.Trace`"""
+    import tracing
+    return tracing.Trace(events)
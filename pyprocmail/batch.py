@@ -0,0 +1,132 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import collections
+import itertools
+import multiprocessing
+import os
+
+import engine
+import serialize
+
+# Evaluation of a procmailrc against many messages, spread over worker processes. The
+# tree is sent once to each worker, the messages are then sent by chunks and at most a
+# few chunks per worker are in flight, so the memory used does not depend on the number
+# of messages.
+
+# engine of a worker process, set by _init_worker
+_engine = None
+
+
+def _mbox(path):
+    """Yield the raw messages of the mbox file `path`, with their From_ line"""
+    with open(path, 'rb') as f:
+        lines = []
+        blank = True
+        for line in f:
+            if blank and line.startswith(b"From ") and lines:
+                # the blank line ending each message is added by the mbox format
+                yield b"".join(lines[:-1])
+                lines = []
+            lines.append(line)
+            blank = line in (b"\n", b"\r\n")
+        if lines:
+            yield b"".join(lines[:-1] if blank else lines)
+
+
+def _maildir(path):
+    """Yield the raw messages of the Maildir `path`, sorted by file name"""
+    names = []
+    for sub in ("new", "cur"):
+        directory = os.path.join(path, sub)
+        if os.path.isdir(directory):
+            names.extend(
+                (name, os.path.join(directory, name))
+                for name in os.listdir(directory) if not name.startswith(".")
+            )
+    names.sort()
+    for name, file in names:
+        with open(file, 'rb') as f:
+            yield f.read()
+
+
+def read_mailbox(path):
+    """Yield the raw messages of `path`, a Maildir if it is a directory, an mbox file
+    otherwise"""
+    if os.path.isdir(path):
+        return _maildir(path)
+    return _mbox(path)
+
+
+def _init_worker(data, executor, charset):
+    global _engine
+    _engine = engine.Engine(serialize.loads(data), executor, charset)
+
+
+def _evaluate_chunk(args):
+    messages, variables = args
+    return [_engine.evaluate(message, variables) for message in messages]
+
+
+def _chunks(messages, size):
+    messages = iter(messages)
+    while True:
+        chunk = list(itertools.islice(messages, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def evaluate_many(
+    procmailrc, messages, workers=None, variables=None, executor=None, charset="utf-8",
+    chunk_size=32, pending=2, trace=None
+):
+    """Yield the `engine.Result` of the processing by `procmailrc` of each message, in
+    the order of `messages`.
+
+    `messages` is an iterable of raw messages or the path of an mbox file or of a
+    Maildir (see `read_mailbox`). The messages are evaluated by `workers` processes (the
+    number of CPUs by default, no process is started if it is 1), by chunks of
+    `chunk_size` messages, with at most `pending` chunks per worker waiting to be
+    evaluated or to be yielded. `executor`, `variables` and `charset` are the same as for
+    `engine.Engine`, the executor being called from the worker processes. If `trace` (a
+    `tracing.Trace`) is given, the messages are evaluated in this process and recorded in
+    it.
+    """
+    if isinstance(messages, basestring):
+        messages = read_mailbox(messages)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1 or trace is not None:
+        local = engine.Engine(procmailrc, executor, charset)
+        for message in messages:
+            yield local.evaluate(message, variables, trace)
+        return
+    pool = multiprocessing.Pool(
+        workers, _init_worker, (serialize.dumps(procmailrc), executor, charset)
+    )
+    try:
+        # the chunks are submitted one at a time rather than with pool.imap, which
+        # consumes the whole iterable of tasks ahead of the workers
+        queue = collections.deque()
+        for chunk in _chunks(messages, chunk_size):
+            if len(queue) >= workers * pending:
+                for result in queue.popleft().get():
+                    yield result
+            queue.append(pool.apply_async(_evaluate_chunk, ((chunk, variables),)))
+        while queue:
+            for result in queue.popleft().get():
+                yield result
+        pool.close()
+    finally:
+        # also reached if the caller stops iterating early
+        pool.terminate()
+        pool.join()
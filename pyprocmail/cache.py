@@ -0,0 +1,197 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import errno
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+
+import procmail
+import serialize
+
+# Changed each time the serialized form of the trees changes, older entries are then
+# simply never hit and end up evicted.
+FORMAT = "serialize-%s" % serialize.VERSION
+
+
+class ParseCache(object):
+    """An on-disk cache of parsed procmailrc files, in `directory`.
+
+    Entries are keyed by the digest of the parsed content, so a file is only parsed
+    again if its content changes. The digest of a file is remembered with its mtime and
+    size, and is not computed again while they stay the same. When the entries take
+    more than `max_size` bytes, the least recently used ones are removed until they take
+    less than 90% of `max_size`. The size of the entries is tracked in memory, the directory
+    is only scanned on the first store and when it seems to go over `max_size` (it may be
+    shared with other processes).
+    """
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024, backend="pyparsing"):
+        procmail._check_backend(backend)
+        self.directory = directory
+        self.max_size = max_size
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # (path, charset) -> (mtime, size, digest)
+        self._digests = {}
+        # path of the entries -> size, from the least to the most recently used, and their
+        # total size. None until the first store.
+        self._entries = None
+        self._size = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def stats(self):
+        """Return the counters of the cache as a dict"""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def parse(self, file, charset="utf-8"):
+        """Same as `procmail.parse` using the cache"""
+        stat = os.stat(file)
+        known = self._digests.get((file, charset))
+        data = None
+        if known is None or known[:2] != (stat.st_mtime, stat.st_size):
+            with open(file, 'r') as f:
+                data = f.read()
+            known = (stat.st_mtime, stat.st_size, self._digest(data, charset))
+            self._digests[(file, charset)] = known
+        procmailrc = self._load(known[2])
+        if procmailrc is None:
+            if data is None:
+                with open(file, 'r') as f:
+                    data = f.read()
+            procmailrc = procmail.parseString(data.decode(charset), backend=self.backend)
+            self._store(known[2], procmailrc)
+        return procmailrc
+
+    def parseString(self, string):
+        """Same as `procmail.parseString` using the cache"""
+        digest = self._digest(string.encode("utf-8"), "utf-8")
+        procmailrc = self._load(digest)
+        if procmailrc is None:
+            procmailrc = procmail.parseString(string, backend=self.backend)
+            self._store(digest, procmailrc)
+        return procmailrc
+
+    def clear(self):
+        """Remove all the entries of the cache"""
+        for name in os.listdir(self.directory):
+            if name.endswith(".entry"):
+                os.remove(os.path.join(self.directory, name))
+        self._digests = {}
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def _digest(self, data, charset):
+        return hashlib.sha1(
+            "%s\0%s\0%s\0" % (FORMAT, self.backend, charset) + data
+        ).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, "%s.entry" % digest)
+
+    def _load(self, digest):
+        """Return the tree cached for `digest`, None (counted as a miss) if there is none"""
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            procmailrc = serialize.loads(data)
+        except IOError:
+            self.misses += 1
+            return None
+        except Exception:
+            # a corrupted entry, parse again
+            try:
+                os.remove(path)
+            except OSError as error:
+                # already removed by another process
+                if error.errno != errno.ENOENT:
+                    raise
+            self._forget(path)
+            self.misses += 1
+            return None
+        # the mtime of the entries is their last use, for the LRU eviction
+        try:
+            os.utime(path, None)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            # evicted by another process since it was read: store it again
+            self._forget(path)
+            self.misses += 1
+            return None
+        self._used(path, len(data))
+        self.hits += 1
+        return procmailrc
+
+    def _store(self, digest, procmailrc):
+        data = serialize.dumps(procmailrc)
+        path = self._path(digest)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp, path)
+        except:
+            os.remove(tmp)
+            raise
+        if self._entries is None:
+            self._scan()
+        else:
+            self._used(path, len(data))
+        if self._size > self.max_size:
+            # the other processes using the directory may have removed entries
+            self._scan()
+            self._evict()
+
+    def _used(self, path, size):
+        """Move the entry `path` of `size` bytes to the most recently used end"""
+        if self._entries is None:
+            return
+        self._forget(path)
+        self._entries[path] = size
+        self._size += size
+
+    def _forget(self, path):
+        if self._entries is not None and path in self._entries:
+            self._size -= self._entries.pop(path)
+
+    def _scan(self):
+        """Read the size and the last use of the entries from the directory"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".entry"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in entries)
+        self._size = sum(size for _, _, size in entries)
+
+    def _evict(self):
+        """Remove the least recently used entries until they take less than 90% of
+        max_size, so the directory is not scanned again on the next store"""
+        while self._size > self.max_size * 0.9 and self._entries:
+            path, size = self._entries.popitem(last=False)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._size -= size
+            self.evictions += 1
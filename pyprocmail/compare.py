@@ -0,0 +1,145 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import gc
+from difflib import SequenceMatcher
+
+# A structural diff of two procmailrc trees. The nodes are compared like with ==, through
+# their structures (see `procmail.BaseObject._structure`), cached by the nodes: the
+# subtrees unchanged since their last comparison are matched without being looked into.
+
+
+class Edit(object):
+    """An edit of the script returned by `diff`. `op` is "insert", "remove" or "modify".
+    `old` is the node of the first tree (None if inserted), at `old_index` in its list (the
+    statements of a procmailrc or of a block, the conditions of a recipe), and `new` the
+    node of the second tree (None if removed) at `new_index`. An inserted node goes before
+    `old_index`, a removed one was before `new_index`. The index of headers and actions is
+    None. The edits of a modified recipe (of its header, conditions and action) and of a
+    modified block (of its statements) are in `edits`"""
+    __slots__ = ("op", "old", "new", "old_index", "new_index", "edits")
+
+    def __init__(self, op, old, new, old_index=None, new_index=None, edits=None):
+        self.op = op
+        self.old = old
+        self.new = new
+        self.old_index = old_index
+        self.new_index = new_index
+        self.edits = [] if edits is None else edits
+
+    def __repr__(self):
+        node = self.new if self.old is None else self.old
+        if node.is_statement():
+            what = node.gen_title()
+        elif node.is_condition():
+            what = "* %s" % node.pre_render()
+        else:
+            what = type(node).__name__
+        return "<Edit %s %s%s>" % (
+            self.op, what, " (%d edits)" % len(self.edits) if self.edits else ""
+        )
+
+
+def _kind(node):
+    """What two nodes must have in common to be seen as a modification of the same node"""
+    if node.is_statement():
+        if node.is_assignment():
+            return tuple(name for name, _, _ in node.variables)
+        return type(node)
+    # conditions
+    return node.type
+
+
+def _diff_lists(old, new, modify):
+    """The edits turning the list of nodes `old` into the list `new`. `modify(old_node,
+    new_node)` returns the edit of nodes of the same kind with different structures"""
+    old_structures = [node._structure() for node in old]
+    new_structures = [node._structure() for node in new]
+    # most of the nodes are usually the same: match the common head and tail first
+    start = 0
+    stop = min(len(old), len(new))
+    while start < stop and old_structures[start] == new_structures[start]:
+        start += 1
+    tail = 0
+    while tail < stop - start and old_structures[-tail - 1] == new_structures[-tail - 1]:
+        tail += 1
+    matcher = SequenceMatcher(
+        None, old_structures[start:len(old) - tail], new_structures[start:len(new) - tail],
+        autojunk=False
+    )
+    edits = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        i1, i2, j1, j2 = i1 + start, i2 + start, j1 + start, j2 + start
+        if tag == "equal":
+            continue
+        # nodes of the same kind replaced are modified, the others removed or inserted
+        kinds = SequenceMatcher(
+            None, [_kind(node) for node in old[i1:i2]], [_kind(node) for node in new[j1:j2]],
+            autojunk=False
+        )
+        for kind_tag, k1, k2, l1, l2 in kinds.get_opcodes():
+            k1, k2, l1, l2 = k1 + i1, k2 + i1, l1 + j1, l2 + j1
+            if kind_tag == "equal":
+                for i, j in zip(xrange(k1, k2), xrange(l1, l2)):
+                    edit = modify(old[i], new[j])
+                    edit.old_index = i
+                    edit.new_index = j
+                    edits.append(edit)
+                continue
+            for i in xrange(k1, k2):
+                edits.append(Edit("remove", old[i], None, i, l1))
+            for j in xrange(l1, l2):
+                edits.append(Edit("insert", None, new[j], k2, j))
+    return edits
+
+
+def _modify_condition(old, new):
+    return Edit("modify", old, new)
+
+
+def _modify_statement(old, new):
+    edit = Edit("modify", old, new)
+    if not old.is_recipe():
+        return edit
+    if old.header._structure() != new.header._structure():
+        edit.edits.append(Edit("modify", old.header, new.header))
+    edit.edits.extend(_diff_lists(old.conditions, new.conditions, _modify_condition))
+    if old.action._structure() != new.action._structure():
+        action = Edit("modify", old.action, new.action)
+        if old.action.is_nested() and new.action.is_nested():
+            action.edits = _diff_statements(old.action, new.action)
+        edit.edits.append(action)
+    return edit
+
+
+def _diff_statements(old, new):
+    return _diff_lists(old, new, _modify_statement)
+
+
+def diff(old, new):
+    """Return the list of `Edit` turning the procmailrc `old` into `new`: the statements
+    inserted, removed and modified, and for the modified recipes, the conditions inserted,
+    removed and modified.
+
+    The nodes are compared like with == (the comments on the lines of headers, conditions
+    and actions and the meta comments are ignored, the Comment statements are not). The
+    statements (and the conditions) are matched on a longest common subsequence, the
+    unmatched ones of the same kind (recipes, comments, assignments of the same variables,
+    conditions of the same type) are paired as modified in their order."""
+    # the collector would be triggered many times while the structures of the nodes are
+    # cached without ever finding anything to free
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _diff_statements(old, new)
+    finally:
+        if enabled:
+            gc.enable()
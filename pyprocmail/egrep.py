@@ -0,0 +1,186 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import re
+
+# Translation of procmail's regular expressions (an egrep dialect, see the "Extended
+# regular expressions" section of procmailrc(5)) to python regular expressions matching
+# byte strings.
+
+# Macros expanded by procmail, as given in procmailrc(5)
+MACROS = [
+    (
+        u"^TO_",
+        u"(^((Original-)?(Resent-)?(To|Cc|Bcc)|(X-Envelope|Apparently(-Resent)?)-To):"
+        u"(.*[^-a-zA-Z0-9_.])?)"
+    ),
+    (
+        u"^TO",
+        u"(^((Original-)?(Resent-)?(To|Cc|Bcc)|(X-Envelope|Apparently(-Resent)?)-To):"
+        u"(.*[^a-zA-Z])?)"
+    ),
+    (
+        u"^FROM_DAEMON",
+        u"(^(Mailing-List:|Precedence:.*(junk|bulk|list)|To: Multiple recipients of |"
+        u"(((Resent-)?(From|Sender)|X-Envelope-From):|>?From )([^>]*[^(.%@a-z0-9])?("
+        u"Post(ma?(st(e?r)?|n)|office)|(send)?Mail(er)?|daemon|m(mdf|ajordomo)|n?uucp|"
+        u"LIST(SERV|proc)|NETSERV|o(wner|ps)|r(e(quest|sponse)|oot)|b(ounce|bs\\.smtp)|"
+        u"echo|mirror|s(erv(ices?|er)|mtp(error)?|ystem)|A(dmin(istrator)?|MMGR|"
+        u"utoanswer))(([^).!:a-z0-9][-_a-z0-9]*)?[%@>\t ][^<)]*(\\(.*\\).*)?)?$([^>]|$)))"
+    ),
+    (
+        u"^FROM_MAILER",
+        u"(^(((Resent-)?(From|Sender)|X-Envelope-From):|>?From )([^>]*[^(.%@a-z0-9])?("
+        u"Post(ma(st(er)?|n)|office)|(send)?Mail(er)?|daemon|mmdf|n?uucp|ops|"
+        u"r(esponse|oot)|(bbs\\.)?smtp(error)?|s(erv(ices?|er)|ystem)|A(dmin(istrator)?|"
+        u"MMGR))(([^).!:a-z0-9][-_a-z0-9]*)?[%@>\t ][^<)]*(\\(.*\\).*)?)?$([^>]|$))"
+    ),
+]
+
+# name of the group holding the text matched after \/, assigned to $MATCH by procmail
+MATCH = "MATCH"
+
+_NON_WORD_CHAR = u"[^A-Za-z0-9_]"
+
+# compiled regular expressions shared by every tree, emptied when it grows too big
+# like the cache of the re module
+_cache = {}
+_MAXCACHE = 4096
+
+
+def translate(pattern):
+    """Return the python regular expression matching the same texts as the procmail
+    regular expression `pattern`"""
+    for macro, expansion in MACROS:
+        if macro in pattern:
+            pattern = pattern.replace(macro, expansion)
+    out = []
+    i = 0
+    end = len(pattern)
+    match_group = False
+    if pattern.startswith(u"^^"):
+        out.append(u"\\A")
+        i = 2
+    if pattern.endswith(u"^^") and end - 2 >= i and not pattern.endswith(u"\\^^"):
+        end -= 2
+        suffix = u"\\Z"
+    else:
+        suffix = u""
+    while i < end:
+        char = pattern[i]
+        if char == u"\\" and i + 1 < end:
+            next = pattern[i + 1]
+            if next == u"<":
+                out.append(u"(?:\\A|%s)" % _NON_WORD_CHAR)
+            elif next == u">":
+                out.append(u"(?:%s|\\Z)" % _NON_WORD_CHAR)
+            elif next == u"/" and not match_group:
+                out.append(u"(?P<%s>" % MATCH)
+                match_group = True
+            else:
+                # any other escaped char stands for itself
+                out.append(re.escape(next))
+            i += 2
+        elif char == u"[":
+            # copy the bracket expression, a ] right after [ or [^ is part of the set
+            j = i + 1
+            if j < end and pattern[j] == u"^":
+                j += 1
+            if j < end and pattern[j] == u"]":
+                j += 1
+            while j < end and pattern[j] != u"]":
+                j += 1
+            if j >= end:
+                raise ValueError("Unterminated bracket expression in %r" % pattern)
+            body = pattern[i + 1:j]
+            negate = body.startswith(u"^")
+            if negate:
+                body = body[1:]
+            # inside brackets every char is literal for procmail, \ included, and for
+            # python too except \ and ] and [ which would start a nested set in future
+            # versions
+            body = body.replace(u"\\", u"\\\\").replace(u"[", u"\\[")
+            if body.startswith(u"]"):
+                body = u"\\" + body
+            out.append(u"[%s%s]" % (u"^" if negate else u"", body))
+            i = j + 1
+        elif char in u"{}":
+            # procmail has no interval expressions
+            out.append(u"\\" + char)
+            i += 1
+        elif char == u"\\":
+            out.append(u"\\\\")
+            i += 1
+        else:
+            out.append(char)
+            i += 1
+    if match_group:
+        out.append(u")")
+    out.append(suffix)
+    return u"".join(out)
+
+
+def compile(pattern, case_sensitive=False, charset="utf-8"):
+    """Return the compiled python regular expression for the procmail regular expression
+    `pattern`, matching byte strings encoded with `charset`. Regular expressions are case
+    insensitive unless `case_sensitive` is True (the D flag)"""
+    key = (pattern, case_sensitive, charset)
+    try:
+        return _cache[key]
+    except KeyError:
+        pass
+    flags = re.MULTILINE
+    if not case_sensitive:
+        flags |= re.IGNORECASE
+    translated = translate(pattern)
+    try:
+        regex = re.compile(translated.encode(charset), flags)
+    except re.error as error:
+        raise ValueError("Invalid regular expression %r: %s" % (pattern, error))
+    if len(_cache) >= _MAXCACHE:
+        _cache.clear()
+    _cache[key] = regex
+    return regex
+
+
+def compiled(cond, case_sensitive=False, charset="utf-8"):
+    """Return the compiled regular expression of the `ConditionRegex` `cond`, using the one
+    attached by `compile_procmailrc` if it is still up to date"""
+    attached = cond._compiled
+    if (
+        attached is not None and attached[0] is cond.regex
+        and attached[1] == case_sensitive and attached[2] == charset
+    ):
+        return attached[3]
+    regex = compile(cond.regex, case_sensitive, charset)
+    cond._compiled = (cond.regex, case_sensitive, charset, regex)
+    return regex
+
+
+def _compile_condition(cond, case_sensitive, charset):
+    if cond.is_regex():
+        compiled(cond, case_sensitive, charset)
+    elif cond.is_substitute():
+        # the regular expression is only known after variables expansion
+        return
+    elif cond.is_nested():
+        _compile_condition(cond.condition, case_sensitive, charset)
+
+
+def compile_procmailrc(stmts, charset="utf-8"):
+    """Compile and attach to each `ConditionRegex` of the statements `stmts` (like a
+    `ProcmailRc`) its regular expression, with the case sensitivity of its recipe"""
+    for stmt in stmts:
+        if stmt.is_recipe():
+            for cond in stmt.conditions:
+                _compile_condition(cond, stmt.header.D, charset)
+            if stmt.action.is_nested():
+                compile_procmailrc(stmt.action, charset)
@@ -0,0 +1,671 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import os
+import socket
+
+import egrep
+import environment
+import messageview
+import prefilter
+
+# An in-process evaluation of a procmailrc against a message, following the semantic
+# described in procmailrc(5) and procmailsc(5). Nothing is ever written and no command
+# is run by the engine itself: deliveries are only recorded, and the commands needed to
+# evaluate a recipe (shell conditions, backquoted assignments, pipes capturing their
+# output or used as a filter) are given to an executor provided by the caller.
+
+# weights reaching these bounds end the evaluation of a scoring recipe
+MAX_SCORE = 2147483647
+MIN_SCORE = -2147483647
+
+# estimated costs of the evaluation of conditions: the side effect free conditions of a
+# recipe are evaluated from the cheapest to the most expensive
+COST_EMPTY = 0
+COST_SIZE = 1
+COST_VARIABLE = 5
+COST_HEADER = 10
+COST_BODY = 100
+COST_SHELL = 10000
+# conditions at least this costly are counted as expensive in `Engine.stats`
+EXPENSIVE = COST_BODY
+
+
+class Delivery(object):
+    """A delivery of the message decided while evaluating a procmailrc.
+
+    `type` is the type of the delivering action ("save", "forward" or "shell") or
+    "default" for the delivery to $DEFAULT when no recipe delivered the message.
+    `target` is the expanded folder, the list of expanded recipients or the command.
+    `recipe_id` is the `_recipe_id` of the recipe (None for the default delivery) and
+    `rcfile` the path of the rcfile of the recipe if it was read from an INCLUDERC or a
+    SWITCHRC (None for the procmailrc of the engine).
+    `clone` is True if a copy of the message was delivered and the processing went on.
+    """
+    __slots__ = ("recipe_id", "type", "target", "clone", "rcfile")
+
+    def __init__(self, recipe_id, type, target, clone=False, rcfile=None):
+        self.recipe_id = recipe_id
+        self.type = type
+        self.target = target
+        self.clone = clone
+        self.rcfile = rcfile
+
+    def __eq__(self, y):
+        if isinstance(y, Delivery):
+            return (
+                self.recipe_id == y.recipe_id and self.rcfile == y.rcfile
+                and self.type == y.type and self.target == y.target and self.clone == y.clone
+            )
+        return False
+
+    def __ne__(self, y):
+        return not self == y
+
+    def __repr__(self):
+        return "<Delivery %s %r from %s%s%s>" % (
+            self.type, self.target, self.recipe_id,
+            "" if self.rcfile is None else " in %s" % self.rcfile,
+            " (clone)" if self.clone else ""
+        )
+
+
+class Result(object):
+    """The outcome of the evaluation of a procmailrc against a message.
+
+    `deliveries` is the list of `Delivery` in the order they were decided, the last one
+    is the one ending the processing. `executed` is the list of the (rcfile, recipe_id) of
+    the recipes whose action was run (see `Delivery`) and `variables` the variables at the
+    end of the processing.
+    """
+    __slots__ = ("deliveries", "executed", "variables")
+
+    def __init__(self, deliveries, executed, variables):
+        self.deliveries = deliveries
+        self.executed = executed
+        self.variables = variables
+
+    @property
+    def delivery(self):
+        """The final delivery of the message, None if procmail stopped without
+        delivering it (see $HOST)"""
+        return self.deliveries[-1] if self.deliveries else None
+
+    def __repr__(self):
+        return "<Result %r>" % (self.deliveries,)
+
+
+class _Chain(object):
+    """State of the A, a, E and e flags at one nesting level: whether the conditions of
+    the last recipe without A or a matched (lastcond) and its action succeeded
+    (lastsucc), and the same for the immediately preceding recipe"""
+    __slots__ = ("lastcond", "lastsucc", "prevcond", "prevsucc")
+
+    def __init__(self):
+        self.lastcond = False
+        self.lastsucc = False
+        self.prevcond = False
+        self.prevsucc = False
+
+
+class _Run(object):
+    """State of one evaluation: the message, the `environment.Environment` and what was
+    decided. A copy is used for the blocks run by a clone of procmail (c flag on a nested
+    block)"""
+
+    def __init__(self, message, variables, deliveries, executed, rcfile, clone=False):
+        self.message = message
+        self.variables = variables
+        self.deliveries = deliveries
+        self.executed = executed
+        # the `Prepared` rcfile being evaluated and its path, None for the procmailrc of
+        # the engine
+        self.rcfile = rcfile
+        self.path = None
+        self.clone = clone
+        # set when a delivering recipe ends the processing
+        self.done = False
+        # paths of the rcfiles being included
+        self.includes = []
+        # the `tracing.Trace` recording the evaluation, if any
+        self.trace = None
+
+    def fork(self):
+        run = _Run(
+            self.message, self.variables.copy(), self.deliveries, self.executed, self.rcfile,
+            clone=True
+        )
+        run.path = self.path
+        run.includes = list(self.includes)
+        run.trace = self.trace
+        return run
+
+
+class _Switch(Exception):
+    """Raised to abort the current rcfile when SWITCHRC is assigned, `rcfile` being the
+    `Prepared` rcfile at `path` to switch to (None to only abort the current one)"""
+
+    def __init__(self, rcfile=None, path=None):
+        super(_Switch, self).__init__()
+        self.rcfile = rcfile
+        self.path = path
+
+
+def default_variables(variables=None):
+    """The variables set by procmail before reading the procmailrc, `variables` taking
+    precedence"""
+    env = dict(variables or {})
+    home = env.setdefault("HOME", os.environ.get("HOME", "/"))
+    logname = env.setdefault("LOGNAME", os.environ.get("LOGNAME", os.environ.get("USER", "")))
+    env.setdefault("SHELL", "/bin/sh")
+    env.setdefault("SENDMAIL", "/usr/sbin/sendmail")
+    env.setdefault("ORGMAIL", "/var/mail/%s" % logname)
+    env.setdefault("DEFAULT", env["ORGMAIL"])
+    env.setdefault("MAILDIR", home)
+    return env
+
+
+def cost(cond, header=True, body=False):
+    """Return the estimated cost of the evaluation of `cond` in a recipe whose H and B
+    flags are `header` and `body`"""
+    if cond.is_empty():
+        return COST_EMPTY
+    elif cond.is_size():
+        return COST_SIZE
+    elif cond.is_regex():
+        return (COST_HEADER if header or not body else 0) + (COST_BODY if body else 0)
+    elif cond.is_variable():
+        if cond.variable in messageview.PARTS:
+            return cost(cond.condition, *messageview.PARTS[cond.variable])
+        return COST_VARIABLE
+    elif cond.is_substitute():
+        return COST_VARIABLE + cost(cond.condition, header, body)
+    elif cond.is_negate() or cond.is_score():
+        return cost(cond.condition, header, body)
+    return COST_SHELL
+
+
+def plan(recipe):
+    """Return the conditions of `recipe` in the order they are evaluated, with their
+    costs, as a tuple of (condition, cost).
+
+    Each run of consecutive side effect free conditions is sorted by cost. Conditions with
+    a side effect (see `prefilter.pure`) and weighted conditions, whose order may end the
+    scoring early, stay in place. The conditions being ANDed, the recipe matches in the
+    new order if and only if it matches in the original order.
+    """
+    header, body = recipe.header.H, recipe.header.B
+    ordered = []
+    pending = []
+    for cond in recipe.conditions:
+        if cond.is_score() or not prefilter.pure(cond):
+            pending.sort(key=lambda item: item[1])
+            ordered.extend(pending)
+            ordered.append((cond, cost(cond, header, body)))
+            pending = []
+        else:
+            pending.append((cond, cost(cond, header, body)))
+    pending.sort(key=lambda item: item[1])
+    ordered.extend(pending)
+    return tuple(ordered)
+
+
+class Prepared(object):
+    """A procmailrc ready to be evaluated: the regular expressions are compiled with
+    `charset`, the conditions of the recipes are planned (see `plan`) and, if `index` is
+    True, the literals they require are indexed (see `prefilter.LiteralIndex`). The tree
+    must not be modified afterwards.
+    """
+    __slots__ = ("procmailrc", "plans", "index")
+
+    def __init__(self, procmailrc, charset="utf-8", index=True):
+        egrep.compile_procmailrc(procmailrc, charset)
+        self.procmailrc = procmailrc
+        self.index = prefilter.LiteralIndex(procmailrc, charset) if index else None
+        # id(recipe) -> plan(recipe)
+        self.plans = {}
+        self._plan_statements(procmailrc)
+
+    def _plan_statements(self, stmts):
+        for stmt in stmts:
+            if stmt.is_recipe():
+                self.plans[id(stmt)] = plan(stmt)
+                if stmt.action.is_nested():
+                    self._plan_statements(stmt.action)
+
+
+class Engine(object):
+    """Evaluate `procmailrc` against messages.
+
+    `executor` is called as executor(command, input, variables) to run the commands
+    needed by the evaluation and must return an (exit_status, output) tuple, input and
+    output being byte strings, see `executors` for ready made ones. The output of a
+    filtering recipe (f flag) replaces the message. Without executor, filtering recipes
+    are skipped and evaluating a recipe that needs the result of a command raises a
+    RuntimeError.
+
+    If `index` is True, the literals required by the regular expressions of the
+    recipes are searched at once in each message and the recipes missing one of them are
+    not evaluated, see `prefilter.LiteralIndex`. The conditions of each recipe are
+    evaluated from the cheapest to the most expensive when it does not change the result,
+    see `plan`. The engine must be created again if `procmailrc` is modified.
+
+    The rcfiles assigned to INCLUDERC and SWITCHRC are read with `loader` (see
+    `loader.Loader`), relative paths being in $MAILDIR. Without loader, these assignments
+    are only recorded by the environment.
+    """
+
+    def __init__(self, procmailrc, executor=None, charset="utf-8", index=True, loader=None):
+        self.procmailrc = procmailrc
+        self.executor = executor
+        self.charset = charset
+        self.loader = loader
+        self._rcfile = Prepared(procmailrc, charset, index)
+        self.index = self._rcfile.index
+        self._indexed = index
+        # the name of the host compared to $HOST
+        self.hostname = socket.gethostname()
+        # expansions shared by the environments of all the evaluations
+        self._expansions = {}
+        self.evaluated = 0
+        self.skipped = 0
+        self.expensive_skipped = 0
+        self.prefiltered = 0
+
+    def stats(self):
+        """Return the counters of the engine as a dict: the number of conditions
+        evaluated, of conditions not evaluated because a previous one failed (skipped)
+        and how many of them were expensive, and the number of recipes skipped by the
+        prefilter index"""
+        return {
+            "evaluated": self.evaluated,
+            "skipped": self.skipped,
+            "expensive_skipped": self.expensive_skipped,
+            "prefiltered": self.prefiltered,
+        }
+
+    def environment(self, variables=None):
+        """Return a new `environment.Environment` holding the `default_variables`"""
+        return environment.Environment(
+            default_variables(variables), self._expansions, self.hostname
+        )
+
+    def matches(self, recipe, message, variables=None):
+        """Return True if the conditions of `recipe` are met by `message` (a raw message or
+        a `messageview.MessageView`), its A, a, E and e flags being ignored. `variables`
+        are the current variables, see `default_variables`"""
+        return self._conditions(self._new_run(message, variables), recipe)
+
+    def evaluate(self, message, variables=None, trace=None):
+        """Return the `Result` of the processing of the raw `message` (a byte string).
+        `variables` are set before the procmailrc is read, see `default_variables`. The
+        evaluation of the recipes and of their conditions is recorded in `trace` if given
+        (see `tracing.Trace`)
+        """
+        run = self._new_run(message, variables)
+        if trace is not None:
+            trace.begin()
+            run.trace = trace
+        self._rcfile_statements(run, self._rcfile)
+        if not run.done:
+            run.deliveries.append(
+                Delivery(None, "default", self._expand(run, run.variables.default))
+            )
+        return Result(run.deliveries, run.executed, run.variables.as_dict())
+
+    def execute(self, command, message, variables=None, header=True, body=False):
+        """Run `command`, after the expansion of its variables, with the executor and the
+        part of `message` selected by `header` and `body` as input. Return the
+        (exit_status, output) tuple of the executor"""
+        run = self._new_run(message, variables)
+        return self._run(run, self._expand(run, command), run.message.part(header, body))
+
+    def _new_run(self, message, variables):
+        return _Run(
+            messageview.view(message), self.environment(variables), [], [], self._rcfile
+        )
+
+    # statements
+
+    def _rcfile_statements(self, run, rcfile, path=None):
+        """Evaluate the `Prepared` `rcfile` read from `path`, and the ones it switches to"""
+        parent, parent_path = run.rcfile, run.path
+        depth = len(run.includes)
+        if path is not None:
+            run.includes.append(path)
+        try:
+            while rcfile is not None:
+                run.rcfile, run.path = rcfile, path
+                try:
+                    self._statements(run, rcfile.procmailrc)
+                    rcfile = None
+                except _Switch as switch:
+                    rcfile, path = switch.rcfile, switch.path
+                    # the rcfiles switched to cannot be switched to again
+                    run.includes.append(switch.path)
+        finally:
+            run.rcfile, run.path = parent, parent_path
+            del run.includes[depth:]
+
+    def _clone(self, run, stmts):
+        """Evaluate `stmts` in the clone `run`. A SWITCHRC only ends the clone, after the
+        evaluation of the rcfile switched to, the current rcfile goes on"""
+        try:
+            self._statements(run, stmts)
+        except _Switch as switch:
+            if switch.rcfile is not None:
+                self._rcfile_statements(run, switch.rcfile, switch.path)
+
+    def _statements(self, run, stmts):
+        chain = _Chain()
+        for stmt in stmts:
+            if run.done:
+                return
+            if stmt.is_assignment():
+                self._assignment(run, stmt)
+            elif stmt.is_recipe():
+                self._recipe(run, stmt, chain)
+
+    def _assignment(self, run, assignment):
+        variables = run.variables
+        start = len(variables.assigned)
+        variables.apply(
+            assignment, lambda command: self._text(self._run(run, command, b"")[1])
+        )
+        if variables.foreign_host:
+            # procmail stops there, the message being considered as delivered
+            run.done = True
+            return
+        if self.loader is None:
+            return
+        for name, value in variables.assigned[start:]:
+            if name == "INCLUDERC":
+                if not value:
+                    continue
+                self._include(run, value)
+                if run.done:
+                    return
+            elif name == "SWITCHRC":
+                if not value:
+                    raise _Switch()
+                path = os.path.join(variables.maildir, value)
+                rcfile = self._load(run, path)
+                if rcfile is not None:
+                    raise _Switch(rcfile, path)
+
+    def _load(self, run, path):
+        """Return the `Prepared` rcfile at `path`, None if it cannot be read or is already
+        being evaluated: procmail then goes on with the current rcfile"""
+        if path in run.includes:
+            return None
+        try:
+            return self.loader.prepared(path, self.charset, self._indexed)
+        except (IOError, OSError):
+            return None
+
+    def _include(self, run, value):
+        path = os.path.join(run.variables.maildir, value)
+        rcfile = self._load(run, path)
+        if rcfile is not None:
+            self._rcfile_statements(run, rcfile, path)
+
+    def _recipe(self, run, recipe, chain):
+        header = recipe.header
+        allowed = True
+        if header.A or header.a:
+            allowed = chain.lastcond and (chain.lastsucc or not header.a)
+        # an executed E recipe disables the immediately following E recipes
+        else_skipped = header.E and chain.prevcond
+        if header.E:
+            allowed = allowed and not chain.prevcond
+        if header.e:
+            allowed = allowed and chain.prevcond and not chain.prevsucc
+        if run.trace is not None:
+            executed = self._traced_conditions(run, recipe, allowed)
+        else:
+            executed = allowed and self._conditions(run, recipe)
+        success = False
+        if executed:
+            run.executed.append((run.path, recipe._recipe_id))
+            success = self._action(run, recipe)
+        if not else_skipped:
+            chain.prevcond = executed
+            chain.prevsucc = success
+        if not (header.A or header.a):
+            chain.lastcond = executed
+            chain.lastsucc = success
+
+    # conditions
+
+    def _traced_conditions(self, run, recipe, allowed):
+        trace = run.trace
+        if not allowed:
+            trace.recipe(recipe, False, 0.0, "flags", run.path)
+            return False
+        prefiltered = self.prefiltered
+        begin = trace.clock()
+        executed = self._conditions(run, recipe)
+        trace.recipe(
+            recipe, executed, trace.clock() - begin,
+            "prefilter" if self.prefiltered != prefiltered else None, run.path
+        )
+        return executed
+
+    def _conditions(self, run, recipe):
+        """Return True if the conditions of `recipe` are met"""
+        index = run.rcfile.index
+        if index is not None and not index.candidate(run.message, recipe):
+            self.prefiltered += 1
+            return False
+        ordered = run.rcfile.plans.get(id(recipe))
+        if ordered is None:
+            ordered = plan(recipe)
+        trace = run.trace
+        score = None
+        for position, (cond, _) in enumerate(ordered):
+            self.evaluated += 1
+            if trace is not None:
+                begin = trace.clock()
+            if cond.is_score():
+                added = self._score(run, recipe, cond)
+                if trace is not None:
+                    trace.condition(
+                        recipe, cond, added > 0, trace.clock() - begin, added, run.path
+                    )
+                score = (score or 0) + added
+                if score >= MAX_SCORE:
+                    self._skip(ordered, position + 1)
+                    break
+                if score <= MIN_SCORE:
+                    self._skip(ordered, position + 1)
+                    return False
+            else:
+                matched = self._condition(run, recipe, cond)
+                if trace is not None:
+                    trace.condition(
+                        recipe, cond, matched, trace.clock() - begin, rcfile=run.path
+                    )
+                if not matched:
+                    self._skip(ordered, position + 1)
+                    return False
+        if score is not None:
+            score = max(MIN_SCORE, min(MAX_SCORE, score))
+            run.variables["="] = u"%d" % score
+            return score > 0
+        return True
+
+    def _skip(self, ordered, start):
+        """Count the conditions of `ordered` from `start` as not evaluated"""
+        for _, estimate in ordered[start:]:
+            self.skipped += 1
+            if estimate >= EXPENSIVE:
+                self.expensive_skipped += 1
+
+    def _condition(self, run, recipe, cond, text=None, expand=False):
+        """Return True if `cond` is met. `text` is the text searched by regular
+        expressions (by default the one selected by the H and B flags) and `expand` tells
+        if variables in the condition must be expanded first"""
+        if cond.is_regex():
+            return self._search(run, recipe, cond, text, expand) is not None
+        elif cond.is_negate():
+            return not self._condition(run, recipe, cond.condition, text, expand)
+        elif cond.is_substitute():
+            return self._condition(run, recipe, cond.condition, text, True)
+        elif cond.is_variable():
+            return self._condition(
+                run, recipe, cond.condition, self._variable_text(run, cond.variable), expand
+            )
+        elif cond.is_size():
+            size = len(run.message.data)
+            if cond.sign == u"<":
+                return size < int(cond.size)
+            return size > int(cond.size)
+        elif cond.is_shell():
+            return self._shell_condition(run, recipe, cond.cmd, expand) == 0
+        elif cond.is_empty():
+            return True
+        raise ValueError("Unknown condition %r" % cond)
+
+    def _score(self, run, recipe, cond):
+        """Return the score added by the weighted condition `cond` (w^x condition)"""
+        weight = float(cond.x)
+        exponent = float(cond.y)
+        inner = cond.condition
+        expand = False
+        if inner.is_substitute():
+            inner, expand = inner.condition, True
+        text = None
+        if inner.is_variable():
+            text = self._variable_text(run, inner.variable)
+            inner = inner.condition
+        if inner.is_regex():
+            # the first match adds w, the next ones w*x, w*x^2...
+            matches = self._findall(run, recipe, inner, text, expand)
+            return sum(weight * exponent ** k for k in range(matches))
+        elif inner.is_size():
+            size = float(max(len(run.message.data), 1))
+            limit = float(max(int(inner.size), 1))
+            ratio = size / limit if inner.sign == u">" else limit / size
+            return weight * ratio ** exponent
+        elif inner.is_shell():
+            if self._shell_condition(run, recipe, inner.cmd, expand) == 0:
+                return weight
+            return 0
+        elif self._condition(run, recipe, inner, text, expand):
+            return weight
+        return 0
+
+    def _variable_text(self, run, name):
+        """The text searched by a `variable ?? regex` condition"""
+        return run.message.variable(name, run.variables, self.charset)
+
+    def _shell_condition(self, run, recipe, cmd, expand):
+        header = recipe.header
+        if expand:
+            cmd = self._expand(run, cmd)
+        status, output = self._run(run, cmd, run.message.part(header.H, header.B))
+        return status
+
+    # regular expressions
+
+    def _regex(self, run, recipe, cond, expand):
+        if expand:
+            return egrep.compile(self._expand(run, cond.regex), recipe.header.D, self.charset)
+        return egrep.compiled(cond, recipe.header.D, self.charset)
+
+    def _search(self, run, recipe, cond, text, expand):
+        if text is None:
+            text = run.message.text(recipe.header.H, recipe.header.B)
+        match = self._regex(run, recipe, cond, expand).search(text)
+        if match is not None and egrep.MATCH in match.re.groupindex:
+            run.variables["MATCH"] = self._text(match.group(egrep.MATCH))
+        return match
+
+    def _findall(self, run, recipe, cond, text, expand):
+        """Return the number of matches of the regular expression of `cond`"""
+        if text is None:
+            text = run.message.text(recipe.header.H, recipe.header.B)
+        return sum(1 for _ in self._regex(run, recipe, cond, expand).finditer(text))
+
+    # actions
+
+    def _action(self, run, recipe):
+        """Run the action of `recipe`, return True if it succeeded"""
+        header = recipe.header
+        action = recipe.action
+        if action.is_nested():
+            if header.c:
+                self._clone(run.fork(), action)
+            else:
+                self._statements(run, action)
+            return True
+        if action.is_save():
+            target = self._expand(run, action.path)
+            if not os.path.isabs(target):
+                target = os.path.join(run.variables.maildir, target)
+        elif action.is_forward():
+            target = [self._expand(run, recipient) for recipient in action.recipients]
+        elif action.is_shell():
+            target = self._expand(run, action.cmd)
+            if action.variable:
+                status, output = self._run(run, target, run.message.part(header.h, header.b))
+                run.variables[action.variable] = self._text(output)
+                return status == 0
+            if header.f:
+                if self.executor is None:
+                    return True
+                status, output = self._run(run, target, run.message.part(header.h, header.b))
+                if status == 0:
+                    run.message = messageview.MessageView(
+                        self._filtered(run.message, header, output)
+                    )
+                return status == 0
+        else:
+            raise ValueError("Unknown action %r" % action)
+        run.deliveries.append(
+            Delivery(
+                recipe._recipe_id, action.type, target, run.clone or header.c, run.path
+            )
+        )
+        if not header.c:
+            run.done = True
+        return True
+
+    # helpers
+
+    def _expand(self, run, text):
+        """Expand the variables in `text`"""
+        return run.variables.expand(text)
+
+    def _text(self, data):
+        return data.decode(self.charset, "replace") if isinstance(data, bytes) else data
+
+    def _filtered(self, message, header, output):
+        """The message after a filter fed with the part selected by the h and b flags
+        returned `output`"""
+        if header.h and header.b:
+            return output
+        elif header.b:
+            return str(message.header) + b"\n" + output
+        return output.rstrip(b"\n") + b"\n\n" + str(message.body)
+
+    def _run(self, run, command, input):
+        if self.executor is None:
+            raise RuntimeError(
+                "An executor is needed to run %r while evaluating the procmailrc" % command
+            )
+        return self.executor(command, input, run.variables)
+
+
+def evaluate(procmailrc, message, variables=None, executor=None):
+    """Return the `Result` of the processing of the raw `message` by `procmailrc`, see
+    `Engine`"""
+    return Engine(procmailrc, executor).evaluate(message, variables)
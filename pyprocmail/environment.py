@@ -0,0 +1,165 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import re
+import socket
+
+# The variables of a procmail process, as described in procmailrc(5), and the expansion
+# of $VAR, ${VAR}, ${VAR:-word}, ${VAR-word}, ${VAR:+word} and ${VAR+word} in the values
+# of assignments, the conditions with the $ flag and the actions.
+
+# variables having an effect on procmail beyond their value
+SPECIAL = ("MAILDIR", "DEFAULT", "LOGFILE", "INCLUDERC", "SWITCHRC", "HOST")
+
+_EXPANSION = re.compile(
+    r"\$(?:([A-Za-z_][A-Za-z0-9_]*)|\{([A-Za-z_][A-Za-z0-9_]*)(?:(:?[-+])([^}]*))?\}|(=))"
+)
+
+
+class Environment(object):
+    """The variables of an evaluation, initialized from the dict `variables`.
+
+    It is used like a dict. `expand(text)` expands the variables in `text`, the result
+    being kept in `cache` (a dict, possibly shared between environments) until one of the
+    variables it depends on has another value. `hostname` is the name of the host compared
+    to $HOST, the one of the machine by default.
+
+    The assignments of the special variables (see `SPECIAL`) are recorded in `assigned`,
+    a list of (name, value) in the order of the assignments, value being None when the
+    variable is unset.
+    """
+    __slots__ = ("_values", "_cache", "hostname", "assigned")
+
+    def __init__(self, variables=None, cache=None, hostname=None):
+        self._values = dict(variables or {})
+        # text -> (expanded text, tuple of (name, value) of the variables used)
+        self._cache = {} if cache is None else cache
+        self.hostname = socket.gethostname() if hostname is None else hostname
+        self.assigned = []
+
+    def copy(self):
+        """Return an independent copy of the environment, sharing the expansion cache"""
+        environment = Environment(self._values, self._cache, self.hostname)
+        environment.assigned = list(self.assigned)
+        return environment
+
+    # dict interface
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __setitem__(self, name, value):
+        self._values[name] = value
+        if name in SPECIAL:
+            self.assigned.append((name, value))
+
+    def __delitem__(self, name):
+        del self._values[name]
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, name, default=None):
+        return self._values.get(name, default)
+
+    def pop(self, name, *default):
+        return self._values.pop(name, *default)
+
+    def items(self):
+        return self._values.items()
+
+    def as_dict(self):
+        """Return a copy of the variables as a dict"""
+        return dict(self._values)
+
+    def apply(self, assignment, command=None):
+        """Apply the `Assignment` `assignment`. `command` is called with the expanded
+        text of backquoted values and returns the output of the command, as text"""
+        for name, value, quote in assignment.variables:
+            if value is None:
+                self._values.pop(name, None)
+                if name in SPECIAL:
+                    self.assigned.append((name, None))
+            elif quote == u"'":
+                self[name] = value
+            elif quote == u"`":
+                if command is None:
+                    raise RuntimeError("Cannot run %r to assign %s" % (value, name))
+                self[name] = command(self.expand(value)).rstrip(u"\n")
+            else:
+                self[name] = self.expand(value)
+
+    # special variables
+
+    @property
+    def maildir(self):
+        """The current directory of procmail, relative folders are in it"""
+        return self._values.get("MAILDIR", u"")
+
+    @property
+    def default(self):
+        """The folder used when no recipe delivered the message"""
+        return self._values.get("DEFAULT", u"")
+
+    @property
+    def logfile(self):
+        return self._values.get("LOGFILE")
+
+    @property
+    def foreign_host(self):
+        """True if $HOST was assigned a name which is not the one of the host: procmail
+        then stops processing the current rcfile"""
+        host = self._values.get("HOST")
+        return host is not None and host != self.hostname
+
+    # expansion
+
+    def expand(self, text):
+        """Return `text` with its variables expanded"""
+        if u"$" not in text:
+            return text
+        cached = self._cache.get(text)
+        if cached is not None:
+            result, dependencies = cached
+            values = self._values
+            for name, value in dependencies:
+                if values.get(name) != value:
+                    break
+            else:
+                return result
+        dependencies = {}
+        result = self._expand(text, dependencies)
+        self._cache[text] = (result, tuple(dependencies.items()))
+        return result
+
+    def _expand(self, text, dependencies):
+        values = self._values
+
+        def substitute(match):
+            name = match.group(1) or match.group(2) or match.group(5)
+            value = values.get(name)
+            dependencies[name] = value
+            operator = match.group(3)
+            if operator is None:
+                return value or u""
+            # with a colon, an empty variable is handled as an unset one
+            is_set = bool(value) if operator.startswith(u":") else value is not None
+            if operator.endswith(u"-"):
+                return value if is_set else self._expand(match.group(4), dependencies)
+            return self._expand(match.group(4), dependencies) if is_set else u""
+
+        return _EXPANSION.sub(substitute, text)
@@ -0,0 +1,181 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import hashlib
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+
+# Executors run the commands of shell conditions (`? cmd`), shell actions (`| cmd`) and
+# backquoted assignments for `engine.Engine`. They are called as
+# executor(command, input, variables) and return an (exit_status, output) tuple, input
+# and output being byte strings.
+
+_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class Executor(object):
+    """Base class of the executors, recording the latency of each command.
+
+    Subclasses implement `execute(command, input, variables)`.
+    """
+
+    def __init__(self):
+        # command -> [calls, total seconds, max seconds]
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, command, input, variables):
+        begin = time.time()
+        try:
+            return self.execute(command, input, variables)
+        finally:
+            self._record(command, time.time() - begin)
+
+    def _record(self, command, duration):
+        with self._lock:
+            latency = self._latencies.get(command)
+            if latency is None:
+                self._latencies[command] = [1, duration, duration]
+            else:
+                latency[0] += 1
+                latency[1] += duration
+                latency[2] = max(latency[2], duration)
+
+    def latencies(self):
+        """Return a dict mapping each command run to a dict of its number of calls and of
+        its total, mean and max latency in seconds"""
+        with self._lock:
+            return dict(
+                (command, {
+                    "calls": calls, "total": total, "mean": total / calls, "max": longest
+                })
+                for command, (calls, total, longest) in self._latencies.items()
+            )
+
+
+class SubprocessExecutor(Executor):
+    """Run the commands with `shell`, at most `processes` at a time.
+
+    The commands are run in $MAILDIR with the variables as environment, like procmail
+    does. A command running for more than `timeout` seconds (None for no limit) is killed
+    and its exit status is then the negative number of the signal.
+    """
+
+    def __init__(self, processes=4, timeout=60, shell="/bin/sh", charset="utf-8"):
+        super(SubprocessExecutor, self).__init__()
+        self.timeout = timeout
+        self.shell = shell
+        self.charset = charset
+        self._slots = threading.BoundedSemaphore(processes)
+
+    def _environment(self, variables):
+        env = {}
+        if "PATH" in os.environ:
+            env["PATH"] = os.environ["PATH"]
+        for name, value in (variables or {}).items():
+            # special variables like $= are not exported
+            if _NAME.match(name):
+                if isinstance(value, unicode):
+                    value = value.encode(self.charset)
+                env[name.encode(self.charset)] = value
+        return env
+
+    def execute(self, command, input, variables):
+        if isinstance(command, unicode):
+            command = command.encode(self.charset)
+        cwd = (variables or {}).get("MAILDIR")
+        if not cwd or not os.path.isdir(cwd):
+            cwd = None
+        with self._slots:
+            process = subprocess.Popen(
+                [self.shell, "-c", command], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, env=self._environment(variables), cwd=cwd,
+                close_fds=True, preexec_fn=os.setsid
+            )
+            timer = None
+            if self.timeout is not None:
+                timer = threading.Timer(self.timeout, self._kill, (process,))
+                timer.start()
+            try:
+                output, _ = process.communicate(input)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+        return process.returncode, output
+
+    @staticmethod
+    def _kill(process):
+        # the command runs in its own process group: the processes started by the shell
+        # would otherwise keep the output open after the shell is killed
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            # already exited
+            pass
+
+
+class MemoizingExecutor(Executor):
+    """Remember the results of `executor` by command and digest of the input, so a
+    command is run once for a given message. The environment is not part of the key: the
+    commands must only depend on their expanded text and their input. At most `max_size`
+    results are kept.
+    """
+
+    def __init__(self, executor, max_size=4096):
+        super(MemoizingExecutor, self).__init__()
+        self.executor = executor
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = {}
+
+    def execute(self, command, input, variables):
+        key = (command, hashlib.sha1(input).digest())
+        result = self._results.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = self.executor(command, input, variables)
+        if len(self._results) >= self.max_size:
+            self._results.clear()
+        self._results[key] = result
+        return result
+
+
+class StubExecutor(Executor):
+    """Answer the commands from `table`, a dict mapping commands to an (exit_status,
+    output) tuple or to a function called with the input and the variables and returning
+    such a tuple. Commands missing from `table` get `default`, or raise a KeyError if it
+    is None. The commands asked are appended to `calls`.
+    """
+
+    def __init__(self, table, default=None):
+        super(StubExecutor, self).__init__()
+        self.table = table
+        self.default = default
+        self.calls = []
+
+    def execute(self, command, input, variables):
+        self.calls.append(command)
+        try:
+            result = self.table[command]
+        except KeyError:
+            if self.default is None:
+                raise KeyError("No result for the command %r" % command)
+            return self.default
+        if callable(result):
+            return result(input, variables)
+        return result
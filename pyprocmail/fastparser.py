@@ -0,0 +1,669 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import codecs
+import re
+from array import array
+
+import procmail
+
+# A hand written single pass parser for procmailrc files. It accepts the same language as the
+# pyparsing grammar of the parser module and directly builds the AST objects of the procmail
+# module. Each construct of the grammar is implemented by a method of `Parser` and the comments
+# refer to the matching grammar element. The first significant char of a statement is enough to
+# know which kind of statement to parse, so nothing is ever parsed twice.
+
+# pyparsing default whitespaces, skipped before most tokens
+_WHITES = re.compile(u"[ \t\r\n]*")
+# whitespaces skipped by LineEnd
+_SPACES = re.compile(u"[ \t\r]*")
+# NL: spaces then a line break or the end of the string
+_EOL = re.compile(u"[ \t\r]*(?:\n|\\Z)")
+# ZeroOrMore(Optional(~NL + CR) + LineEnd())
+_BLANKS = re.compile(u"(?:[ \t\r]*\n)*(?:[ \t\r]*\\Z)?")
+
+_VARIABLE = re.compile(u"[A-Za-z_][A-Za-z0-9_]*")
+_NUMS = re.compile(u"[0-9]+")
+_PRINTABLES = re.compile(u"[!-~]+")
+# parser.printables_word
+_WORD = re.compile(u"[^\\s]+", re.UNICODE)
+_WORD_NO_BRACE = re.compile(u"[^\\s}]+", re.UNICODE)
+# parser.printables_spaces_word
+_TEXT = re.compile(u"[^\r\n]+", re.UNICODE)
+_CHUNK = re.compile(u"[^\\\\\r\n]+", re.UNICODE)
+_PATH = re.compile(u"[^{!|*\r\n][^\r\n]*", re.UNICODE)
+# parser.meta_comment_flag, right after the '#'
+_META_FLAG = re.compile(u"[ \t\r\n]*(title|comment|custom)[ \t\r]*:")
+_QUOTED = {
+    u'"': re.compile(u'"(?:[^"\\\\]|(?:\\\\.))*"', re.MULTILINE | re.DOTALL),
+    u"'": re.compile(u"'(?:[^'\\\\]|(?:\\\\.))*'", re.MULTILINE | re.DOTALL),
+    u"`": re.compile(u"`(?:[^`\\\\]|(?:\\\\.))*`", re.MULTILINE | re.DOTALL),
+}
+_BACKQUOTED = re.compile(u"`(?:[^`\n\r\\\\]|(?:\\\\.))*`")
+_ESCAPED_CHAR = re.compile(u"\\\\(.)")
+_ESCAPED_WHITESPACES = [(u"\\t", u"\t"), (u"\\n", u"\n"), (u"\\f", u"\f"), (u"\\r", u"\r")]
+
+_FLAGS = u"AaBbcDEefHhirWw"
+_SUBSTITUTION_CHARS = u"#$-=?@"
+_QUOTES = {u'"': u'"', u"'": u"'", u"`": u"`"}
+
+
+class _Fail(Exception):
+    """Raised when a grammar element does not match, the caller may try something else"""
+    pass
+
+
+class _Incomplete(Exception):
+    """Raised when `text` may be the beginning of a construct that continues after it"""
+    pass
+
+
+def _error(text, pos):
+    """The ParseException raised when `text` cannot be parsed from `pos`, like the one of
+    the pyparsing grammar. pyparsing is only imported then"""
+    from pyparsing import ParseException
+    return ParseException(text, pos, "Expected end of text")
+
+
+class Parser(object):
+    """Parse the unicode string `text` into a list of `procmail.Statement`. If `complete`
+    is False, `text` is only the beginning of the procmailrc.
+
+    `parse` records in the `starts` and `ends` arrays the offsets in `text` (with its tabs
+    expanded) of the top level statements: where the parser started to read each one,
+    right after the previous statement, and where it stopped, after the following blank
+    lines. The statements, headers, conditions and actions parsed are appended to the flat
+    list `located` with their offsets, see `locations.Locations`.
+    """
+
+    def __init__(self, text, complete=True):
+        # like pyparsing, tabs are expanded before parsing
+        self.text = text.expandtabs()
+        self.len = len(self.text)
+        self.complete = complete
+        self.starts = array("l")
+        self.ends = array("l")
+        self.located = []
+
+    def parse(self):
+        stmts = []
+        for stmt, start, end in self.top_level(0):
+            if stmt is not None:
+                stmts.append(stmt)
+                self.starts.append(start)
+                self.ends.append(end)
+        return stmts
+
+    def top_level(self, pos):
+        """Yield a (statement, start, end) tuple for each top level statement from `pos`,
+        statement being None for the constructions not kept in the AST. Raise a
+        ParseException if the statements do not extend to the end of the text"""
+        while True:
+            mark = len(self.located)
+            try:
+                stmt, end = self.statement(pos)
+            except _Fail:
+                del self.located[mark:]
+                break
+            yield stmt, pos, end
+            pos = end
+        pos = _WHITES.match(self.text, pos).end()
+        if pos < self.len:
+            raise _error(self.text, pos)
+
+    # low level helpers
+
+    def at_eol(self, pos):
+        return _EOL.match(self.text, pos) is not None
+
+    def skip(self, pos):
+        return _SPACES.match(self.text, pos).end()
+
+    def line_end(self, pos):
+        match = _EOL.match(self.text, pos)
+        if match is None:
+            raise _Fail()
+        return match.end()
+
+    def char(self, pos):
+        return self.text[pos:pos + 1]
+
+    # statements
+
+    def statements(self, pos):
+        """ZeroOrMore(Group(statement))"""
+        stmts = []
+        while True:
+            mark = len(self.located)
+            try:
+                stmt, pos = self.statement(pos)
+            except _Fail:
+                # forget the nodes of a statement partially parsed
+                del self.located[mark:]
+                return stmts, pos
+            if stmt is not None:
+                stmts.append(stmt)
+
+    def statement(self, pos):
+        """Return a (statement, position) tuple. statement is None for syntactically
+        valid constructions that are not kept in the AST (empty comments and substitutions)"""
+        text = self.text
+        pos = _BLANKS.match(text, pos).end()
+        pos = _WHITES.match(text, pos).end()
+        char = self.char(pos)
+        if char == u'#':
+            try:
+                value, end = self.comment_raw(pos)
+                stmt = procmail.Comment(value) if value else None
+            except _Fail:
+                metas, end = self.meta_comments(pos)
+                if end == pos:
+                    raise
+                char = self.char(_WHITES.match(text, end).end())
+                if char == u':':
+                    stmt, end = self.recipe(end, metas)
+                elif char and _VARIABLE.match(char):
+                    stmt, end = self.assignments(end, metas)
+                else:
+                    raise _Fail()
+        elif char == u':':
+            stmt, end = self.recipe(pos, {})
+        elif char == u'$' or char == u'`':
+            stmt, end = None, self.substitution(pos)
+        elif char and _VARIABLE.match(char):
+            stmt, end = self.assignments(pos, {})
+        else:
+            raise _Fail()
+        if stmt is not None:
+            self.located.extend((stmt, pos, end))
+        return stmt, _BLANKS.match(text, end).end()
+
+    def comment_raw(self, pos):
+        """A comment line that is not a meta comment, return its text (None if empty)"""
+        text = self.text
+        pos = _WHITES.match(text, pos).end()
+        if self.char(pos) != u'#':
+            raise _Fail()
+        pos += 1
+        if _META_FLAG.match(text, pos):
+            raise _Fail()
+        value = None
+        if not self.at_eol(pos):
+            match = _TEXT.match(text, self.skip(pos))
+            value = match.group()
+            pos = match.end()
+        return value, self.line_end(pos)
+
+    def meta_comments(self, pos):
+        """ZeroOrMore(meta_comment), return a dict of the meta comments values"""
+        text = self.text
+        metas = {}
+        while True:
+            start = _WHITES.match(text, pos).end()
+            if self.char(start) != u'#' or self.at_eol(start + 1):
+                return metas, pos
+            match = _META_FLAG.match(text, start + 1)
+            if match is None:
+                return metas, pos
+            end = match.end()
+            value = None
+            if not self.at_eol(end):
+                value_match = _TEXT.match(text, self.skip(end))
+                value = value_match.group()
+                end = value_match.end()
+            try:
+                pos = self.line_end(end)
+            except _Fail:
+                return metas, pos
+            if value:
+                metas[match.group(1)] = value
+
+    def end_of_line(self, pos):
+        """A line break or a trailing comment, return the comment text (None if no comment)"""
+        match = _EOL.match(self.text, pos)
+        if match is not None:
+            return None, match.end()
+        return self.comment_raw(pos)
+
+    def literal(self, pos, chars):
+        """~NL + one of the single char literals in `chars`"""
+        if not self.at_eol(pos):
+            pos = self.skip(pos)
+            char = self.char(pos)
+            if char and char in chars:
+                return pos + 1
+        raise _Fail()
+
+    def substitution(self, pos):
+        text = self.text
+        if self.char(pos) == u'`':
+            match = _BACKQUOTED.match(text, pos)
+            if match is None:
+                raise _Fail()
+            return match.end()
+        # $VAR
+        if not self.at_eol(pos + 1):
+            try:
+                return self.substitution_variable(self.skip(pos + 1))
+            except _Fail:
+                pass
+        # $\VAR
+        if self.char(pos + 1) == u'\\' and not self.at_eol(pos + 2):
+            try:
+                return self.substitution_variable(self.skip(pos + 2))
+            except _Fail:
+                pass
+        # ${VAR:-value} and ${VAR:+value}
+        pos = self.literal(pos + 1, u'{')
+        if self.at_eol(pos):
+            raise _Fail()
+        pos = self.substitution_variable(self.skip(pos))
+        try:
+            pos = self.literal(pos, u':')
+        except _Fail:
+            pass
+        pos = self.literal(pos, u'-+')
+        if self.at_eol(pos):
+            raise _Fail()
+        match = _WORD_NO_BRACE.match(text, self.skip(pos))
+        if match is None:
+            raise _Fail()
+        return self.literal(match.end(), u'}')
+
+    def substitution_variable(self, pos):
+        match = _VARIABLE.match(self.text, pos) or _NUMS.match(self.text, pos)
+        if match is not None:
+            return match.end()
+        char = self.char(pos)
+        if char and char in _SUBSTITUTION_CHARS:
+            return pos + 1
+        raise _Fail()
+
+    # assignments
+
+    def assignments(self, pos, metas):
+        text = self.text
+        variables = []
+        start = _WHITES.match(text, pos).end()
+        while True:
+            match = _VARIABLE.match(text, start)
+            if match is None:
+                break
+            name = match.group()
+            value = quote = None
+            pos = match.end()
+            if not self.at_eol(pos):
+                start = self.skip(pos)
+                if self.char(start) == u'=':
+                    pos = start + 1
+                    if not self.at_eol(pos):
+                        value, quote, pos = self.value(self.skip(pos), pos)
+            variables.append((name, value, quote))
+            if self.at_eol(pos):
+                break
+            start = self.skip(pos)
+        try:
+            comment, pos = self.end_of_line(pos)
+        except _Fail:
+            comment = None
+        return procmail.Assignment(
+            variables,
+            comment=procmail.Comment(comment) if comment else None,
+            meta_title=metas.get('title'),
+            meta_comment=metas.get('comment'),
+            meta_custom=metas.get('custom'),
+        ), pos
+
+    def value(self, pos, default_end):
+        """Return a (value, quote, position) tuple"""
+        text = self.text
+        char = self.char(pos)
+        if char in _QUOTES:
+            match = _QUOTED[char].match(text, pos)
+            if match is not None:
+                value = match.group()[1:-1]
+                if u'\\' in value:
+                    for escaped, whitespace in _ESCAPED_WHITESPACES:
+                        value = value.replace(escaped, whitespace)
+                    value = _ESCAPED_CHAR.sub(u"\\1", value)
+                return (
+                    value.replace(u"\\\n", u""),
+                    _QUOTES[char] if value else None,
+                    match.end()
+                )
+            elif not self.complete:
+                # the closing quote may be in the rest of the procmailrc
+                raise _Incomplete()
+        match = _WORD.match(text, pos)
+        if match is None:
+            return None, None, default_end
+        return match.group(), None, match.end()
+
+    # recipes
+
+    def recipe(self, pos, metas):
+        text = self.text
+        # colon_line
+        pos = header_start = _WHITES.match(text, pos).end()
+        if self.char(pos) != u':' or self.at_eol(pos + 1):
+            raise _Fail()
+        match = _NUMS.match(text, self.skip(pos + 1))
+        if match is None:
+            raise _Fail()
+        number = match.group()
+        pos = match.end()
+        flags = []
+        while not self.at_eol(pos):
+            start = self.skip(pos)
+            char = self.char(start)
+            if not char or char not in _FLAGS:
+                break
+            flags.append(char)
+            pos = start + 1
+        lockfile = False
+        if not self.at_eol(pos):
+            start = self.skip(pos)
+            if self.char(start) == u':':
+                pos = start + 1
+                lockfile = True
+                if not self.at_eol(pos):
+                    match = _PRINTABLES.match(text, self.skip(pos))
+                    if match is not None:
+                        lockfile = match.group()
+                        pos = match.end()
+        comment, pos = self.end_of_line(pos)
+        header = procmail.Header(
+            number, u"".join(flags), lockfile,
+            comment=procmail.Comment(comment) if comment else None
+        )
+        located = self.located
+        located.extend((header, header_start, pos))
+
+        comment_condition, pos = self.optional_comment(pos)
+        conditions = []
+        while True:
+            mark = len(located)
+            try:
+                condition, pos = self.condition(pos)
+            except _Fail:
+                del located[mark:]
+                break
+            conditions.append(condition)
+        comment_action, pos = self.optional_comment(pos)
+        action, pos = self.action(pos)
+        return procmail.Recipe(
+            header, action, conditions,
+            meta_title=metas.get('title'),
+            meta_custom=metas.get('custom'),
+            meta_comment=metas.get('comment'),
+            comment_condition=procmail.Comment(comment_condition) if comment_condition else None,
+            comment_action=procmail.Comment(comment_action) if comment_action else None
+        ), pos
+
+    def optional_comment(self, pos):
+        """Optional(comment_raw)"""
+        try:
+            return self.comment_raw(pos)
+        except _Fail:
+            return None, pos
+
+    def condition(self, pos):
+        # start_line skips every whitespaces, including blank lines
+        pos = start = _WHITES.match(self.text, pos).end()
+        if self.char(pos) != u'*':
+            raise _Fail()
+        pos += 1
+        condition = None
+        if not self.at_eol(pos):
+            try:
+                condition, pos = self.condition_body(self.skip(pos))
+            except _Fail:
+                pass
+        comment, pos = self.end_of_line(pos)
+        comment = procmail.Comment(comment) if comment else None
+        if condition is None:
+            condition = procmail.ConditionEmpty(comment=comment)
+        else:
+            condition.comment = comment
+        self.located.extend((condition, start, pos))
+        return condition, pos
+
+    def nested_condition(self, pos):
+        """~NL + condition"""
+        if self.at_eol(pos):
+            raise _Fail()
+        start = self.skip(pos)
+        condition, pos = self.condition_body(start)
+        # the condition containing this one always matches from here
+        self.located.extend((condition, start, pos))
+        return condition, pos
+
+    def condition_body(self, pos):
+        text = self.text
+        char = self.char(pos)
+        # variable ?? condition
+        match = _VARIABLE.match(text, pos)
+        if match is not None and not self.at_eol(match.end()):
+            start = self.skip(match.end())
+            if text.startswith(u'??', start):
+                try:
+                    condition, end = self.nested_condition(start + 2)
+                    return procmail.ConditionVariable(match.group(), condition), end
+                except _Fail:
+                    pass
+        if char == u'<' or char == u'>':
+            if not self.at_eol(pos + 1):
+                match = _NUMS.match(text, self.skip(pos + 1))
+                if match is not None:
+                    return procmail.ConditionSize(char, match.group()), match.end()
+        elif char == u'?':
+            if not self.at_eol(pos + 1):
+                match = _TEXT.match(text, self.skip(pos + 1))
+                return procmail.ConditionShell(match.group()), match.end()
+        elif char == u'!':
+            try:
+                condition, end = self.nested_condition(pos + 1)
+                return procmail.ConditionNegate(condition), end
+            except _Fail:
+                pass
+        elif char == u'$':
+            try:
+                condition, end = self.nested_condition(pos + 1)
+                return procmail.ConditionSubstitute(condition), end
+            except _Fail:
+                pass
+        # x ^ y condition
+        match = _NUMS.match(text, pos)
+        if match is not None:
+            try:
+                condition, end = self.score(match, pos)
+                return condition, end
+            except _Fail:
+                pass
+        regex, end = self.escaped_string(pos)
+        return procmail.ConditionRegex(regex), end
+
+    def score(self, x, pos):
+        text = self.text
+        pos = x.end()
+        if self.at_eol(pos):
+            raise _Fail()
+        pos = self.skip(pos)
+        if self.char(pos) != u'^' or self.at_eol(pos + 1):
+            raise _Fail()
+        y = _NUMS.match(text, self.skip(pos + 1))
+        if y is None:
+            raise _Fail()
+        condition, pos = self.nested_condition(y.end())
+        return procmail.ConditionScore(x.group(), y.group(), condition), pos
+
+    def escaped_line(self, pos):
+        """A string with no \\ at the end of a line"""
+        text = self.text
+        match = _CHUNK.match(text, pos)
+        if match is None:
+            raise _Fail()
+        start = pos
+        pos = match.end()
+        while True:
+            end = pos
+            while self.char(end) == u'\\':
+                end += 1
+            if end == pos:
+                break
+            match = _CHUNK.match(text, end)
+            if match is None:
+                break
+            pos = match.end()
+        return text[start:pos], pos
+
+    def escaped_string(self, pos):
+        """A string possibly on multiple line with newline characters escaped by \\"""
+        text = self.text
+        line, pos = self.escaped_line(self.skip(pos))
+        lines = [line]
+        while text.startswith(u'\\\n', pos):
+            end = pos + 2
+            while text.startswith(u'\\\n', end):
+                end += 2
+            try:
+                line, pos = self.escaped_line(end)
+            except _Fail:
+                break
+            lines.append(line)
+        return u"".join(lines), pos
+
+    def action(self, pos):
+        text = self.text
+        pos = start = _WHITES.match(text, pos).end()
+        char = self.char(pos)
+        if char == u'!':
+            pos += 1
+            recipients = []
+            while not self.at_eol(pos):
+                match = _WORD.match(text, self.skip(pos))
+                if match is None:
+                    break
+                recipients.append(match.group())
+                pos = match.end()
+            if not recipients:
+                raise _Fail()
+            action = procmail.ActionForward(recipients)
+        elif char == u'{':
+            stmts, pos = self.statements(pos + 1)
+            pos = _WHITES.match(text, pos).end()
+            if self.char(pos) != u'}':
+                raise _Fail()
+            pos += 1
+            action = procmail.ActionNested(stmts)
+        else:
+            action, pos = self.action_shell(pos)
+            if action is None:
+                match = _PATH.match(text, pos)
+                if match is None:
+                    raise _Fail()
+                action = procmail.ActionSave(match.group())
+                pos = match.end()
+        comment, pos = self.end_of_line(pos)
+        if comment and not action.is_nested():
+            action.comment = procmail.Comment(comment)
+        self.located.extend((action, start, pos))
+        return action, pos
+
+    def action_shell(self, pos):
+        """Return a (action, position) tuple, action is None if there is no shell action"""
+        variable = u""
+        start = pos
+        match = _VARIABLE.match(self.text, pos)
+        if match is not None and not self.at_eol(match.end()):
+            equal = self.skip(match.end())
+            if self.char(equal) == u'=':
+                variable = match.group()
+                start = equal + 1
+        if self.at_eol(start):
+            return None, pos
+        start = self.skip(start)
+        if self.char(start) != u'|' or self.at_eol(start + 1):
+            return None, pos
+        try:
+            cmd, end = self.escaped_string(start + 1)
+        except _Fail:
+            return None, pos
+        return procmail.ActionShell(cmd, variable), end
+
+
+def parse(file, charset="utf-8"):
+    with open(file, 'r') as f:
+        return parseString(f.read().decode(charset))
+
+
+def parseString(string):
+    return Parser(string).parse()
+
+
+def _read_lines(f, charset, block_size):
+    """Yield (text, eof) tuples, text being the decoded content of `f` read by blocks of
+    `block_size` bytes and cut at lines ends. The size of a block is doubled each time
+    the caller sends a true value"""
+    decoder = codecs.getincrementaldecoder(charset)()
+    size = block_size
+    tail = u""
+    while True:
+        data = f.read(size)
+        eof = not data
+        text = tail + decoder.decode(data, eof)
+        if eof:
+            tail = u""
+        else:
+            end = text.rfind(u"\n") + 1
+            text, tail = text[:end], text[end:]
+        if (yield text, eof):
+            size *= 2
+        else:
+            size = block_size
+        if eof:
+            return
+
+
+def iterparse(f, charset="utf-8", block_size=65536):
+    """Yield the top level statements of the file object `f` one at a time.
+
+    Only the lines of the statement being parsed are kept in memory. A statement is
+    yielded when it is followed by something else than blank lines (or at the end of the
+    file), so the rest of the file cannot change how it is parsed."""
+    lines = _read_lines(f, charset, block_size)
+    # tabs are expanded line by line as they are read, the parser won't have to expand
+    # them again.
+    text, eof = next(lines)
+    text = text.expandtabs()
+    while True:
+        parser = Parser(text, complete=eof)
+        pos = 0
+        while True:
+            try:
+                stmt, end = parser.statement(pos)
+            except (_Fail, _Incomplete):
+                break
+            if end >= parser.len and not eof:
+                break
+            if stmt is not None:
+                yield stmt
+            # the locations are not kept
+            del parser.located[:]
+            pos = end
+        if eof:
+            pos = _WHITES.match(text, pos).end()
+            if pos < parser.len:
+                raise _error(text, pos)
+            return
+        # read more text, faster if no statement could be parsed
+        new_text, eof = lines.send(pos == 0)
+        text = text[pos:] + new_text.expandtabs()
@@ -0,0 +1,77 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import os
+import threading
+
+import engine
+import procmail
+
+
+class Loader(object):
+    """Read the rcfiles included with INCLUDERC or SWITCHRC, each file being parsed once.
+
+    The parsed trees are shared by all the engines using the loader, and by all the
+    procmailrcs including the same file: they must not be modified. A file is parsed
+    again when its mtime or its size changes. Files are parsed with `backend`, or with
+    `parse_cache` (a `cache.ParseCache`) if given.
+    """
+
+    def __init__(self, backend="pyparsing", parse_cache=None):
+        procmail._check_backend(backend)
+        self.backend = backend
+        self.parse_cache = parse_cache
+        self.hits = 0
+        self.misses = 0
+        # (path, charset) -> (mtime, size, procmailrc)
+        self._trees = {}
+        # (path, charset, index) -> (procmailrc, engine.Prepared)
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """Return the counters of the loader as a dict"""
+        return {"hits": self.hits, "misses": self.misses, "files": len(self._trees)}
+
+    def get(self, path, charset="utf-8"):
+        """Return the `ProcmailRc` of the rcfile `path`, raise an IOError or an OSError if
+        it cannot be read"""
+        stat = os.stat(path)
+        with self._lock:
+            known = self._trees.get((path, charset))
+            if known is not None and known[:2] == (stat.st_mtime, stat.st_size):
+                self.hits += 1
+                return known[2]
+            self.misses += 1
+            if self.parse_cache is not None:
+                procmailrc = self.parse_cache.parse(path, charset)
+            else:
+                procmailrc = procmail.parse(path, charset, backend=self.backend)
+            self._trees[(path, charset)] = (stat.st_mtime, stat.st_size, procmailrc)
+            return procmailrc
+
+    def prepared(self, path, charset="utf-8", index=True):
+        """Return the rcfile `path` as an `engine.Prepared`, shared like its tree"""
+        procmailrc = self.get(path, charset)
+        key = (path, charset, index)
+        with self._lock:
+            known = self._prepared.get(key)
+            if known is not None and known[0] is procmailrc:
+                return known[1]
+            prepared = engine.Prepared(procmailrc, charset, index)
+            self._prepared[key] = (procmailrc, prepared)
+            return prepared
+
+    def clear(self):
+        """Forget all the rcfiles read"""
+        with self._lock:
+            self._trees = {}
+            self._prepared = {}
@@ -0,0 +1,102 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import bisect
+import re
+from array import array
+
+# Where the nodes of a tree are in the text they were parsed from. The offsets are in the
+# text with its tabs expanded, as seen by the parsers (pyparsing reports its errors at such
+# offsets too).
+
+_NEWLINE = re.compile(u"\n")
+
+
+class Location(object):
+    """The offsets `start` and `end` of a node in the text it was parsed from, and the
+    numbers of its first and last lines (starting at 1). `end` is right after the node: after
+    the line break ending it for the statements, headers, actions and the conditions of a
+    recipe, after the text of the conditions nested in another one"""
+    __slots__ = ("start", "end", "line", "end_line")
+
+    def __init__(self, start, end, line, end_line):
+        self.start = start
+        self.end = end
+        self.line = line
+        self.end_line = end_line
+
+    def __repr__(self):
+        if self.line == self.end_line:
+            lines = "line %d" % self.line
+        else:
+            lines = "lines %d-%d" % (self.line, self.end_line)
+        return "<Location %d-%d, %s>" % (self.start, self.end, lines)
+
+
+class Locations(object):
+    """The locations of the statements, headers, conditions and actions of a tree in `text`.
+
+    `located` is the flat list [node, start, end, node, start, end...] recorded by a parser,
+    each node after the nodes it contains, so the ends never decrease. The nodes are kept in
+    a list and the offsets in integer arrays, with the offsets of the starts of the lines in
+    `lines`: `text` is not kept.
+    """
+    __slots__ = ("nodes", "starts", "ends", "lines", "_index")
+
+    def __init__(self, text, located):
+        self.nodes = located[0::3]
+        self.starts = array("l", located[1::3])
+        self.ends = array("l", located[2::3])
+        self.lines = array("l", [0])
+        self.lines.extend(match.end() for match in _NEWLINE.finditer(text))
+        # id of node -> index in nodes, built on first use
+        self._index = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def line(self, offset):
+        """The number of the line at `offset`"""
+        return bisect.bisect_right(self.lines, offset)
+
+    def get(self, node):
+        """Return the `Location` of `node`, None if it was not parsed from the text"""
+        if self._index is None:
+            # the nodes are kept alive by self.nodes, their ids are not reused
+            self._index = dict((id(other), i) for i, other in enumerate(self.nodes))
+        i = self._index.get(id(node))
+        if i is None:
+            return None
+        start, end = self.starts[i], self.ends[i]
+        return Location(start, end, self.line(start), self.line(max(start, end - 1)))
+
+    def splice(self, start, stop, located, text, edit_start, edit_stop, delta):
+        """Replace the nodes ending after `start` up to `stop` by the nodes of the flat list
+        `located`, after the edit of the text from `edit_start` to `edit_stop` giving `text`,
+        `delta` chars longer. The offsets after the edit are shifted by `delta`"""
+        first = bisect.bisect_right(self.ends, start)
+        last = bisect.bisect_right(self.ends, stop)
+        self.nodes[first:last] = located[0::3]
+        self.starts[first:last] = array("l", located[1::3])
+        self.ends[first:last] = array("l", located[2::3])
+        for i in xrange(first + len(located) // 3, len(self.nodes)):
+            self.starts[i] += delta
+            self.ends[i] += delta
+        self._index = None
+        # the lines starting after a line break of the edited text
+        first = bisect.bisect_right(self.lines, edit_start)
+        last = bisect.bisect_right(self.lines, edit_stop)
+        lines = array("l", (
+            match.end() for match in _NEWLINE.finditer(text, edit_start, edit_stop + delta)
+        ))
+        self.lines[first:last] = lines
+        for i in xrange(first + len(lines), len(self.lines)):
+            self.lines[i] += delta
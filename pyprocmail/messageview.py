@@ -0,0 +1,146 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import re
+
+import egrep
+
+_CONTINUATION = re.compile(b"\n(?=[ \t])")
+
+# names of the variables standing for parts of the message in `VAR ?? regex` conditions
+PARTS = {u"H": (True, False), u"B": (False, True), u"HB": (True, True), u"BH": (True, True)}
+
+
+class MessageView(object):
+    """A raw message as seen by the conditions of a procmailrc.
+
+    The message is split into its header and its body on first use, and the header and
+    the body are buffers on the raw bytes: the body is never copied to be searched. The
+    texts derived from the message (the header with its continued lines concatenated, the
+    header followed by the body, the encoded values of variables) are computed when first
+    needed and kept, so they are shared by all the conditions evaluated on the message.
+    """
+    __slots__ = ("data", "_end", "_start", "_grep_header", "_header_body", "_variables",
+                 "literals")
+
+    def __init__(self, data):
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        self.data = data
+        # end of the header (after its last newline) and start of the body
+        self._end = None
+        self._start = None
+        self._grep_header = None
+        self._header_body = None
+        # name -> (value, encoded value)
+        self._variables = {}
+        # [index, literals found in the header, literals found in the body] for the last
+        # prefilter.LiteralIndex used on the message
+        self.literals = None
+
+    def __len__(self):
+        return len(self.data)
+
+    def _split(self):
+        end = self.data.find(b"\n\n")
+        if end < 0:
+            self._end = self._start = len(self.data)
+        else:
+            self._end, self._start = end + 1, end + 2
+
+    @property
+    def header(self):
+        """The header of the message, with its last newline"""
+        if self._end is None:
+            self._split()
+        return buffer(self.data, 0, self._end)
+
+    @property
+    def body(self):
+        """The body of the message"""
+        if self._start is None:
+            self._split()
+        return buffer(self.data, self._start)
+
+    @property
+    def grep_header(self):
+        """The header searched by the conditions: procmail concatenates continued header
+        lines before grepping them"""
+        if self._grep_header is None:
+            self._grep_header = _CONTINUATION.sub(b" ", str(self.header))
+        return self._grep_header
+
+    def text(self, header, body):
+        """The text searched by conditions, depending on the H and B flags"""
+        if header and body:
+            if self._header_body is None:
+                self._header_body = self.grep_header + b"\n" + str(self.body)
+            return self._header_body
+        elif body:
+            return self.body
+        else:
+            return self.grep_header
+
+    def part(self, header, body):
+        """The bytes fed to commands, depending on the h and b flags"""
+        if header and body:
+            return self.data
+        elif body:
+            return str(self.body)
+        else:
+            return str(self.header)
+
+    def variable(self, name, variables, charset="utf-8"):
+        """The text searched by a `name ?? regex` condition, `variables` being the
+        current variables"""
+        if name in PARTS:
+            return self.text(*PARTS[name])
+        value = variables.get(name, u"") if variables else u""
+        cached = self._variables.get(name)
+        if cached is not None and cached[0] is value:
+            return cached[1]
+        encoded = value.encode(charset) if isinstance(value, unicode) else value
+        self._variables[name] = (value, encoded)
+        return encoded
+
+    def search(self, cond, case_sensitive=False, header=True, body=False, text=None,
+               charset="utf-8"):
+        """Return the match of the regular expression of the `ConditionRegex` `cond` in
+        the part of the message selected by `header` and `body` (the H and B flags), or
+        in `text` if given. None if it does not match"""
+        if text is None:
+            text = self.text(header, body)
+        return egrep.compiled(cond, case_sensitive, charset).search(text)
+
+    def matches(self, cond, case_sensitive=False, header=True, body=False, variables=None,
+                charset="utf-8", text=None):
+        """Return True if the message meets the regular expression condition `cond`: a
+        `ConditionRegex`, a `ConditionVariable` or the negation of one of them.
+        `variables` are the variables searched by `ConditionVariable`"""
+        if cond.is_regex():
+            return self.search(cond, case_sensitive, header, body, text, charset) is not None
+        elif cond.is_negate():
+            return not self.matches(
+                cond.condition, case_sensitive, header, body, variables, charset, text
+            )
+        elif cond.is_variable():
+            return self.matches(
+                cond.condition, case_sensitive, header, body, variables, charset,
+                self.variable(cond.variable, variables, charset)
+            )
+        raise ValueError("%r is not a regular expression condition" % cond)
+
+
+def view(message):
+    """Return `message` as a `MessageView`"""
+    if isinstance(message, MessageView):
+        return message
+    return MessageView(message)
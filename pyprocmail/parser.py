@@ -9,30 +9,147 @@
 # Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 # (c) 2015 Valentin Samir
+import re
+
 from pyparsing import *
 
 # This grammar is induced from the file joined quickref.html also avaible at
 # http://www.zer0.org/procmail/quickref.html
 
-# Unicode printables minus spaces
-unicodePrintables = u''.join(unichr(c) for c in xrange(65536) if not unichr(c).isspace())
-# Unicodes spaces minus carriage returnand line break
-unicodeSpaces = u''.join(
-    unichr(c) for c in xrange(65536) if unichr(c).isspace() and unichr(c) not in ["\n", "\r"]
-)
-unicodePrintablesSpaces = unicodePrintables + unicodeSpaces
+# Character classes are expressed as regular expression sets rather than as the
+# explicit list of every matching unicode code point: building those lists means
+# testing the 65536 code points of the BMP at import time and makes pyparsing
+# compile huge regular expressions.
+
+
+def printables_word(exclude=u""):
+    """A word of unicode printables minus spaces and chars in `exclude`"""
+    return Regex(u"[^\\s%s]+" % re.escape(exclude), re.UNICODE)
+
+
+def printables_spaces_word(exclude=u"", init_exclude=u""):
+    """A word of unicode printables and spaces minus carriage return, line break and chars in
+    `exclude`. Chars in `init_exclude` are not allowed as first char of the word"""
+    if init_exclude:
+        return Regex(
+            u"[^\\r\\n%s][^\\r\\n%s]*" % (
+                re.escape(exclude + init_exclude), re.escape(exclude)
+            ),
+            re.UNICODE
+        )
+    return Regex(u"[^\\r\\n%s]+" % re.escape(exclude), re.UNICODE)
+
+
+class Dispatch(ParserElement):
+    """Match the expression selected by the next significant char of the input.
+    `alternatives` is a list of (chars, expression) and `default` the expression to use for
+    chars not listed. This avoids trying every alternatives of a MatchFirst in turn when the first
+    char is enough to know which ones may match."""
+
+    def __init__(self, alternatives, default=None):
+        super(Dispatch, self).__init__()
+        self.alternatives = alternatives
+        self.table = {}
+        for chars, expr in alternatives:
+            for char in chars:
+                self.table[char] = expr
+        self.default = default
+        # whitespaces are only skipped to look at the next char, the selected expression
+        # skips them itself
+        self.callPreparse = False
+        self.mayIndexError = False
+        self.errmsg = "Expected %s" % self
+
+    def __str__(self):
+        return "Dispatch(%s)" % ", ".join(chars for chars, _ in self.alternatives)
+
+    def exprs(self):
+        exprs = [expr for _, expr in self.alternatives]
+        if self.default is not None:
+            exprs.append(self.default)
+        return exprs
+
+    def streamline(self):
+        if not self.streamlined:
+            super(Dispatch, self).streamline()
+            for expr in self.exprs():
+                expr.streamline()
+        return self
+
+    def parseImpl(self, instring, loc, doActions=True):
+        pos = self.preParse(instring, loc)
+        expr = self.table.get(instring[pos:pos + 1], self.default)
+        if expr is None:
+            raise ParseException(instring, loc, self.errmsg, self)
+        return expr._parse(instring, loc, doActions)
+
+
+class NotNewLine(Token):
+    """Same as ~LineEnd(): match an empty string if the input is not at the end of a line (spaces
+    before the line break are allowed). Unlike NotAny, no exception is raised and caught when
+    it matches, which is by far the most common case in this grammar."""
+
+    LINE_END = re.compile(u"[ \t\r]*(?:\n|\\Z)")
+    LINE_END_NO_SPACES = re.compile(u"\n|\\Z")
+
+    def __init__(self):
+        super(NotNewLine, self).__init__()
+        self.skipWhitespace = False
+        self.mayReturnEmpty = True
+        self.mayIndexError = False
+        self.line_end = self.LINE_END
+        self.name = "~NL"
+        self.errmsg = "Found unwanted end of line"
+
+    def leaveWhitespace(self):
+        # like LineEnd().leaveWhitespace(), spaces are no longer allowed before the line break
+        super(NotNewLine, self).leaveWhitespace()
+        self.line_end = self.LINE_END_NO_SPACES
+        return self
+
+    def parseImpl(self, instring, loc, doActions=True):
+        if loc <= len(instring) and self.line_end.match(instring, loc):
+            raise ParseException(instring, loc, self.errmsg, self)
+        return loc, []
+
 
-NL = Suppress(LineEnd())
-CR = Suppress(Literal("\r"))
+class Located(ParseElementEnhance):
+    """Match `expr` and append to its tokens the offsets where it starts (its first significant
+    char) and ends. Used to record where the nodes of the AST are in the parsed text. The
+    offsets are not named: named results are copied in every enclosing result and would slow
+    down the parsing."""
+
+    WHITES = re.compile(u"[ \t\r\n]*")
+
+    def parseImpl(self, instring, loc, doActions=True):
+        start = self.WHITES.match(instring, loc).end()
+        loc, tokens = self.expr._parse(instring, loc, doActions, callPreParse=False)
+        tokens.append(start)
+        # LineEnd goes one char past the end of the input
+        tokens.append(min(loc, len(instring)))
+        return loc, tokens
+
+
+class NewLine(Suppress):
+    """A suppressed LineEnd, ~NL builds a `NotNewLine`"""
+
+    def __init__(self):
+        super(NewLine, self).__init__(LineEnd())
+
+    def __invert__(self):
+        return NotNewLine()
+
+
+NL = NewLine()
 escape = Literal('\\')
 continuation = escape + LineEnd()
 
 # A string with no \ at the end of a line
 escaped_line = (
-    Word(unicodePrintablesSpaces, excludeChars='\\')
+    printables_spaces_word(exclude=u'\\')
     + ZeroOrMore(
         OneOrMore(~NL + escape)
-        + ~NL + Word(unicodePrintablesSpaces, excludeChars='\\')
+        + ~NL + printables_spaces_word(exclude=u'\\')
     )
 )
 # A string possibly on multiple line with newline characters escaped by \
@@ -54,27 +171,25 @@ title_comment_flag = Literal('title') + ~NL + Literal(':')
 comment_comment_flag = Literal('comment') + ~NL + Literal(':')
 comment_custom_flag = Literal('custom') + ~NL + Literal(':')
 
-meta_comment_flag = title_comment_flag | comment_comment_flag | comment_custom_flag
+# same as title_comment_flag | comment_comment_flag | comment_custom_flag
+meta_comment_flag = Regex(u"(?:title|comment|custom)[ \t\r]*:")
 
 title_comment = (
     Literal('#').suppress()
     + ~NL + title_comment_flag.suppress()
-    + Optional(~NL + Word(unicodePrintablesSpaces)).setResultsName('meta_title')
-    + Optional(~NL + CR)
+    + Optional(~NL + printables_spaces_word()).setResultsName('meta_title')
     + LineEnd().suppress()
 )
 comment_comment = (
     Literal('#').suppress()
     + ~NL + comment_comment_flag.suppress()
-    + Optional(~NL + Word(unicodePrintablesSpaces)).setResultsName('meta_comment')
-    + Optional(~NL + CR)
+    + Optional(~NL + printables_spaces_word()).setResultsName('meta_comment')
     + LineEnd().suppress()
 )
 comment_custom = (
     Literal('#').suppress()
     + ~NL + comment_custom_flag.suppress()
-    + Optional(~NL + Word(unicodePrintablesSpaces)).setResultsName('meta_custom')
-    + Optional(~NL + CR)
+    + Optional(~NL + printables_spaces_word()).setResultsName('meta_custom')
     + LineEnd().suppress()
 )
 meta_comment = title_comment | comment_comment | comment_custom
@@ -84,15 +199,14 @@ meta_comment = title_comment | comment_comment | comment_custom
 comment_raw = (
     Literal('#').suppress()
     + ~meta_comment_flag
-    + Optional(~NL + Word(unicodePrintablesSpaces))
-    + Optional(~NL + CR)
+    + Optional(~NL + printables_spaces_word())
     + LineEnd().suppress()
 )
 comment = comment_raw.setResultsName('comment')
 
 # The end of a line may contain a comment line
 end_of_line = (
-    (Optional(~NL + CR) + LineEnd().suppress())
+    LineEnd().suppress()
     | comment_raw.setResultsName('comment_line')
 )
 start_line = Optional((ZeroOrMore(Word(' \t'))).suppress())
@@ -104,7 +218,7 @@ assignement = variable + Optional(
         QuotedString('"', "\\", multiline=True).setResultsName('double_quote')
         | QuotedString("'", "\\", multiline=True).setResultsName('single_quote')
         | QuotedString("`", "\\", multiline=True).setResultsName('shell_eval')
-        | Word(unicodePrintables).setResultsName('no_quote')
+        | printables_word().setResultsName('no_quote')
     ))
 )
 
@@ -135,7 +249,7 @@ substitution |= (
     + ~NL + substitution_variable
     + Optional(~NL + Literal(':'))
     + ~NL + (Literal('-') | Literal('+'))
-    + ~NL + Word(unicodePrintables.replace('}', ''))
+    + ~NL + printables_word(exclude=u'}')
     + ~NL + Literal('}')
 )
 substitution |= QuotedString('`', "\\")
@@ -147,23 +261,27 @@ recipe = Forward()
 # The procmails statements
 # I don't think it's valid to find substitution in the midle
 # of nowhere.
-statement = ZeroOrMore(Optional(~NL + CR) + LineEnd()).suppress() \
-    + (comment | assignements | substitution | recipe) \
-    + ZeroOrMore(Optional(~NL + CR) + LineEnd()).suppress()
+statement = ZeroOrMore(LineEnd()).suppress() \
+    + Located(Dispatch([
+        ('#', comment | assignements | recipe),  # meta comments start assignements and recipes
+        (':', recipe),
+        ('$`', substitution),
+        (alphas + '_', assignements),
+    ])) \
+    + ZeroOrMore(LineEnd()).suppress()
 statements = ZeroOrMore(Group(statement))
 
 ##### Recipe definition ######
 
-flag = Literal('A') | Literal('a') | Literal('B') | Literal('b') | Literal('c') \
-    | Literal('D') | Literal('E') | Literal('e') | Literal('f') | Literal('H') \
-    | Literal('h') | Literal('i') | Literal('r') | Literal('W') | Literal('w')
+flag = oneOf('A a B b c D E e f H h i r W w')
 flags = Optional(flag + ZeroOrMore(~NL + flag)).setResultsName('flags')
 lockfile = (Literal(':') + Optional(~NL + Word(printables))).setResultsName('lockfile')
 # first line of a recipe
 colon_line = (
-    start_line + ~NL + Literal(':').suppress() + ~NL + Word(nums).setResultsName('number')
-    + Optional(~NL + flags) + Optional(~NL + lockfile) + end_of_line
-    ).setResultsName('header')
+    start_line + ~NL + Located(
+        Literal(':').suppress() + ~NL + Word(nums).setResultsName('number')
+        + Optional(~NL + flags) + Optional(~NL + lockfile) + end_of_line
+    )).setResultsName('header')
 
 
 # Definition of a condition
@@ -171,46 +289,54 @@ condition = Forward()
 condition_regex = escaped_string
 condition_size = (Literal('>') | Literal('<')).setResultsName("sign") \
     + ~NL + Word(nums).setResultsName("size")
-condition_shell = Literal('?').suppress() + ~NL + Word(unicodePrintablesSpaces)
-condition << (
-    (
-        variable.setResultsName("variable")
-        + ~NL + Literal('??')
-        + ~NL + Group(condition).setResultsName("condition")
-    ).setResultsName("variable") |
-    condition_size.setResultsName("size") |
-    condition_shell.setResultsName("shell") |
-    (Literal('!').suppress() + ~NL + Group(condition).setResultsName("negate")) |
-    (Literal('$').suppress() + ~NL + Group(condition).setResultsName("substitute")) |
-    (
-        Word(nums).setResultsName("x")
-        + ~NL + Literal('^').suppress()
-        + ~NL + Word(nums).setResultsName("y")
-        + ~NL + Group(condition).setResultsName("condition")
-    ).setResultsName("score") |
-    condition_regex.setResultsName("regex")
-    )
-condition = (start_line + ~NL + Literal('*').suppress() + Optional(~NL + condition) + end_of_line)
+condition_shell = Literal('?').suppress() + ~NL + printables_spaces_word()
+condition_regex = condition_regex.setResultsName("regex")
+# a condition in another one
+nested_condition = Group(Located(condition))
+condition << Dispatch(
+    [
+        (alphas + '_', (
+            variable.setResultsName("variable")
+            + ~NL + Literal('??')
+            + ~NL + nested_condition.setResultsName("condition")
+        ).setResultsName("variable") | condition_regex),
+        ('<>', condition_size.setResultsName("size") | condition_regex),
+        ('?', condition_shell.setResultsName("shell") | condition_regex),
+        ('!', (
+            Literal('!').suppress() + ~NL + nested_condition.setResultsName("negate")
+        ) | condition_regex),
+        ('$', (
+            Literal('$').suppress() + ~NL + nested_condition.setResultsName("substitute")
+        ) | condition_regex),
+        (nums, (
+            Word(nums).setResultsName("x")
+            + ~NL + Literal('^').suppress()
+            + ~NL + Word(nums).setResultsName("y")
+            + ~NL + nested_condition.setResultsName("condition")
+        ).setResultsName("score") | condition_regex),
+    ],
+    default=condition_regex
+)
+condition = start_line + ~NL + Located(
+    Literal('*').suppress() + Optional(~NL + condition) + end_of_line
+)
 
 # Definition of possibles actions
-action_first_char = unicodePrintablesSpaces
-for char in ['{', '!', '|', '*']:
-    action_first_char = action_first_char.replace(char, '')
-
-action_forward = Literal('!').suppress() + ~NL + OneOrMore(~NL + Word(unicodePrintables))
+action_forward = Literal('!').suppress() + ~NL + OneOrMore(~NL + printables_word())
 action_shell = Optional(variable.setResultsName("variable") + ~NL + Literal('=')) \
     + ~NL + Literal('|') + ~NL + escaped_string.setResultsName("cmd")
-action_save = Word(action_first_char, unicodePrintablesSpaces)
+action_save = printables_spaces_word(init_exclude=u'{!|*')
 action_list = Literal('{').suppress() + statements + Literal('}').suppress()
 action = (
-    start_line + ~NL +
-    (
-        action_forward.setResultsName("forward") |
-        action_list.setResultsName('statements') |
-        action_shell.setResultsName("shell") |
-        action_save.setResultsName("path")
-    ) + end_of_line
-    ).setResultsName('action')
+    start_line + ~NL + Located(
+        Dispatch(
+            [
+                ('!', action_forward.setResultsName("forward")),
+                ('{', action_list.setResultsName('statements')),
+            ],
+            default=action_shell.setResultsName("shell") | action_save.setResultsName("path")
+        ) + end_of_line
+    )).setResultsName('action')
 
 # Finelly recursive definition of a recipe
 recipe << (
@@ -227,10 +353,11 @@ recipe << (
 base_statements = StringStart() + statements + StringEnd()
 
 
-def parse(file, charset="utf-8"):
-    with open(file, 'r') as f:
-        return (base_statements).parseString(f.read().decode(charset))
-
-
 def parseString(string):
+    """Parse `string`"""
     return (base_statements).parseString(string)
+
+
+def parse(file, charset="utf-8"):
+    with open(file, 'r') as f:
+        return parseString(f.read().decode(charset))
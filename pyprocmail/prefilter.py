@@ -0,0 +1,268 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import re
+
+import egrep
+
+# A recipe whose conditions search `^From:.*user@example\.com` cannot match a message
+# not containing "user@example.com". The literals required by the regular expressions of
+# all the recipes are searched at once in each message, and a recipe is only evaluated
+# if all its required literals were found.
+
+# shorter literals are found in nearly every message and would only slow the scan
+MIN_LENGTH = 3
+
+# which part of the message is searched by a condition
+HEADER = 1
+BODY = 2
+
+_PARTS = {u"H": HEADER, u"B": BODY, u"HB": HEADER | BODY, u"BH": HEADER | BODY}
+
+
+def _group_end(pattern, i):
+    """Return the index following the ) closing the group opened at `i`"""
+    depth = 0
+    end = len(pattern)
+    while i < end:
+        char = pattern[i]
+        if char == u"\\":
+            i += 2
+            continue
+        if char == u"[":
+            i = _bracket_end(pattern, i)
+            continue
+        if char == u"(":
+            depth += 1
+        elif char == u")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return end
+
+
+def _bracket_end(pattern, i):
+    """Return the index following the ] closing the bracket expression opened at `i`, a
+    backslash being literal inside it (see `egrep.translate`)"""
+    end = len(pattern)
+    j = i + 1
+    if j < end and pattern[j] == u"^":
+        j += 1
+    if j < end and pattern[j] == u"]":
+        j += 1
+    while j < end and pattern[j] != u"]":
+        j += 1
+    return j + 1
+
+
+def literals(pattern):
+    """Return the list of the literal strings any text matched by the procmail regular
+    expression `pattern` must contain"""
+    for macro, expansion in egrep.MACROS:
+        if macro in pattern:
+            pattern = pattern.replace(macro, expansion)
+    runs = []
+    current = []
+    i = 0
+    end = len(pattern)
+    while i < end:
+        char = pattern[i]
+        if char == u"|":
+            # a top level alternative, nothing is required
+            return []
+        if char == u"\\" and i + 1 < end:
+            next = pattern[i + 1]
+            i += 2
+            if next == u"/":
+                # only marks the start of $MATCH
+                continue
+            elif next in u"<>":
+                atom = None
+            else:
+                atom = next
+        elif char == u"[":
+            i = _bracket_end(pattern, i)
+            atom = None
+        elif char == u"(":
+            i = _group_end(pattern, i)
+            atom = None
+        elif char in u".^$":
+            i += 1
+            atom = None
+        else:
+            i += 1
+            atom = char
+        quantifier = pattern[i] if i < end else None
+        if quantifier in (u"*", u"?", u"+"):
+            i += 1
+            if atom is not None and quantifier == u"+":
+                current.append(atom)
+            atom = None
+        if atom is None:
+            runs.append(u"".join(current))
+            current = []
+        else:
+            current.append(atom)
+    runs.append(u"".join(current))
+    return [run for run in runs if len(run) >= MIN_LENGTH]
+
+
+def pure(cond):
+    """Return True if evaluating `cond` has no side effect: it runs no command and does
+    not set $MATCH"""
+    if cond.is_regex():
+        return u"\\/" not in cond.regex
+    elif cond.is_size() or cond.is_empty():
+        return True
+    elif cond.is_negate() or cond.is_variable() or cond.is_score():
+        return pure(cond.condition)
+    # shell conditions, and regular expressions only known after expansion
+    return False
+
+
+def _trie_regex(words):
+    """Return a regular expression matching the longest of the sorted, distinct `words`
+    starting at the current position"""
+    if words == [b""]:
+        return b""
+    optional = words[0] == b""
+    if optional:
+        words = words[1:]
+    branches = []
+    i = 0
+    while i < len(words):
+        first = words[i][:1]
+        j = i
+        while j < len(words) and words[j][:1] == first:
+            j += 1
+        branches.append(
+            re.escape(first) + _trie_regex([word[1:] for word in words[i:j]])
+        )
+        i = j
+    if len(branches) == 1 and not optional:
+        return branches[0]
+    # greedy: the longer words are tried first, then their prefixes
+    return b"(?:%s)%s" % (b"|".join(branches), b"?" if optional else b"")
+
+
+class LiteralIndex(object):
+    """An index of the literals required by the regular expression conditions of the
+    recipes of `procmailrc`, encoded with `charset`.
+
+    `candidate(message, recipe)` returns False if the conditions of `recipe` cannot match
+    `message`. Only the conditions before the first one with a side
+    effect (a shell command or the assignment of $MATCH) are used, so a recipe that is not
+    a candidate would have failed without anything else happening. The index is built for
+    the tree as it is when created and must be created again if the tree is modified.
+    """
+
+    def __init__(self, procmailrc, charset="utf-8"):
+        self.charset = charset
+        # id(recipe) -> tuple of (part, literal)
+        self._required = {}
+        words = set()
+        self._collect(procmailrc, words)
+        # literal -> the literals that are its prefixes (itself included): at a given
+        # position the scan only finds the longest literal
+        self._prefixes = dict(
+            (word, tuple(
+                word[:end] for end in range(MIN_LENGTH, len(word) + 1) if word[:end] in words
+            ))
+            for word in words
+        )
+        if words:
+            self._scanner = re.compile(b"(?=(%s))" % _trie_regex(sorted(words)))
+        else:
+            self._scanner = None
+        self.checked = 0
+        self.skipped = 0
+
+    def __len__(self):
+        """The number of distinct literals in the index"""
+        return len(self._prefixes)
+
+    def _collect(self, stmts, words):
+        for stmt in stmts:
+            if not stmt.is_recipe():
+                continue
+            required = []
+            header = stmt.header
+            if header.B and header.H:
+                part = HEADER | BODY
+            elif header.B:
+                part = BODY
+            else:
+                part = HEADER
+            for cond in stmt.conditions:
+                found = self._condition(cond, part)
+                if found is None:
+                    break
+                required.extend(found)
+            if required:
+                self._required[id(stmt)] = tuple(required)
+                words.update(word for _, word in required)
+            if stmt.action.is_nested():
+                self._collect(stmt.action, words)
+
+    def _condition(self, cond, part):
+        """Return the list of (part, literal) required by `cond`, or None if it has a side
+        effect and the following conditions must not be used"""
+        if cond.is_regex():
+            if u"\\/" in cond.regex:
+                return None
+            return [
+                (part, literal.encode(self.charset).lower())
+                for literal in literals(cond.regex)
+            ]
+        elif cond.is_variable() and cond.variable in _PARTS:
+            inner = cond.condition
+            if inner.is_regex():
+                return self._condition(inner, _PARTS[cond.variable])
+            return [] if pure(inner) else None
+        return [] if pure(cond) else None
+
+    def scan(self, data):
+        """Return the set of the literals of the index found in `data` (a byte string or a
+        buffer)"""
+        found = set()
+        if self._scanner is None:
+            return found
+        prefixes = self._prefixes
+        for match in self._scanner.finditer(str(data).lower()):
+            found.update(prefixes[match.group(1)])
+        return found
+
+    def _found(self, message, part):
+        """The literals found in the header (`part` is HEADER) or the body of the
+        `messageview.MessageView` `message`, each part being scanned once"""
+        literals = message.literals
+        if literals is None or literals[0] is not self:
+            literals = message.literals = [self, None, None]
+        if literals[part] is None:
+            literals[part] = self.scan(message.grep_header if part == HEADER else message.body)
+        return literals[part]
+
+    def candidate(self, message, recipe):
+        """Return False if the conditions of `recipe` cannot match the
+        `messageview.MessageView` `message`"""
+        required = self._required.get(id(recipe))
+        if required is None:
+            return True
+        self.checked += 1
+        for part, literal in required:
+            if part & HEADER and literal in self._found(message, HEADER):
+                continue
+            if part & BODY and literal in self._found(message, BODY):
+                continue
+            self.skipped += 1
+            return False
+        return True
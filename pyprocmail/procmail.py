@@ -9,11 +9,117 @@
 # Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 # (c) 2015 Valentin Samir
-import parser
+import fastparser
+import locations
+import messageview
+import array
+import bisect
+import operator
+import binascii
+import errno
 import os
 
 
+# the pyparsing grammar (the parser module) and the engine are imported on first use
+
+
+def _engine(executor, charset="utf-8"):
+    """A new `engine.Engine` without procmailrc, running the commands with `executor`"""
+    import engine
+    return engine.Engine((), executor, charset, index=False)
+
+
+def _same(snapshot1, snapshot2):
+    """True if the two snapshots (tuples or None) hold the same objects. The objects of
+    the cached snapshot are alive: their ids cannot be the ids of other objects"""
+    if snapshot1 is None or snapshot2 is None:
+        return snapshot1 is snapshot2
+    return map(id, snapshot1) == map(id, snapshot2)
+
+
+def _rendered_attribute(name, doc=None):
+    """A property for the attribute `name` of a node, stored in the slot "_`name`":
+    setting it drops the cached rendering of the node (see `BaseObject`)"""
+    slot = "_%s" % name
+
+    def set(self, value):
+        setattr(self, slot, value)
+        self._changed()
+    return property(operator.attrgetter(slot), set, doc=doc)
+
+
 class BaseObject(object):
+    # Nodes of the AST have no instance dict: the attributes of each concrete class are
+    # listed in its __slots__, mixins and base classes declare empty slots.
+    #
+    # The nodes cache their rendering in the _rendered slot, as an (ident, text, snapshot)
+    # tuple. A node rendering another one adopts it: it becomes its _owner (statements in
+    # a list use their parent). The attributes changing the rendering are properties
+    # (see `_rendered_attribute`) dropping the cached rendering of the node and of its
+    # owners when set, the lists modified in place (conditions, recipients, variables) are
+    # compared to the snapshot taken by `_snapshot` when rendering. The snapshot of a node
+    # made of the renderings of other nodes holds their cached renderings, which are
+    # checked without rendering them (see `_valid`).
+    #
+    # The structure of a node (see `_structure`) is cached the same way in the _structured
+    # slot, as a (structure, children) tuple.
+    __slots__ = ()
+
+    def _adopt(self, owner):
+        self._owner = owner
+        return self
+
+    def _container(self):
+        return getattr(self, "_owner", None)
+
+    def _changed(self):
+        """Drop the cached rendering and structure of the node and of its owners"""
+        node = self
+        # up to the ProcmailRc, which caches nothing
+        while isinstance(node, BaseObject):
+            node._rendered = None
+            node._structured = None
+            node = node._container()
+
+    def _snapshot(self, ident):
+        return None
+
+    def _children(self):
+        """The snapshot of the children of the node and of the lists it holds which may be
+        modified in place, compared to decide if the cached structure can be used"""
+        return None
+
+    def _structure(self):
+        """Return a tuple identifying the structure of the node as compared by __eq__, the
+        positions of the statements being ignored: nodes are equal if their structures are
+        equal. The structure is made of the attributes of the node and of the structures
+        of its children, it is cached until one of them changes, so the structures of
+        unchanged subtrees are compared by identity"""
+        children = self._children()
+        cached = getattr(self, "_structured", None)
+        if cached is None or not _same(cached[1], children):
+            cached = self._structured = (self._structure_key(), children)
+        return cached[0]
+
+    def _fresh(self, ident):
+        """The cached (ident, text, snapshot) rendering of the node if it is still valid
+        for `ident`, None if the node must be rendered"""
+        rendered = getattr(self, "_rendered", None)
+        if rendered is not None and rendered[0] == ident and self._valid(ident, rendered[2]):
+            return rendered
+
+    def _valid(self, ident, snapshot):
+        """True if the `snapshot` taken when rendering the node for `ident` is still valid"""
+        return _same(snapshot, self._snapshot(ident))
+
+    def render(self, ident=0):
+        rendered = self._fresh(ident)
+        if rendered is None:
+            text = self._render(ident)
+            # taken after rendering: the stale children of the node have been rendered
+            self._rendered = (ident, text, self._snapshot(ident))
+            return text
+        return rendered[1]
 
     def is_statement(self):
         return False
@@ -27,11 +133,20 @@ class BaseObject(object):
     def is_condition(self):
         return False
 
+    def _render_to(self, write, ident=0):
+        """Pass the rendering of the node to `write`, possibly in several chunks"""
+        write(self.render(ident))
+
 
 class MetaCommentable(object):
-    meta_title = None
-    meta_comment = None
-    meta_custom = None
+    """Mixin class for procmail objects with meta comments, subclasses have the
+    meta_title, meta_comment and meta_custom attributes, stored in the _meta_title,
+    _meta_comment and _meta_custom slots"""
+    __slots__ = ()
+
+    meta_title = _rendered_attribute("meta_title")
+    meta_comment = _rendered_attribute("meta_comment")
+    meta_custom = _rendered_attribute("meta_custom")
 
     def _get_meta(self, ident):
         s = []
@@ -45,27 +160,61 @@ class MetaCommentable(object):
 
 
 class Commentable(object):
-    """Mixin class for commentable procmail objects"""
-    comment = None
+    """Mixin class for commentable procmail objects, subclasses have a comment attribute
+    stored in the _comment slot"""
+    __slots__ = ()
+
+    comment = _rendered_attribute("comment")
 
     def has_comment(self):
         return True if self.comment else False
 
     def _get_comment(self):
         if self.comment:
-            return u" %s" % self.comment.render()
+            return u" %s" % self.comment._adopt(self).render()
         else:
             return u""
 
 
 class Statement(BaseObject):
     """Base classe for procmail's statements"""
-    id = None
 
-    is_first = False
-    is_last = False
+    # _index and _recipe_index are the position of the statement in its parent and its
+    # position among the recipes of its parent (starting at 1). They are maintained by
+    # the parent, see `StatementList`
+    __slots__ = ("parent", "_index", "_recipe_index", "_owner", "_rendered", "_structured")
+
+    def __init__(self):
+        self.parent = None
+        self._index = None
+        self._recipe_index = None
 
-    parent = None
+    def _container(self):
+        if self.parent is not None:
+            return self.parent
+        # a comment on the line of a header, a condition or an action
+        return getattr(self, "_owner", None)
+
+    def _position(self):
+        """Return the parent of the statement after updating the statement position"""
+        if self.parent is not None:
+            self.parent._update_positions()
+        return self.parent
+
+    @property
+    def id(self):
+        parent = self._position()
+        if parent is not None:
+            return parent._child_id(self._index)
+
+    @property
+    def is_first(self):
+        return self._position() is not None and self._index == 0
+
+    @property
+    def is_last(self):
+        parent = self._position()
+        return parent is not None and self._index == len(parent._statements()) - 1
 
     def delete(self):
         """Remove the statement from a ProcmailRC structure, raise a
@@ -76,14 +225,10 @@ class Statement(BaseObject):
                 "Current statement has no parent, so it cannot "
                 + "be deleted form a procmailrc structure"
             )
-        elif self.id is None:
-            raise RuntimeError("id not set but have a parent, this should not be happening")
         else:
-            parent_id = self.parent.id
-            index = int(self.id.split('.')[-1])
-            self.parent.pop(index)
-            self.parent = None
-            self.id = None
+            parent = self._position()
+            parent_id = parent.id
+            parent.pop(self._index)
             return parent_id
 
     def is_statement(self):
@@ -105,8 +250,13 @@ class Statement(BaseObject):
 class Comment(Statement):
     """Older versions are a bit picky about where they accept comments and whitespace.
     Never put a comment on the same line as a regular expression."""
+    __slots__ = ("_str",)
+
+    str = _rendered_attribute("str")
+
     def __init__(self, str):
-        self.str = str
+        super(Comment, self).__init__()
+        self._str = str
 
     def __eq__(self, y):
         if isinstance(y, Comment):
@@ -117,7 +267,10 @@ class Comment(Statement):
                     return True
         return False
 
-    def render(self, ident=0):
+    def _structure_key(self):
+        return (Comment, self.str)
+
+    def _render(self, ident=0):
         return u"%s# %s" % ("    " * ident, self.str)
 
     def is_comment(self):
@@ -132,18 +285,23 @@ class Comment(Statement):
 
 class Assignment(Statement, Commentable, MetaCommentable):
     """Variable names are customarily upper case."""
+    __slots__ = ("_variables", "_comment", "_meta_title", "_meta_comment", "_meta_custom")
+
+    variables = _rendered_attribute("variables")
+
     def __init__(
         self, variables=None, comment=None, meta_title=None,
         meta_comment=None, meta_custom=None
     ):
+        super(Assignment, self).__init__()
         if variables is None:
-            self.variables = []
+            self._variables = []
         else:
-            self.variables = variables  # list of (variable_name, variable_value, quote)
-        self.comment = comment
-        self.meta_comment = meta_comment
-        self.meta_title = meta_title
-        self.meta_custom = meta_custom
+            self._variables = variables  # list of (variable_name, variable_value, quote)
+        self._comment = comment
+        self._meta_comment = meta_comment
+        self._meta_title = meta_title
+        self._meta_custom = meta_custom
 
     def __eq__(self, y):
         if isinstance(y, Assignment):
@@ -154,7 +312,16 @@ class Assignment(Statement, Commentable, MetaCommentable):
                     return True
         return False
 
-    def render(self, ident=0):
+    def _snapshot(self, ident):
+        return tuple(self.variables)
+
+    def _children(self):
+        return self._snapshot(0)
+
+    def _structure_key(self):
+        return (Assignment, tuple(self.variables))
+
+    def _render(self, ident=0):
         variables = []
         for name, value, quote in self.variables:
             if value:
@@ -188,15 +355,22 @@ class Assignment(Statement, Commentable, MetaCommentable):
 
 class Header(BaseObject, Commentable):
     """First line of a procmail recipe"""
+    __slots__ = (
+        "_flag", "_number", "_lockfile", "_comment", "_owner", "_rendered", "_structured"
+    )
+
+    number = _rendered_attribute("number")
+    lockfile = _rendered_attribute("lockfile")
+
     def __init__(self, number='0', flag="", lockfile=None, comment=None):
         if 'H' not in flag and 'B' not in flag:
             flag += 'H'
         if 'h' not in flag and 'b' not in flag:
             flag += 'hb'
         self._flag = flag
-        self.number = number
-        self.lockfile = lockfile
-        self.comment = comment
+        self._number = number
+        self._lockfile = lockfile
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Header):
@@ -208,6 +382,9 @@ class Header(BaseObject, Commentable):
                 return flag1 == flag2
         return False
 
+    def _structure_key(self):
+        return (Header, self.number, self.lockfile, tuple(sorted(self.flag)))
+
     def is_header(self):
         return True
 
@@ -226,7 +403,7 @@ class Header(BaseObject, Commentable):
                 flag = flag.replace(letter, '')
         return flag
 
-    def render(self, ident=0):
+    def _render(self, ident=0):
         if self.lockfile:
             if self.lockfile is True:
                 lockfile = ":"
@@ -246,6 +423,9 @@ class Header(BaseObject, Commentable):
             self._flag += letter
         elif not value and letter in self._flag:
             self._flag = self._flag.replace(letter, "")
+        else:
+            return
+        self._changed()
 
     @property
     def H(self):
@@ -401,6 +581,7 @@ def register_type(classe):
 
 
 class Typed(object):
+    __slots__ = ()
 
     type = None
 
@@ -413,10 +594,11 @@ class Typed(object):
 
 class Condition(BaseObject, Commentable, Typed):
     """Base class for procmail's conditions"""
+    __slots__ = ("_owner", "_rendered", "_structured")
 
     _types = {}
 
-    def render(self, ident=0):
+    def _render(self, ident=0):
         return u"%s* %s%s" % ("    " * ident, self.pre_render(), self._get_comment())
 
     def is_condition(self):
@@ -454,16 +636,21 @@ class Condition(BaseObject, Commentable, Typed):
 class ConditionEmpty(Condition):
     """The empty condition, always match"""
 
+    __slots__ = ("_comment",)
+
     type = "empty"
 
     def __init__(self, comment=None):
-        self.comment = comment
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Condition):
             return y.type == self.type
         return False
 
+    def _structure_key(self):
+        return (Condition, self.type)
+
     def pre_render(self):
         return u""
 
@@ -475,40 +662,65 @@ class ConditionEmpty(Condition):
 class ConditionShell(Condition):
     """Test exit code of external program"""
 
+    __slots__ = ("_cmd", "_comment")
+
+    cmd = _rendered_attribute("cmd")
+
     type = "shell"
 
     def __init__(self, cmd, comment=None):
-        self.cmd = cmd
-        self.comment = comment
+        self._cmd = cmd
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Condition):
             return y.type == self.type and self.cmd == y.cmd
         return False
 
+    def _structure_key(self):
+        return (Condition, self.type, self.cmd)
+
     def pre_render(self):
         return u"? %s" % self.cmd
 
     def is_shell(self):
         return True
 
+    def matches(self, message, executor=None, variables=None, header=True, body=False,
+                engine=None):
+        """Return True if the command exits with 0 when run by `executor` (see
+        `executors`) with the part of `message` selected by `header` and `body` as input.
+        If an `engine.Engine` is given, the command is run by its executor"""
+        if engine is None:
+            engine = _engine(executor)
+        status, _ = engine.execute(self.cmd, message, variables, header, body)
+        return status == 0
+
 
 @register_type
 class ConditionSize(Condition):
     """Test size of message part"""
 
+    __slots__ = ("_sign", "_size", "_comment")
+
+    sign = _rendered_attribute("sign")
+    size = _rendered_attribute("size")
+
     type = "size"
 
     def __init__(self, sign, size, comment=None):
-        self.sign = sign
-        self.size = size
-        self.comment = comment
+        self._sign = sign
+        self._size = size
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Condition):
             return y.type == self.type and self.sign == y.sign and self.size == y.size
         return False
 
+    def _structure_key(self):
+        return (Condition, self.type, self.sign, self.size)
+
     def pre_render(self):
         return u"%s %s" % (self.sign, self.size)
 
@@ -520,34 +732,57 @@ class ConditionSize(Condition):
 class ConditionRegex(Condition):
     """Tests with regular expressions """
 
+    # _compiled is set by `egrep.compiled`
+    __slots__ = ("_regex", "_comment", "_compiled")
+
+    regex = _rendered_attribute("regex")
+
     type = "regex"
 
     def __init__(self, regex, comment=None):
-        self.regex = regex
-        self.comment = comment
+        self._regex = regex
+        self._comment = comment
+        self._compiled = None
 
     def __eq__(self, y):
         if isinstance(y, Condition):
             return y.type == self.type and self.regex == y.regex
         return False
 
+    def _structure_key(self):
+        return (Condition, self.type, self.regex)
+
     def pre_render(self):
         return u"%s" % self.regex
 
     def is_regex(self):
         return True
 
+    def matches(self, message, case_sensitive=False, header=True, body=False,
+                charset="utf-8"):
+        """Return True if the regular expression matches the part of `message` (a raw
+        message or a `messageview.MessageView`) selected by `header` and `body`, as with
+        the H and B flags"""
+        return messageview.view(message).matches(
+            self, case_sensitive, header, body, charset=charset
+        )
+
 
 @register_type
 class ConditionVariable(Condition):
     """Test the value of `variable` against `condition`"""
 
+    __slots__ = ("_variable", "_condition", "_comment")
+
+    variable = _rendered_attribute("variable")
+    condition = _rendered_attribute("condition")
+
     type = "variable"
 
     def __init__(self, variable, condition, comment=None):
-        self.variable = variable
-        self.condition = condition
-        self.comment = comment
+        self._variable = variable
+        self._condition = condition
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Condition):
@@ -558,12 +793,23 @@ class ConditionVariable(Condition):
             )
         return False
 
+    def _structure_key(self):
+        return (Condition, self.type, self.variable, self.condition._adopt(self)._structure())
+
     def pre_render(self):
-        return u"%s ?? %s" % (self.variable, self.condition.pre_render())
+        return u"%s ?? %s" % (self.variable, self.condition._adopt(self).pre_render())
 
     def is_variable(self):
         return True
 
+    def matches(self, message, variables=None, case_sensitive=False, charset="utf-8"):
+        """Return True if the value of the variable in `variables` (or the part of
+        `message` for H, B and HB) meets the condition, `message` being a raw message or a
+        `messageview.MessageView`"""
+        return messageview.view(message).matches(
+            self, case_sensitive, variables=variables, charset=charset
+        )
+
     def is_nested(self):
         return True
 
@@ -572,19 +818,26 @@ class ConditionVariable(Condition):
 class ConditionNegate(Condition):
     """Negation"""
 
+    __slots__ = ("_condition", "_comment")
+
+    condition = _rendered_attribute("condition")
+
     type = "negate"
 
     def __init__(self, condition, comment=None):
-        self.condition = condition
-        self.comment = comment
+        self._condition = condition
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Condition):
             return y.type == self.type and self.condition == y.condition
         return False
 
+    def _structure_key(self):
+        return (Condition, self.type, self.condition._adopt(self)._structure())
+
     def pre_render(self):
-        return u"! %s" % self.condition.pre_render()
+        return u"! %s" % self.condition._adopt(self).pre_render()
 
     def is_negate(self):
         return True
@@ -607,19 +860,26 @@ class ConditionSubstitute(Condition):
     You can stack multiple $ flags to force multiple substitution passes.
     """
 
+    __slots__ = ("_condition", "_comment")
+
+    condition = _rendered_attribute("condition")
+
     type = "subtitute"
 
     def __init__(self, condition, comment=None):
-        self.condition = condition
-        self.comment = comment
+        self._condition = condition
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Condition):
             return y.type == self.type and self.condition == y.condition
         return False
 
+    def _structure_key(self):
+        return (Condition, self.type, self.condition._adopt(self)._structure())
+
     def pre_render(self):
-        return u"$ %s" % self.condition.pre_render()
+        return u"$ %s" % self.condition._adopt(self).pre_render()
 
     def is_substitute(self):
         return True
@@ -640,13 +900,19 @@ class ConditionScore(Condition):
     if the final score is positive.
     """
 
+    __slots__ = ("_x", "_y", "_condition", "_comment")
+
+    x = _rendered_attribute("x")
+    y = _rendered_attribute("y")
+    condition = _rendered_attribute("condition")
+
     type = "score"
 
     def __init__(self, x, y, condition, comment=None):
-        self.x = x
-        self.y = y
-        self.condition = condition
-        self.comment = comment
+        self._x = x
+        self._y = y
+        self._condition = condition
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Condition):
@@ -658,8 +924,13 @@ class ConditionScore(Condition):
             )
         return False
 
+    def _structure_key(self):
+        return (
+            Condition, self.type, self.x, self.y, self.condition._adopt(self)._structure()
+        )
+
     def pre_render(self):
-        return u"%s ^ %s %s" % (self.x, self.y, self.condition.pre_render())
+        return u"%s ^ %s %s" % (self.x, self.y, self.condition._adopt(self).pre_render())
 
     def is_score(self):
         return True
@@ -670,6 +941,7 @@ class ConditionScore(Condition):
 
 class Action(BaseObject, Typed):
     """Base class for procmail's actions"""
+    __slots__ = ()
 
     _types = {}
 
@@ -693,18 +965,31 @@ class Action(BaseObject, Typed):
 class ActionForward(Action, Commentable):
     """Forward to other address(es)"""
 
+    __slots__ = ("_recipients", "_comment", "_owner", "_rendered", "_structured")
+
+    recipients = _rendered_attribute("recipients")
+
     type = "forward"
 
     def __init__(self, recipients=None, comment=None):
-        self.recipients = [] if recipients is None else recipients
-        self.comment = comment
+        self._recipients = [] if recipients is None else recipients
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Action):
             return y.type == self.type and set(self.recipients) == set(y.recipients)
         return False
 
-    def render(self, ident=0):
+    def _children(self):
+        return self._snapshot(0)
+
+    def _structure_key(self):
+        return (Action, self.type, frozenset(self.recipients))
+
+    def _snapshot(self, ident):
+        return tuple(self.recipients)
+
+    def _render(self, ident=0):
         return u"%s! %s%s" % ("    " * ident, " ".join(self.recipients), self._get_comment())
 
     def is_forward(self):
@@ -714,6 +999,11 @@ class ActionForward(Action, Commentable):
 @register_type
 class ActionShell(Action, Commentable):
 
+    __slots__ = ("_cmd", "_variable", "_comment", "_owner", "_rendered", "_structured")
+
+    cmd = _rendered_attribute("cmd")
+    variable = _rendered_attribute("variable")
+
     type = "shell"
 
     def __init__(self, cmd, variable=None, comment=None):
@@ -724,19 +1014,32 @@ class ActionShell(Action, Commentable):
         The output of the command pipeline can be assigned to a variable.
         This makes the recipe non-delivering.
         """
-        self.cmd = cmd
-        self.variable = variable
-        self.comment = comment
+        self._cmd = cmd
+        self._variable = variable
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Action):
             return y.type == self.type and self.cmd == y.cmd and self.variable == y.variable
         return False
 
+    def _structure_key(self):
+        return (Action, self.type, self.cmd, self.variable)
+
     def is_shell(self):
         return True
 
-    def render(self, ident=0):
+    def execute(self, message, executor=None, variables=None, header=True, body=True,
+                engine=None):
+        """Run the command with `executor` (see `executors`) and the part of `message`
+        selected by `header` and `body` (the h and b flags) as input, return its
+        (exit_status, output). If an `engine.Engine` is given, the command is run by its
+        executor"""
+        if engine is None:
+            engine = _engine(executor)
+        return engine.execute(self.cmd, message, variables, header, body)
+
+    def _render(self, ident=0):
         if self.variable:
             variable = "%s=" % self.variable
         else:
@@ -760,21 +1063,28 @@ class ActionSave(Action, Commentable):
         the rest will be hard links.
     """
 
+    __slots__ = ("_path", "_comment", "_owner", "_rendered", "_structured")
+
+    path = _rendered_attribute("path")
+
     type = "save"
 
     def __init__(self, path, comment=None):
-        self.path = path
-        self.comment = comment
+        self._path = path
+        self._comment = comment
 
     def __eq__(self, y):
         if isinstance(y, Action):
             return y.type == self.type and self.path == y.path
         return False
 
+    def _structure_key(self):
+        return (Action, self.type, self.path)
+
     def is_save(self):
         return True
 
-    def render(self, ident=0):
+    def _render(self, ident=0):
         return u"%s%s%s" % ("    " * ident, self.path, self._get_comment())
 
 
@@ -786,6 +1096,10 @@ class ActionNested(Action, list):
     The stuff between the braces can be any valid Procmail construct
     """
 
+    # the rendering is checked against the renderings of the statements, which have the
+    # recipe as owner
+    __slots__ = ("_rendered",)
+
     type = "nested"
 
     def __eq__(self, y):
@@ -793,16 +1107,117 @@ class ActionNested(Action, list):
             return y.type == self.type and super(ActionNested, self).__eq__(y)
         return False
 
-    def render(self, ident=0):
+    def _structure(self):
+        # not cached: the structure of the block is cached by its recipe
+        return self._structure_key()
+
+    def _structure_key(self):
+        return (Action, self.type) + tuple(stmt._structure() for stmt in self)
+
+    def _adopt(self, owner):
+        # the statements of the block have the recipe as parent
+        return self
+
+    def _snapshot(self, ident):
+        # taken after rendering, when the renderings of the statements are valid
+        return tuple(stmt._rendered for stmt in self)
+
+    def _valid(self, ident, snapshot):
+        if len(snapshot) != len(self):
+            return False
+        for stmt, rendered in zip(self, snapshot):
+            if stmt._fresh(ident + 1) is not rendered:
+                return False
+        return True
+
+    def _render(self, ident=0):
         return u"%s{\n%s\n%s}\n" % (
             "    " * ident, "\n".join(s.render(ident+1) for s in self), "    " * ident
         )
 
+    def _render_to(self, write, ident=0):
+        write(u"%s{\n" % ("    " * ident))
+        for i, stmt in enumerate(self):
+            if i:
+                write(u"\n")
+            stmt._render_to(write, ident + 1)
+        write(u"\n%s}\n" % ("    " * ident))
+
     def is_nested(self):
         return True
 
 
-class Recipe(Statement, MetaCommentable):
+class StatementList(object):
+    """Mixin class for objects holding a list of statements. The positions of the
+    statements are updated lazily: a mutation only flags them as stale, except for
+    appending which number the new statements in place"""
+
+    # Subclasses have the _stale attribute, True if the positions of the statements
+    # must be recomputed before use, and the _recipe_count attribute, the number of
+    # recipes among the statements when not stale. They define _statements(), returning
+    # the underlying list of statements, _child_id(index) and
+    # _child_recipe_id(recipe_index), returning the id and the recipe id of a statement
+    # from its positions, and _modified(appended=None), called after each mutation of the
+    # list, `appended` being the list of statements added at the end of the list if it is
+    # the only change
+    __slots__ = ()
+
+    def _update_positions(self):
+        if self._stale:
+            j = 0
+            for i, stmt in enumerate(self._statements()):
+                stmt.parent = self
+                stmt._index = i
+                if stmt.is_recipe():
+                    j += 1
+                    stmt._recipe_index = j
+            self._recipe_count = j
+            self._stale = False
+
+    def _index_of(self, item):
+        """The index of the statement `item` in the list. Statements are compared by
+        identity, equal statements being distinct nodes"""
+        if item.parent is self:
+            self._update_positions()
+            stmts = self._statements()
+            if item._index < len(stmts) and stmts[item._index] is item:
+                return item._index
+        for i, stmt in enumerate(self._statements()):
+            if stmt is item:
+                return i
+        raise ValueError("%r is not in the list" % item)
+
+    def _added(self, items):
+        """Take ownership of the statements `items` added anywhere in the list"""
+        for item in items:
+            item.parent = self
+        self._stale = True
+        self._modified()
+
+    def _appended(self, items):
+        """Take ownership of the statements `items` added at the end of the list"""
+        index = len(self._statements()) - len(items)
+        for item in items:
+            item.parent = self
+            item._index = index
+            if item.is_recipe():
+                self._recipe_count += 1
+                item._recipe_index = self._recipe_count
+            index += 1
+        self._modified(items)
+
+    def _removed(self, item):
+        """Release the statement `item` removed from the list"""
+        item.parent = None
+        self._stale = True
+        self._modified()
+
+    def _reordered(self):
+        self._stale = True
+        self._modified()
+
+
+class Recipe(Statement, MetaCommentable, StatementList):
     """
     Recipes consist of three parts:
 
@@ -811,21 +1226,32 @@ class Recipe(Statement, MetaCommentable):
     An action instance of `Action` (use subclasses)
     """
 
-    _recipe_id = None
+    __slots__ = (
+        "_header", "_action", "_conditions", "_meta_title", "_meta_comment", "_meta_custom",
+        "_comment_condition", "_comment_action", "_stale", "_recipe_count"
+    )
+
+    header = _rendered_attribute("header")
+    conditions = _rendered_attribute("conditions")
+    comment_condition = _rendered_attribute("comment_condition")
+    comment_action = _rendered_attribute("comment_action")
 
     def __init__(
         self, header, action, conditions=None, meta_title=None,
         meta_comment=None, comment_condition=None, comment_action=None,
         meta_custom=None
     ):
-        self.header = header
+        super(Recipe, self).__init__()
+        self._stale = True
+        self._recipe_count = 0
+        self._header = header
         self.action = action
-        self.conditions = [] if conditions is None else conditions
-        self.meta_title = meta_title
-        self.meta_comment = meta_comment
-        self.meta_custom = meta_custom
-        self.comment_condition = comment_condition
-        self.comment_action = comment_action
+        self._conditions = [] if conditions is None else conditions
+        self._meta_title = meta_title
+        self._meta_comment = meta_comment
+        self._meta_custom = meta_custom
+        self._comment_condition = comment_condition
+        self._comment_action = comment_action
 
     def __eq__(self, y):
         if isinstance(y, Recipe):
@@ -840,19 +1266,86 @@ class Recipe(Statement, MetaCommentable):
                     return True
         return False
 
+    def _children(self):
+        # the header, the conditions and the action let the recipe know when they change
+        # (see `_changed`), but the statements of a block may hold lists modified in place
+        if self.action.is_nested():
+            action = tuple(stmt._structure() for stmt in self.action)
+        else:
+            action = self.action._snapshot(0)
+        return (self.header, self.action) + tuple(self.conditions) + (action or ())
+
+    def _structure_key(self):
+        return (
+            Recipe, self.header._adopt(self)._structure(), self.action._adopt(self)._structure()
+        ) + tuple(cond._adopt(self)._structure() for cond in self.conditions)
+
     def is_recipe(self):
         return True
 
+    def matches(self, message, variables=None, executor=None, charset="utf-8", engine=None):
+        """Return True if the conditions of the recipe are met by `message` (a raw message
+        or a `messageview.MessageView`), see `engine.Engine.matches`. `executor` runs the
+        shell conditions, as for `engine.Engine`. If an `engine.Engine` is given, the
+        conditions are evaluated by it, with its executor and charset, and counted in its
+        `stats`"""
+        if engine is None:
+            engine = _engine(executor, charset)
+        return engine.matches(self, message, variables)
+
+    @property
+    def _recipe_id(self):
+        parent = self._position()
+        if parent is not None:
+            return parent._child_recipe_id(self._recipe_index)
+
+    @property
+    def action(self):
+        return self._action
+
+    @action.setter
+    def action(self, action):
+        old = getattr(self, "_action", None)
+        self._action = action
+        if old is not None and old.is_nested():
+            # the statements of the old block are not in the tree anymore
+            for stmt in old:
+                stmt.parent = None
+        if action.is_nested():
+            self._added(action)
+        elif old is not None and old.is_nested():
+            self._stale = True
+            self._modified()
+        else:
+            self._changed()
+
+    def _statements(self):
+        return self.action
+
+    def _child_id(self, index):
+        id = self.id
+        if id is not None:
+            return "%s.%s" % (id, index)
+
+    def _child_recipe_id(self, recipe_index):
+        recipe_id = self._recipe_id
+        if recipe_id is not None:
+            return "%s.%s" % (recipe_id, recipe_index)
+
+    def _modified(self, appended=None):
+        self._changed()
+        if self.parent is not None:
+            self.parent._modified(appended)
+
     def __getitem__(self, index):
         return self.action[index]
 
-    def _set_id(self):
-        set_id(self, self.id + ".", self._recipe_id + ".")
-
     def __setitem__(self, index, value):
         self._test_item(value, "set")
+        old = self.action[index]
         self.action[index] = value
-        self._set_id()
+        old.parent = None
+        self._added([value])
 
     def __len__(self):
         if not self.action.is_nested():
@@ -862,14 +1355,13 @@ class Recipe(Statement, MetaCommentable):
     def append(self, item):
         self._test_item(item, "append")
         self.action.append(item)
-        self._set_id()
+        self._appended([item])
         return item.id
 
     def remove(self, item):
         self._test_item(item, "remove")
-        ret = self.action.remove(item)
-        self._set_id()
-        return ret
+        del self.action[self._index_of(item)]
+        self._removed(item)
 
     def extend(self, stmts):
         stmt_list = list(stmts)
@@ -878,7 +1370,7 @@ class Recipe(Statement, MetaCommentable):
         if not all(isinstance(item, Statement) for item in stmt_list):
             raise ValueError("can only extend with Statement")
         ret = self.action.extend(stmt_list)
-        self._set_id()
+        self._appended(stmt_list)
         return ret
 
     def index(self, item, *args, **kwargs):
@@ -894,28 +1386,28 @@ class Recipe(Statement, MetaCommentable):
     def insert(self, index, item):
         self._test_item(item, "insert")
         self.action.insert(index, item)
-        self._set_id()
+        self._added([item])
         return item.id
 
     def pop(self, *args, **kwargs):
         if not self.action.is_nested():
             raise ValueError("can only pop if action is nested")
         ret = self.action.pop(*args, **kwargs)
-        self._set_id()
+        self._removed(ret)
         return ret
 
     def reverse(self):
         if not self.action.is_nested():
             raise ValueError("can only reverse if action is nested")
         ret = self.action.reverse()
-        self._set_id()
+        self._reordered()
         return ret
 
     def sort(self):
         if not self.action.is_nested():
             raise ValueError("can only sort if action is nested")
         ret = self.action.sort()
-        self._set_id()
+        self._reordered()
         return ret
 
     def _test_item(self, item, action):
@@ -924,46 +1416,146 @@ class Recipe(Statement, MetaCommentable):
         if not isinstance(item, Statement):
             raise ValueError("can only %s Statement" % action)
 
-    def render(self, ident=0):
+    def _snapshot(self, ident):
+        # the conditions, the recipients of a forward and the statements of a block may
+        # be modified in place: the rendering of the action is the same object as long as
+        # it is valid. Taken after rendering, when the rendering of the action is valid
+        return tuple(self.conditions) + (self.action._rendered,)
+
+    def _valid(self, ident, snapshot):
+        return (
+            _same(snapshot[:-1], tuple(self.conditions))
+            and self.action._fresh(ident) is snapshot[-1]
+        )
+
+    def _render_head(self, ident):
+        """The rendering of the recipe up to its action"""
         s = []
         s.append("\n")
         s.append(self._get_meta(ident))
-        s.append(self.header.render(ident))
+        s.append(self.header._adopt(self).render(ident))
         s.append("\n")
         if self.comment_condition:
-            s.append(self.comment_condition.render(ident))
+            s.append(self.comment_condition._adopt(self).render(ident))
             s.append("\n")
         for cond in self.conditions:
-            s.append(cond.render(ident))
+            s.append(cond._adopt(self).render(ident))
             s.append("\n")
         if self.comment_action:
-            s.append(self.comment_action.render(ident))
+            s.append(self.comment_action._adopt(self).render(ident))
             s.append("\n")
-        s.append(self.action.render(ident))
-        s.append("\n")
         return u"".join(s)
 
+    def _render(self, ident=0):
+        return u"%s%s\n" % (self._render_head(ident), self.action._adopt(self).render(ident))
+
+    def _render_to(self, write, ident=0):
+        rendered = self._fresh(ident)
+        if rendered is not None or not self.action.is_nested():
+            write(self.render(ident) if rendered is None else rendered[1])
+            return
+        # everything but the action is small, a nested action is streamed
+        write(self._render_head(ident))
+        self.action._render_to(write, ident)
+        write(u"\n")
+
     def gen_title(self):
         return "Recipe %s" % self._recipe_id
 
 
-class ProcmailRc(list):
+class ProcmailRc(StatementList, list):
     """A list of `Statement` objetcs (use subclasses)"""
 
     id = ""
 
+    _stale = True
+    _recipe_count = 0
+
+    # maps from the statements ids and from the recipes ids to the nodes of the tree,
+    # None if they need to be rebuilt.
+    _ids = None
+    _recipe_ids = None
+
+    # offsets of the top level statements in the text the tree was parsed from, see
+    # `fastparser.Parser`, None if unknown. They are forgotten on any change to the list
+    # of statements.
+    _starts = None
+    _ends = None
+
+    # where the statements, headers, conditions and actions are in the text the tree was
+    # parsed from, a `locations.Locations`, None if unknown. They are forgotten, with the
+    # nodes they keep alive, on any change to the statements but `update`.
+    _locations = None
+
     def __init__(self, *args, **kwargs):
         super(ProcmailRc, self).__init__(*args, **kwargs)
-        self._set_id()
+        self._added(self)
 
-    def _set_id(self):
-        set_id(self)
+    def _statements(self):
+        return self
+
+    def _child_id(self, index):
+        return "%s" % index
+
+    def _child_recipe_id(self, recipe_index):
+        return "%s" % recipe_index
+
+    def _modified(self, appended=None):
+        self._starts = self._ends = None
+        self._locations = None
+        if appended is not None and self._ids is not None:
+            self._index_statements(appended)
+        else:
+            self._ids = None
+            self._recipe_ids = None
+
+    def _splice(self, start, stop, stmts):
+        """Replace the statements from `start` to `stop` by `stmts`"""
+        for stmt in super(ProcmailRc, self).__getslice__(start, stop):
+            stmt.parent = None
+        super(ProcmailRc, self).__setslice__(start, stop, stmts)
+        self._added(stmts)
+
+    def _index_statements(self, stmts):
+        for stmt in stmts:
+            self._ids[stmt.id] = stmt
+            if stmt.is_recipe():
+                self._recipe_ids[stmt._recipe_id] = stmt
+                if stmt.action.is_nested():
+                    self._index_statements(stmt.action)
+
+    def _update_ids(self):
+        if self._ids is None:
+            self._ids = {}
+            self._recipe_ids = {}
+            self._index_statements(self)
+
+    def location(self, node):
+        """Return the `locations.Location` of `node` (a statement, a header, a condition or
+        an action of the tree) in the text the tree was parsed from, None if unknown. The
+        locations are kept up to date by `update` and forgotten when the statements of the
+        tree are changed otherwise"""
+        if self._locations is None:
+            return None
+        return self._locations.get(node)
+
+    def find_recipe(self, recipe_id):
+        """Return the recipe whose `_recipe_id` is `recipe_id` (like "4.2"), raise a
+        KeyError if there is no such recipe"""
+        self._update_ids()
+        return self._recipe_ids[recipe_id]
 
     def __getitem__(self, id):
         if id == "":
             return self
         elif isinstance(id, int):
             return super(ProcmailRc, self).__getitem__(id)
+        self._update_ids()
+        try:
+            return self._ids[id]
+        except KeyError:
+            pass
+        # not a canonical id (like "-1" or "03"), walk the tree
         ids = id.split('.')
         r = self
         try:
@@ -973,25 +1565,56 @@ class ProcmailRc(list):
             raise KeyError(id)
         return r
 
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            stmts = list(value)
+            old = super(ProcmailRc, self).__getitem__(index)
+        else:
+            stmts = [value]
+            old = [super(ProcmailRc, self).__getitem__(index)]
+        if not all(isinstance(item, Statement) for item in stmts):
+            raise ValueError("can only process Statement")
+        super(ProcmailRc, self).__setitem__(index, stmts if isinstance(index, slice) else value)
+        for item in old:
+            item.parent = None
+        self._added(stmts)
+
+    def __setslice__(self, start, stop, stmts):
+        self.__setitem__(slice(start, stop), stmts)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            old = super(ProcmailRc, self).__getitem__(index)
+        else:
+            old = [super(ProcmailRc, self).__getitem__(index)]
+        super(ProcmailRc, self).__delitem__(index)
+        for item in old:
+            self._removed(item)
+
+    def __delslice__(self, start, stop):
+        self.__delitem__(slice(start, stop))
+
+    def __iadd__(self, stmts):
+        self.extend(stmts)
+        return self
+
     def append(self, item):
         if not isinstance(item, Statement):
             raise ValueError("can only process Statement")
         super(ProcmailRc, self).append(item)
-        self._set_id()
+        self._appended([item])
         return item.id
 
     def remove(self, item):
         if not isinstance(item, Statement):
             raise ValueError("can only process Statement")
-        ret = super(ProcmailRc, self).remove(item)
-        self._set_id()
-        return ret
+        del self[self._index_of(item)]
 
     def insert(self, index, item):
         if not isinstance(item, Statement):
             raise ValueError("can only process Statement")
         super(ProcmailRc, self).insert(index, item)
-        self._set_id()
+        self._added([item])
         return item.id
 
     def extend(self, stmts):
@@ -999,38 +1622,112 @@ class ProcmailRc(list):
         if not all(isinstance(item, Statement) for item in stmt_list):
             raise ValueError("can only process Statement")
         ret = super(ProcmailRc, self).extend(stmt_list)
-        self._set_id()
+        self._appended(stmt_list)
         return ret
 
     def pop(self, *args, **kwargs):
         ret = super(ProcmailRc, self).pop(*args, **kwargs)
-        self._set_id()
+        self._removed(ret)
         return ret
 
     def reverse(self):
         ret = super(ProcmailRc, self).reverse()
-        self._set_id()
+        self._reordered()
         return ret
 
     def sort(self):
         ret = super(ProcmailRc, self).sort()
-        self._set_id()
+        self._reordered()
         return ret
 
     def render(self):
         return u"\n".join(s.render() for s in self)
 
-    def write(self, file, charset="utf-8"):
-        data = self.render()
-        # check we can still parse the redered data
-        new_procmailrc = parseString(data)
-        data = data.encode(charset)
-        with open(file + '.new', 'w') as f:
-            f.write(data)
-        os.rename(file + '.new', file)
+    def render_to(self, fileobj, charset="utf-8"):
+        """Write the rendered procmailrc, encoded with `charset`, to the file object
+        `fileobj` while walking the tree: the same bytes as `render().encode(charset)`
+        without building the whole text in memory"""
+        def write(text):
+            fileobj.write(text.encode(charset))
+        for i, stmt in enumerate(self):
+            if i:
+                write(u"\n")
+            stmt._render_to(write)
+
+    def write(self, file, charset="utf-8", validate="full", preserve=False):
+        """Atomically replace `file` by the rendered procmailrc.
+
+        The procmailrc is rendered to a temporary file in the same directory (see
+        `render_to`) and synced to disk. Before renaming it over `file`, the temporary
+        file is parsed back to check it is valid: with the pyparsing grammar if `validate`
+        is "full", with the fast backend if it is "fast", and not at all if it is "none".
+        If `preserve` is True, the mode and ownership of the existing `file` are kept (the
+        ownership only if the process is allowed to give it).
+        Return the procmailrc parsed back from the data, or self if `validate` is "none".
+        """
+        if validate not in ["full", "fast", "none"]:
+            raise ValueError("Unknown validation mode %r" % validate)
+        directory, name = os.path.split(os.path.abspath(file))
+        fd, tmp = _create(directory, name)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self.render_to(f, charset)
+                f.flush()
+                os.fsync(f.fileno())
+            # check we can still parse the rendered data
+            if validate == "none":
+                new_procmailrc = self
+            else:
+                new_procmailrc = parse(
+                    tmp, charset, backend="pyparsing" if validate == "full" else "fast"
+                )
+            if preserve and os.path.exists(file):
+                _copy_mode(file, tmp)
+            os.rename(tmp, file)
+        except:
+            os.remove(tmp)
+            raise
+        _fsync_directory(directory)
         return new_procmailrc
 
 
+def _create(directory, name):
+    """Create a new temporary file for `name` in `directory`, return its file descriptor
+    and its path. Unlike with mkstemp, its mode is the one of any new file (0666 minus the
+    umask)"""
+    while True:
+        path = os.path.join(
+            directory, ".%s.%s.new" % (name, binascii.hexlify(os.urandom(6)))
+        )
+        try:
+            return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), path
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+
+def _copy_mode(src, dst):
+    """Give `dst` the mode and, if allowed, the ownership of `src`"""
+    stat = os.stat(src)
+    os.chmod(dst, stat.st_mode & 0o7777)
+    if (stat.st_uid, stat.st_gid) != (os.getuid(), os.getgid()):
+        try:
+            os.chown(dst, stat.st_uid, stat.st_gid)
+        except OSError as error:
+            # only root can give a file away
+            if error.errno != errno.EPERM:
+                raise
+
+
+def _fsync_directory(directory):
+    """Make a rename in `directory` durable"""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 def _parse_comment(p):
     return Comment(p.comment[0])
 
@@ -1043,6 +1740,7 @@ def _parse_assignements(p):
     meta_title = p.meta_title[0] if p.meta_title else None
     meta_comment = p.meta_comment[0] if p.meta_comment else None
     meta_custom = p.meta_custom[0] if p.meta_custom else None
+    import parser
     variables = []
     for assignment in p.assignements:
         if isinstance(assignment, parser.ParseResults):
@@ -1067,21 +1765,29 @@ def _parse_assignements(p):
     )
 
 
-def _parse_condition(p, comment=None):
+def _parse_nested_condition(p, located):
+    condition = _parse_condition(p, located)
+    located.extend((condition, p[-2], p[-1]))
+    return condition
+
+
+def _parse_condition(p, located, comment=None):
     if p.substitute:
-        return ConditionSubstitute(_parse_condition(p.substitute), comment=comment)
+        return ConditionSubstitute(
+            _parse_nested_condition(p.substitute, located), comment=comment
+        )
     elif p.negate:
-        return ConditionNegate(_parse_condition(p.negate), comment=comment)
+        return ConditionNegate(_parse_nested_condition(p.negate, located), comment=comment)
     elif p.variable:
         return ConditionVariable(
-            p.variable.variable, _parse_condition(p.variable.condition),
+            p.variable.variable, _parse_nested_condition(p.variable.condition, located),
             comment=comment
         )
     elif p.score:
         return ConditionScore(
             p.score.x,
             p.score.y,
-            _parse_condition(p.score.condition),
+            _parse_nested_condition(p.score.condition, located),
             comment=comment
         )
     elif p.regex:
@@ -1094,7 +1800,7 @@ def _parse_condition(p, comment=None):
         return ConditionEmpty(comment=comment)
 
 
-def _parse_recipe(p):
+def _parse_recipe(p, located):
     lockfile = False
     if p.header.lockfile:
         if len(p.header.lockfile) > 1:
@@ -1106,6 +1812,7 @@ def _parse_recipe(p):
     else:
         comment = None
     header = Header(p.header.number, "".join(p.header.flags), lockfile, comment=comment)
+    located.extend((header, p.header[-2], p.header[-1]))
     conditions = []
     if p.conditions:
         for cond in p.conditions:
@@ -1113,13 +1820,14 @@ def _parse_recipe(p):
                 comment = Comment(cond.comment_line[0])
             else:
                 comment = None
-            conditions.append(_parse_condition(cond, comment=comment))
+            conditions.append(_parse_condition(cond, located, comment=comment))
+            located.extend((conditions[-1], cond[-2], cond[-1]))
     if p.action.comment_line:
         comment = Comment(p.action.comment_line[0])
     else:
         comment = None
     if p.action.statements or p.action.statements is not "":
-        action = ActionNested(_parse_statements(p.action.statements))
+        action = ActionNested(_parse_statements(p.action.statements, located))
     elif p.action.forward:
         action = ActionForward(p.action.forward.asList(), comment=comment)
     elif p.action.shell:
@@ -1132,6 +1840,7 @@ def _parse_recipe(p):
         action = ActionSave(p.action.path, comment=comment)
     else:
         raise RuntimeError("Unknown action %r" % p.action)
+    located.extend((action, p.action[-2], p.action[-1]))
     return Recipe(
         header, action, conditions,
         meta_title=p.meta_title[0] if p.meta_title else None,
@@ -1142,24 +1851,9 @@ def _parse_recipe(p):
     )
 
 
-def set_id(stmts, prefix="", prefix2=""):
-    i = 0
-    j = 1
-    for stmt in stmts:
-        stmt.id = "%s%s" % (prefix, i)
-        stmt.parent = stmts
-        if stmt.is_recipe():
-            stmt._recipe_id = "%s%s" % (prefix2, j)
-            j += 1
-        if stmt.is_recipe() and stmt.action.is_nested():
-            set_id(stmt, stmt.id + ".", stmt._recipe_id + ".")
-        i += 1
-    if stmts:
-        stmts[0].is_first = True
-        stmts[-1].is_last = True
-
-
-def _parse_statements(p):
+def _parse_statements(p, located):
+    """Return the list of the statements of `p`, appending them and the nodes they contain
+    to `located` with their offsets"""
     stmt = []
     for s in p:
         if s.assignements:
@@ -1167,15 +1861,200 @@ def _parse_statements(p):
         elif s.comment:
             stmt.append(_parse_comment(s))
         elif s.header:
-            stmt.append(_parse_recipe(s))
+            stmt.append(_parse_recipe(s, located))
+        else:
+            continue
+        located.extend((stmt[-1], s[-2], s[-1]))
     return stmt
 
 
-def parse(file, charset="utf-8"):
-    p = parser.parse(file, charset)
-    return ProcmailRc(_parse_statements(p))
+def _check_backend(backend):
+    if backend not in ["pyparsing", "fast"]:
+        raise ValueError("Unknown parser backend %r" % backend)
+
+
+def parse(file, charset="utf-8", backend="pyparsing"):
+    """Parse the procmailrc `file`. `backend` may be "pyparsing" (the default) or "fast",
+    a hand written linear time parser building the same AST"""
+    _check_backend(backend)
+    with open(file, 'r') as f:
+        return parseString(f.read().decode(charset), backend)
 
 
-def parseString(string):
+def iterparse(file, charset="utf-8"):
+    """Yield the top level statements of the procmailrc `file` (a path or a file object)
+    one at a time, without keeping the whole file in memory. The statements are parsed
+    with the "fast" backend and are not attached to a `ProcmailRc`"""
+    if isinstance(file, basestring):
+        with open(file, 'r') as f:
+            for stmt in fastparser.iterparse(f, charset):
+                yield stmt
+    else:
+        for stmt in fastparser.iterparse(file, charset):
+            yield stmt
+
+
+def parseString(string, backend="pyparsing"):
+    _check_backend(backend)
+    if backend == "fast":
+        return _parse_fast(string)
+    import parser
     p = parser.parseString(string)
-    return ProcmailRc(_parse_statements(p))
+    located = []
+    procmailrc = ProcmailRc(_parse_statements(p, located))
+    procmailrc._locations = locations.Locations(string.expandtabs(), located)
+    return procmailrc
+
+
+def _parse_fast(text):
+    """Parse `text` with the fast backend, keeping the offsets of the statements"""
+    p = fastparser.Parser(text)
+    procmailrc = ProcmailRc(p.parse())
+    procmailrc._starts, procmailrc._ends = p.starts, p.ends
+    procmailrc._locations = locations.Locations(p.text, p.located)
+    return procmailrc
+
+
+def _common_prefix(text1, text2, block=4096):
+    """Return the length of the longest common prefix of `text1` and `text2`"""
+    length = min(len(text1), len(text2))
+    i = 0
+    # compare whole blocks first, then the chars of the first differing block
+    while i < length and text1[i:i + block] == text2[i:i + block]:
+        i += block
+    i = min(i, length)
+    while i < length and text1[i] == text2[i]:
+        i += 1
+    return i
+
+
+def _common_suffix(text1, text2, limit, block=4096):
+    """Return the length, at most `limit`, of the longest common suffix of `text1` and
+    `text2`"""
+    end1, end2 = len(text1), len(text2)
+    i = 0
+    while i + block <= limit and (
+        text1[end1 - i - block:end1 - i] == text2[end2 - i - block:end2 - i]
+    ):
+        i += block
+    while i < limit and text1[end1 - i - 1] == text2[end2 - i - 1]:
+        i += 1
+    return i
+
+
+def update(procmailrc, old_text, new_text):
+    """Update `procmailrc`, parsed from `old_text`, to be the procmailrc of `new_text`.
+
+    Only the top level statements around the edited part of the text are parsed again, up
+    to the first statement after the edit starting where one started in `old_text`. They
+    replace the old statements in `procmailrc`, the other statements (and the statements
+    parsed again but left unchanged) are kept as they are. The offsets of the statements
+    in `old_text` are those kept by the fast backend, they are computed again from
+    `old_text` if `procmailrc` was not parsed with the fast backend or if its list of
+    statements changed since. Raise a ParseException, leaving `procmailrc` untouched, if
+    `new_text` cannot be parsed. Return an (index, removed, added) tuple: the position in
+    `procmailrc` of the replaced statements, the list of the statements removed and the
+    list of the statements added.
+    """
+    old_text = old_text.expandtabs()
+    new_text = new_text.expandtabs()
+    if procmailrc._starts is None:
+        p = fastparser.Parser(old_text)
+        if len(p.parse()) != len(procmailrc):
+            raise ValueError("The procmailrc was not parsed from old_text")
+        procmailrc._starts, procmailrc._ends = p.starts, p.ends
+    starts, ends = procmailrc._starts, procmailrc._ends
+    prefix = _common_prefix(old_text, new_text)
+    if prefix == len(old_text) == len(new_text):
+        return len(procmailrc), [], []
+    suffix = _common_suffix(
+        old_text, new_text, min(len(old_text), len(new_text)) - prefix
+    )
+    delta = len(new_text) - len(old_text)
+
+    # the statement before the one containing the edit is parsed again: the edited text may
+    # be merged into it (its trailing blank lines or comments)
+    index = max(bisect.bisect_right(starts, prefix) - 2, 0)
+    pos = starts[index] if index < len(starts) and starts[index] < prefix else 0
+    stop = len(starts)
+    stmts = []
+    new_starts, new_ends = [], []
+    p = fastparser.Parser(new_text)
+    for stmt, start, end in p.top_level(pos):
+        if stmt is not None:
+            stmts.append(stmt)
+            new_starts.append(start)
+            new_ends.append(end)
+        # from a position in the common suffix, the text is parsed as it was: stop on the
+        # start of an old statement
+        if end >= len(new_text) - suffix:
+            i = bisect.bisect_left(starts, end - delta, index)
+            if i < len(starts) and starts[i] == end - delta:
+                stop = i
+                break
+
+    locations = procmailrc._locations
+    if locations is not None:
+        located_ends = p.located[2::3]
+
+    def same_locations(new, old, shift):
+        # are the nodes of the statements (the statements included) at the same offsets
+        first = bisect.bisect_right(located_ends, new_starts[new])
+        last = bisect.bisect_right(located_ends, new_ends[new])
+        old_first = bisect.bisect_right(locations.ends, starts[old])
+        old_last = bisect.bisect_right(locations.ends, ends[old])
+        if last - first != old_last - old_first:
+            return False
+        for i, j in zip(xrange(first, last), xrange(old_first, old_last)):
+            if (
+                (p.located[3 * i + 1], located_ends[i])
+                != (locations.starts[j] + shift, locations.ends[j] + shift)
+            ):
+                return False
+        return True
+
+    # keep the old statements parsed again into the same statements at the same offsets
+    def same(new, old, shift):
+        return (
+            (new_starts[new], new_ends[new]) == (starts[old] + shift, ends[old] + shift)
+            and stmts[new].render() == procmailrc[old].render()
+            and (locations is None or same_locations(new, old, shift))
+        )
+    first, last = 0, len(stmts)
+    while first < last and index + first < stop and same(first, index + first, 0):
+        first += 1
+    while (
+        last > first and stop - (len(stmts) - last) > index + first
+        and same(last - 1, stop - (len(stmts) - last) - 1, delta)
+    ):
+        last -= 1
+    stop -= len(stmts) - last
+    index += first
+    if locations is not None:
+        # the nodes in the text of the replaced statements, in old_text and in new_text
+        if index < stop:
+            old_start, old_stop = starts[index], ends[stop - 1]
+        else:
+            old_start = old_stop = starts[index] if index < len(starts) else len(old_text)
+        located = []
+        if first < last:
+            new_start, new_stop = new_starts[first], new_ends[last - 1]
+            for i in xrange(0, len(p.located), 3):
+                if new_start < p.located[i + 2] <= new_stop:
+                    located.extend(p.located[i:i + 3])
+        locations.splice(
+            old_start, old_stop, located, new_text, prefix, len(old_text) - suffix, delta
+        )
+    stmts = stmts[first:last]
+    removed = procmailrc[index:stop]
+    procmailrc._splice(index, stop, stmts)
+    procmailrc._locations = locations
+
+    # the offsets after the edit are shifted
+    starts[index:stop] = array.array(starts.typecode, new_starts[first:last])
+    ends[index:stop] = array.array(ends.typecode, new_ends[first:last])
+    for i in xrange(index + len(stmts), len(starts)):
+        starts[i] += delta
+        ends[i] += delta
+    procmailrc._starts, procmailrc._ends = starts, ends
+    return index, removed, stmts
@@ -0,0 +1,269 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import gc
+import json
+import zlib
+
+import procmail
+
+# A serialized ProcmailRc is MAGIC, the VERSION byte, then the zlib compressed JSON
+# dump of the tree where each node is an array starting with its code below followed by
+# its attributes. JSON does not depend on the python version and decoding it only builds
+# lists, strings, numbers, booleans and None: every field is checked before building the
+# nodes, so data from other services can be loaded.
+# Comment objects (node comments, comment_condition, comment_action) are stored as
+# their text. A new VERSION must be used for any change of the layout.
+MAGIC = b"PPMRC"
+VERSION = 2
+
+_COMMENT = 0
+_ASSIGNMENT = 1
+_RECIPE = 2
+
+_CONDITION_EMPTY = 0
+_CONDITION_SHELL = 1
+_CONDITION_SIZE = 2
+_CONDITION_REGEX = 3
+_CONDITION_VARIABLE = 4
+_CONDITION_NEGATE = 5
+_CONDITION_SUBSTITUTE = 6
+_CONDITION_SCORE = 7
+
+_ACTION_FORWARD = 0
+_ACTION_SHELL = 1
+_ACTION_SAVE = 2
+_ACTION_NESTED = 3
+
+
+def _text(comment):
+    return None if comment is None else comment.str
+
+
+def _dump_statements(stmts):
+    return tuple(_dump_statement(stmt) for stmt in stmts)
+
+
+def _dump_statement(stmt):
+    if stmt.is_comment():
+        return (_COMMENT, stmt.str)
+    elif stmt.is_assignment():
+        return (
+            _ASSIGNMENT, tuple(stmt.variables), _text(stmt.comment),
+            stmt.meta_title, stmt.meta_comment, stmt.meta_custom
+        )
+    elif stmt.is_recipe():
+        header = stmt.header
+        return (
+            _RECIPE,
+            (header.number, header._flag, header.lockfile, _text(header.comment)),
+            tuple(_dump_condition(cond) for cond in stmt.conditions),
+            _dump_action(stmt.action),
+            stmt.meta_title, stmt.meta_comment, stmt.meta_custom,
+            _text(stmt.comment_condition), _text(stmt.comment_action)
+        )
+    raise ValueError("Unknown statement %r" % stmt)
+
+
+def _dump_condition(cond):
+    comment = _text(cond.comment)
+    if cond.is_empty():
+        return (_CONDITION_EMPTY, comment)
+    elif cond.is_shell():
+        return (_CONDITION_SHELL, comment, cond.cmd)
+    elif cond.is_size():
+        return (_CONDITION_SIZE, comment, cond.sign, cond.size)
+    elif cond.is_regex():
+        return (_CONDITION_REGEX, comment, cond.regex)
+    elif cond.is_variable():
+        return (_CONDITION_VARIABLE, comment, cond.variable, _dump_condition(cond.condition))
+    elif cond.is_negate():
+        return (_CONDITION_NEGATE, comment, _dump_condition(cond.condition))
+    elif cond.is_substitute():
+        return (_CONDITION_SUBSTITUTE, comment, _dump_condition(cond.condition))
+    elif cond.is_score():
+        return (_CONDITION_SCORE, comment, cond.x, cond.y, _dump_condition(cond.condition))
+    raise ValueError("Unknown condition %r" % cond)
+
+
+def _dump_action(action):
+    if action.is_nested():
+        return (_ACTION_NESTED, _dump_statements(action))
+    elif action.is_forward():
+        return (_ACTION_FORWARD, _text(action.comment), tuple(action.recipients))
+    elif action.is_shell():
+        return (_ACTION_SHELL, _text(action.comment), action.cmd, action.variable)
+    elif action.is_save():
+        return (_ACTION_SAVE, _text(action.comment), action.path)
+    raise ValueError("Unknown action %r" % action)
+
+
+def _invalid(what, value):
+    return ValueError("Invalid serialized procmailrc: bad %s %r" % (what, value))
+
+
+def _string(value, what, optional=False):
+    if value.__class__ is unicode or isinstance(value, basestring):
+        return value
+    if optional and value is None:
+        return value
+    raise _invalid(what, value)
+
+
+def _array(value, what, length=None):
+    if not isinstance(value, list) or (length is not None and len(value) != length):
+        raise _invalid(what, value)
+    return value
+
+
+def _node(value, what, lengths):
+    """Check `value` is an array starting with a node code and having the number of
+    fields given for this code in the dict `lengths`"""
+    if (
+        not isinstance(value, list) or not value
+        or lengths.get(value[0] if type(value[0]) is int else None) != len(value)
+    ):
+        raise _invalid(what, value)
+    return value[0]
+
+
+def _comment(text):
+    if text is None:
+        return None
+    return procmail.Comment(_string(text, "comment"))
+
+
+_STATEMENT_LENGTHS = {_COMMENT: 2, _ASSIGNMENT: 6, _RECIPE: 9}
+
+
+def _load_statements(data):
+    return [_load_statement(stmt) for stmt in _array(data, "statements")]
+
+
+def _load_statement(data):
+    code = _node(data, "statement", _STATEMENT_LENGTHS)
+    if code == _RECIPE:
+        number, flag, lockfile, comment = _array(data[1], "header", 4)
+        if not isinstance(lockfile, bool):
+            _string(lockfile, "lockfile", True)
+        header = procmail.Header(
+            _string(number, "number"), _string(flag, "flag"), lockfile, _comment(comment)
+        )
+        return procmail.Recipe(
+            header,
+            _load_action(data[3]),
+            [_load_condition(cond) for cond in _array(data[2], "conditions")],
+            meta_title=_string(data[4], "meta title", True),
+            meta_comment=_string(data[5], "meta comment", True),
+            meta_custom=_string(data[6], "meta custom", True),
+            comment_condition=_comment(data[7]),
+            comment_action=_comment(data[8]),
+        )
+    elif code == _ASSIGNMENT:
+        variables = []
+        for variable in _array(data[1], "variables"):
+            name, value, quote = _array(variable, "variable", 3)
+            variables.append((
+                _string(name, "variable name"), _string(value, "variable value", True),
+                _string(quote, "quote", True)
+            ))
+        return procmail.Assignment(
+            variables, _comment(data[2]),
+            meta_title=_string(data[3], "meta title", True),
+            meta_comment=_string(data[4], "meta comment", True),
+            meta_custom=_string(data[5], "meta custom", True),
+        )
+    return procmail.Comment(_string(data[1], "comment"))
+
+
+_CONDITION_LENGTHS = {
+    _CONDITION_EMPTY: 2, _CONDITION_SHELL: 3, _CONDITION_SIZE: 4, _CONDITION_REGEX: 3,
+    _CONDITION_VARIABLE: 4, _CONDITION_NEGATE: 3, _CONDITION_SUBSTITUTE: 3,
+    _CONDITION_SCORE: 5,
+}
+
+
+def _load_condition(data):
+    code = _node(data, "condition", _CONDITION_LENGTHS)
+    comment = _comment(data[1])
+    if code == _CONDITION_REGEX:
+        return procmail.ConditionRegex(_string(data[2], "regex"), comment)
+    elif code == _CONDITION_NEGATE:
+        return procmail.ConditionNegate(_load_condition(data[2]), comment)
+    elif code == _CONDITION_SIZE:
+        return procmail.ConditionSize(
+            _string(data[2], "sign"), _string(data[3], "size"), comment
+        )
+    elif code == _CONDITION_SHELL:
+        return procmail.ConditionShell(_string(data[2], "command"), comment)
+    elif code == _CONDITION_VARIABLE:
+        return procmail.ConditionVariable(
+            _string(data[2], "variable"), _load_condition(data[3]), comment
+        )
+    elif code == _CONDITION_SUBSTITUTE:
+        return procmail.ConditionSubstitute(_load_condition(data[2]), comment)
+    elif code == _CONDITION_SCORE:
+        return procmail.ConditionScore(
+            _string(data[2], "weight"), _string(data[3], "exponent"),
+            _load_condition(data[4]), comment
+        )
+    return procmail.ConditionEmpty(comment)
+
+
+_ACTION_LENGTHS = {_ACTION_FORWARD: 3, _ACTION_SHELL: 4, _ACTION_SAVE: 3, _ACTION_NESTED: 2}
+
+
+def _load_action(data):
+    code = _node(data, "action", _ACTION_LENGTHS)
+    if code == _ACTION_NESTED:
+        return procmail.ActionNested(_load_statements(data[1]))
+    comment = _comment(data[1])
+    if code == _ACTION_SAVE:
+        return procmail.ActionSave(_string(data[2], "path"), comment)
+    elif code == _ACTION_FORWARD:
+        return procmail.ActionForward(
+            [_string(recipient, "recipient") for recipient in _array(data[2], "recipients")],
+            comment
+        )
+    return procmail.ActionShell(
+        _string(data[2], "command"), _string(data[3], "variable", True), comment
+    )
+
+
+def dumps(procmailrc):
+    """Serialize the `procmailrc` tree (a `ProcmailRc` or a list of statements) to a
+    byte string"""
+    return MAGIC + chr(VERSION) + zlib.compress(
+        json.dumps(_dump_statements(procmailrc), separators=(",", ":")), 1
+    )
+
+
+def loads(data):
+    """Return the `ProcmailRc` serialized by `dumps` in `data`, raise a ValueError if
+    `data` is not a serialized tree or uses an unsupported version"""
+    if len(data) <= len(MAGIC) or not data.startswith(MAGIC):
+        raise ValueError("Not a serialized procmailrc")
+    version = ord(data[len(MAGIC)])
+    if version != VERSION:
+        raise ValueError("Unsupported serialization version %s" % version)
+    try:
+        tree = json.loads(zlib.decompress(data[len(MAGIC) + 1:]))
+    except zlib.error as error:
+        raise ValueError("Invalid serialized procmailrc: %s" % error)
+    # the collector would be triggered many times while allocating the nodes without
+    # ever finding anything to free
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return procmail.ProcmailRc(_load_statements(tree))
+    finally:
+        if enabled:
+            gc.enable()
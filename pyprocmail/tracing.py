@@ -0,0 +1,152 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import time
+
+# A trace of evaluations, given to `engine.Engine.evaluate`. Nothing is measured when no
+# trace is given.
+
+
+def _name(key):
+    """The name of the recipe (rcfile, recipe_id) in the reports"""
+    rcfile, recipe_id = key
+    if rcfile is None:
+        return "%s" % recipe_id
+    return "%s:%s" % (rcfile, recipe_id)
+
+
+class Event(object):
+    """The evaluation of a recipe (`position` is None) or of its condition at `position`
+    in its conditions: whether it `matched`, the `score` added by a weighted condition and
+    the wall time spent in `seconds`. `reason` is set when the recipe was not evaluated
+    ("prefilter" if skipped by the prefilter index, "flags" if its A, a, E or e flags
+    prevented it). `rcfile` is the path of the rcfile of the recipe, None for the
+    procmailrc of the engine (see `engine.Delivery`)"""
+    __slots__ = ("recipe_id", "position", "condition", "matched", "score", "seconds",
+                 "reason", "rcfile")
+
+    def __init__(self, recipe_id, position, condition, matched, score, seconds,
+                 reason=None, rcfile=None):
+        self.recipe_id = recipe_id
+        self.rcfile = rcfile
+        self.position = position
+        self.condition = condition
+        self.matched = matched
+        self.score = score
+        self.seconds = seconds
+        self.reason = reason
+
+    def __repr__(self):
+        what = "recipe %s" % _name((self.rcfile, self.recipe_id))
+        if self.position is not None:
+            what = "%s condition %d %r" % (what, self.position, self.condition)
+        return "<Event %s %s%s%s %.1fus>" % (
+            what, "matched" if self.matched else "failed",
+            "" if self.score is None else " score %s" % self.score,
+            "" if self.reason is None else " (%s)" % self.reason,
+            self.seconds * 1000000
+        )
+
+
+class Trace(object):
+    """Record the evaluation of the recipes and of their conditions over many messages.
+
+    The events of each message are appended to `messages` (a list of lists of `Event`)
+    if `events` is True, the timings are always aggregated by recipe for `hot_recipes`
+    and `report`. The recipes are identified by their (rcfile, recipe_id), as the recipe
+    ids of each rcfile included or switched to start at 1 again.
+    """
+
+    def __init__(self, events=True):
+        self.events = events
+        self.count = 0
+        self.messages = []
+        # (rcfile, recipe_id) -> [evaluations, matches, seconds]
+        self._recipes = {}
+        # (rcfile, recipe_id, position) -> [condition, evaluations, matches, seconds]
+        self._conditions = {}
+        self._current = None
+
+    clock = staticmethod(time.time)
+
+    def begin(self):
+        """Start the trace of a new message"""
+        self._current = []
+        self.count += 1
+        if self.events:
+            self.messages.append(self._current)
+
+    def recipe(self, recipe, matched, seconds, reason=None, rcfile=None):
+        recipe_id = recipe._recipe_id
+        if self.events:
+            self._current.append(
+                Event(recipe_id, None, None, matched, None, seconds, reason, rcfile)
+            )
+        if reason == "flags":
+            return
+        key = (rcfile, recipe_id)
+        total = self._recipes.get(key)
+        if total is None:
+            total = self._recipes[key] = [0, 0, 0.0]
+        total[0] += 1
+        total[1] += bool(matched)
+        total[2] += seconds
+
+    def condition(self, recipe, cond, matched, seconds, score=None, rcfile=None):
+        recipe_id = recipe._recipe_id
+        position = next(i for i, other in enumerate(recipe.conditions) if other is cond)
+        if self.events:
+            self._current.append(Event(
+                recipe_id, position, cond.pre_render(), matched, score, seconds, None, rcfile
+            ))
+        key = (rcfile, recipe_id, position)
+        total = self._conditions.get(key)
+        if total is None:
+            total = self._conditions[key] = [cond.pre_render(), 0, 0, 0.0]
+        total[1] += 1
+        total[2] += bool(matched)
+        total[3] += seconds
+
+    def hot_recipes(self, top=10):
+        """Return the `top` recipes taking the most time, as a list of ((rcfile, recipe_id),
+        evaluations, matches, seconds, slowest) sorted by decreasing time, `slowest`
+        being the (position, condition, seconds) of the condition of the recipe taking the
+        most time, or None"""
+        slowest = {}
+        for (rcfile, recipe_id, position), (condition, _, _, seconds) in (
+            self._conditions.items()
+        ):
+            key = (rcfile, recipe_id)
+            if key not in slowest or slowest[key][2] < seconds:
+                slowest[key] = (position, condition, seconds)
+        hot = sorted(self._recipes.items(), key=lambda item: item[1][2], reverse=True)
+        return [
+            (key, evaluations, matches, seconds, slowest.get(key))
+            for key, (evaluations, matches, seconds) in hot[:top]
+        ]
+
+    def report(self, top=10):
+        """Return a text report of the `top` recipes taking the most time"""
+        lines = [
+            "%d messages, %d recipes evaluated" % (self.count, len(self._recipes)),
+            "%-12s %8s %8s %12s %10s  %s" % (
+                "recipe", "calls", "matches", "total ms", "mean us", "slowest condition"
+            ),
+        ]
+        for key, evaluations, matches, seconds, slowest in self.hot_recipes(top):
+            lines.append("%-12s %8d %8d %12.3f %10.1f  %s" % (
+                _name(key), evaluations, matches, seconds * 1000,
+                seconds * 1000000 / evaluations,
+                "" if slowest is None else "%d: %s (%.3f ms)" % (
+                    slowest[0], slowest[1], slowest[2] * 1000
+                )
+            ))
+        return "\n".join(lines)
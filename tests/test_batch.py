@@ -0,0 +1,113 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyprocmail
+
+RCFILE = u""":0
+* ^Subject: \\/[a-z]+
+$MATCH
+"""
+
+VARIABLES = {"HOME": "/home/bob", "LOGNAME": "bob"}
+
+
+def message(subject):
+    return b"From: alice@example.com\nSubject: %s\n\nHello Bob\n" % subject
+
+
+MESSAGES = [message(subject) for subject in [b"spam", b"work", b"family"] * 7]
+
+
+def targets(results):
+    return [result.delivery.target for result in results]
+
+
+class EvaluateManyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.procmailrc = pyprocmail.parseString(RCFILE)
+        self.expected = [
+            u"/home/bob/%s" % subject for subject in [u"spam", u"work", u"family"] * 7
+        ]
+
+    def test_in_process(self):
+        results = pyprocmail.evaluate_many(
+            self.procmailrc, MESSAGES, workers=1, variables=VARIABLES
+        )
+        self.assertEqual(targets(results), self.expected)
+
+    def test_workers(self):
+        # more chunks than the workers may have in flight
+        results = pyprocmail.evaluate_many(
+            self.procmailrc, MESSAGES, workers=2, variables=VARIABLES, chunk_size=2,
+            pending=1
+        )
+        self.assertEqual(targets(results), self.expected)
+
+    def test_stop_early(self):
+        results = pyprocmail.evaluate_many(
+            self.procmailrc, iter(MESSAGES), workers=2, variables=VARIABLES, chunk_size=1
+        )
+        self.assertEqual(next(results).delivery.target, u"/home/bob/spam")
+        results.close()
+
+    def test_trace(self):
+        trace = pyprocmail.Trace()
+        results = pyprocmail.evaluate_many(
+            self.procmailrc, MESSAGES, workers=4, variables=VARIABLES, trace=trace
+        )
+        self.assertEqual(targets(results), self.expected)
+        hot = dict((key, evaluations) for key, evaluations, _, _, _ in trace.hot_recipes())
+        self.assertEqual(hot, {(None, "1"): len(MESSAGES)})
+
+
+class MailboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_mbox(self):
+        path = os.path.join(self.directory, "archive.mbox")
+        messages = [
+            b"From alice@example.com Mon Jan  1 00:00:00 2015\n" + MESSAGES[0],
+            # a From at the start of a line of the body, not after a blank line
+            b"From bob@example.com Mon Jan  1 00:00:01 2015\n" + MESSAGES[1] + b"From me\n",
+        ]
+        with open(path, "wb") as f:
+            f.write(b"\n".join(messages) + b"\n")
+        self.assertEqual(list(pyprocmail.read_mailbox(path)), messages)
+
+    def test_maildir(self):
+        for sub in ["new", "cur", "tmp"]:
+            os.mkdir(os.path.join(self.directory, sub))
+        for sub, name, data in [
+            ("cur", "2", MESSAGES[1]), ("new", "1", MESSAGES[0]), ("new", ".hidden", b"x"),
+            ("tmp", "0", b"being delivered"),
+        ]:
+            with open(os.path.join(self.directory, sub, name), "wb") as f:
+                f.write(data)
+        self.assertEqual(list(pyprocmail.read_mailbox(self.directory)), MESSAGES[:2])
+        results = pyprocmail.evaluate_many(
+            pyprocmail.parseString(RCFILE), self.directory, workers=1, variables=VARIABLES
+        )
+        self.assertEqual(targets(results), [u"/home/bob/spam", u"/home/bob/work"])
+
+
+if __name__ == '__main__':
+    unittest.main()
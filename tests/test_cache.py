@@ -0,0 +1,104 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyprocmail
+from pyprocmail import serialize
+from pyprocmail.cache import ParseCache
+
+
+class CountingCache(ParseCache):
+
+    scans = 0
+
+    def _scan(self):
+        self.scans += 1
+        super(CountingCache, self)._scan()
+
+
+def rcfile(i):
+    """A procmailrc of about 1KB once serialized"""
+    words = u" ".join(hashlib.sha1("%d %d" % (i, j)).hexdigest() for j in xrange(40))
+    return u":0\n* ^Subject: %s\nINBOX\n" % words
+
+
+class ParseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def size(self):
+        return sum(
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in os.listdir(self.directory)
+        )
+
+    def test_hits(self):
+        cache = pyprocmail.ParseCache(self.directory, backend="fast")
+        first = cache.parseString(rcfile(0))
+        self.assertEqual(cache.parseString(rcfile(0)).render(), first.render())
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "evictions": 0})
+
+    def test_eviction(self):
+        cache = CountingCache(self.directory, max_size=50000, backend="fast")
+        for i in xrange(200):
+            cache.parseString(rcfile(i))
+            # the first rcfile is the most recently used one
+            cache.parseString(rcfile(0))
+            self.assertLessEqual(self.size(), 50000)
+            self.assertEqual(cache._size, self.size())
+        self.assertGreater(cache.stats()["evictions"], 0)
+        self.assertEqual(cache.stats()["hits"], 200)
+        self.assertLess(cache.scans, 40)
+        cache.parseString(rcfile(0))
+        self.assertEqual(cache.stats()["hits"], 201)
+
+    def removed_while_loading(self, corrupted):
+        """Parse the same rcfile twice, its entry being removed by "another process"
+        while loaded the second time, and return the stats of the cache"""
+        cache = ParseCache(self.directory, backend="fast")
+        cache.parseString(rcfile(0))
+        [name] = os.listdir(self.directory)
+        loads = serialize.loads
+
+        def removing(data):
+            os.remove(os.path.join(self.directory, name))
+            if corrupted:
+                raise ValueError("corrupted")
+            return loads(data)
+        serialize.loads = removing
+        try:
+            self.assertEqual(cache.parseString(rcfile(0)).render(), u"\n" + rcfile(0))
+        finally:
+            serialize.loads = loads
+        self.assertEqual(os.listdir(self.directory), [name])
+        return cache.stats()
+
+    def test_removed_entries(self):
+        self.assertEqual(
+            self.removed_while_loading(True), {"hits": 0, "misses": 2, "evictions": 0}
+        )
+        os.remove(os.path.join(self.directory, os.listdir(self.directory)[0]))
+        self.assertEqual(
+            self.removed_while_loading(False), {"hits": 0, "misses": 2, "evictions": 0}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
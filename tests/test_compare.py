@@ -0,0 +1,135 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import unittest
+
+import pyprocmail
+from pyprocmail import procmail
+
+TEXT = u"""# spam
+SPAMDIR=$HOME/spam
+:0
+* ^Subject:.*viagra
+$SPAMDIR
+
+:0 c
+! archive@example.com
+
+:0
+* ^From:.*boss
+{
+    :0 A
+    * ^Subject:.*urgent
+    urgent
+
+    :0
+    boss
+}
+"""
+
+
+def edits(old, new):
+    """The (op, old_index, new_index) of the edits turning `old` into `new`, with the
+    edits of the modified nodes"""
+    return [
+        (edit.op, edit.old_index, edit.new_index, edits_of(edit))
+        for edit in pyprocmail.diff(old, new)
+    ]
+
+
+def edits_of(edit):
+    return [(e.op, e.old_index, e.new_index, edits_of(e)) for e in edit.edits]
+
+
+class DiffTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.procmailrc = pyprocmail.parseString(TEXT)
+
+    def diff(self, text):
+        return edits(self.procmailrc, pyprocmail.parseString(text))
+
+    def test_same(self):
+        self.assertEqual(self.diff(TEXT), [])
+
+    def test_insert(self):
+        text = TEXT.replace(u":0 c\n", u":0\n* ^To:.*list\nlist\n\n:0 c\n")
+        self.assertEqual(self.diff(text), [("insert", 3, 3, [])])
+
+    def test_remove(self):
+        text = TEXT.replace(u"# spam\n", u"")
+        self.assertEqual(self.diff(text), [("remove", 0, 0, [])])
+
+    def test_modify(self):
+        text = TEXT.replace(u"$SPAMDIR\n", u"/dev/null\n")
+        self.assertEqual(self.diff(text), [("modify", 2, 2, [("modify", None, None, [])])])
+
+    def test_conditions(self):
+        text = TEXT.replace(u"* ^Subject:.*viagra\n", u"* ^Subject:.*cialis\n* > 1000\n")
+        self.assertEqual(
+            self.diff(text), [("modify", 2, 2, [("modify", 0, 0, []), ("insert", 1, 1, [])])]
+        )
+        text = TEXT.replace(u"* ^Subject:.*viagra\n", u"")
+        self.assertEqual(self.diff(text), [("modify", 2, 2, [("remove", 0, 0, [])])])
+
+    def test_header(self):
+        text = TEXT.replace(u":0 c\n", u":0\n")
+        self.assertEqual(self.diff(text), [("modify", 3, 3, [("modify", None, None, [])])])
+
+    def test_nested(self):
+        text = TEXT.replace(u"    boss\n", u"    boss/\n")
+        self.assertEqual(self.diff(text), [
+            ("modify", 4, 4, [("modify", None, None, [("modify", 1, 1, [
+                ("modify", None, None, [])
+            ])])])
+        ])
+        text = TEXT.replace(u"    :0 A\n    * ^Subject:.*urgent\n    urgent\n\n", u"")
+        self.assertEqual(self.diff(text), [
+            ("modify", 4, 4, [("modify", None, None, [("remove", 0, 0, [])])])
+        ])
+
+
+class CachedStructureTestCase(unittest.TestCase):
+    """The structures cached by the nodes are dropped when the nodes change"""
+
+    def setUp(self):
+        self.procmailrc = pyprocmail.parseString(TEXT)
+        self.other = pyprocmail.parseString(TEXT)
+        self.assertEqual(edits(self.procmailrc, self.other), [])
+
+    def test_attribute(self):
+        self.procmailrc[2].conditions[0].regex = u"^Subject:.*cialis"
+        self.assertEqual(
+            edits(self.procmailrc, self.other), [("modify", 2, 2, [("modify", 0, 0, [])])]
+        )
+
+    def test_lists_modified_in_place(self):
+        self.procmailrc[2].conditions.append(procmail.ConditionSize(u">", u"1000"))
+        self.procmailrc[3].action.recipients.append(u"backup@example.com")
+        self.procmailrc[1].variables[0] = (u"SPAMDIR", u"/tmp", None)
+        self.assertEqual(edits(self.other, self.procmailrc), [
+            ("modify", 1, 1, []),
+            ("modify", 2, 2, [("insert", 1, 1, [])]),
+            ("modify", 3, 3, [("modify", None, None, [])]),
+        ])
+
+    def test_nested(self):
+        self.procmailrc[4][1].action.path = u"boss/"
+        self.procmailrc[4][0].header.A = False
+        self.assertEqual(edits(self.procmailrc, self.other), [
+            ("modify", 4, 4, [("modify", None, None, [
+                ("modify", 0, 0, [("modify", None, None, [])]),
+                ("modify", 1, 1, [("modify", None, None, [])]),
+            ])])
+        ])
+        self.procmailrc[4].append(pyprocmail.parseString(u":0\ninbox\n")[0])
+        [(_, _, _, [(_, _, _, block)])] = edits(self.procmailrc, self.other)
+        self.assertEqual(block[-1], ("remove", 2, 2, []))
@@ -0,0 +1,95 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import unittest
+
+import pyprocmail
+from pyprocmail import egrep, prefilter
+
+
+def search(pattern, text, case_sensitive=False):
+    return egrep.compile(pattern, case_sensitive).search(text) is not None
+
+
+class TranslateTestCase(unittest.TestCase):
+
+    def test_anchors(self):
+        self.assertTrue(search(u"^^From", b"From: alice"))
+        self.assertFalse(search(u"^^Subject", b"From: alice\nSubject: hello"))
+        self.assertTrue(search(u"alice^^", b"From: alice"))
+        self.assertTrue(search(u"^Subject", b"From: alice\nSubject: hello"))
+
+    def test_word_boundaries(self):
+        self.assertTrue(search(u"\\<spam\\>", b"Subject: spam"))
+        self.assertTrue(search(u"\\<spam\\>", b"spam!"))
+        self.assertFalse(search(u"\\<spam\\>", b"Subject: spammer"))
+
+    def test_match(self):
+        match = egrep.compile(u"^Subject: \\/[a-z]+").search(b"Subject: hello world")
+        self.assertEqual(match.group(egrep.MATCH), b"hello")
+
+    def test_macros(self):
+        self.assertTrue(search(u"^TO_bob@example\\.com", b"Cc: alice, bob@example.com"))
+        self.assertFalse(search(u"^TO_bob@example\\.com", b"Cc: alice, xbob@example.com"))
+        self.assertTrue(search(u"^FROM_DAEMON", b"From: MAILER-DAEMON@example.com (x)"))
+
+    def test_escapes(self):
+        # \d stands for the letter d, braces are not intervals
+        self.assertTrue(search(u"\\d", b"d"))
+        self.assertFalse(search(u"\\d", b"1"))
+        self.assertTrue(search(u"a{2}", b"a{2}"))
+        self.assertTrue(search(u"a\\.b", b"a.b"))
+        self.assertFalse(search(u"a\\.b", b"axb"))
+
+    def test_brackets(self):
+        self.assertTrue(search(u"^[]a]+$", b"]a]"))
+        self.assertTrue(search(u"^[^]a]+$", b"bc"))
+        self.assertTrue(search(u"[[]", b"["))
+        self.assertRaises(ValueError, egrep.translate, u"[abc")
+
+    def test_backslash_in_brackets(self):
+        # a backslash is literal inside a bracket expression and does not escape ]
+        self.assertEqual(egrep.translate(u"[a\\]x"), u"[a\\\\]x")
+        self.assertTrue(search(u"^[a\\]+$", b"a\\a"))
+        self.assertTrue(search(u"[\\d]", b"d"))
+        self.assertTrue(search(u"[\\d]", b"\\"))
+        self.assertFalse(search(u"[\\d]", b"1"))
+        self.assertEqual(prefilter.literals(u"^X: [a\\]spam]"), [u"X: ", u"spam]"])
+
+    def test_case(self):
+        self.assertTrue(search(u"^subject", b"Subject: hello"))
+        self.assertFalse(search(u"^subject", b"Subject: hello", case_sensitive=True))
+
+
+class CompileTestCase(unittest.TestCase):
+
+    def test_cache(self):
+        self.assertIs(egrep.compile(u"^X-Spam"), egrep.compile(u"^X-Spam"))
+        self.assertIsNot(egrep.compile(u"^X-Spam"), egrep.compile(u"^X-Spam", True))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, egrep.compile, u"(unbalanced")
+
+    def test_compile_procmailrc(self):
+        procmailrc = pyprocmail.parseString(
+            u":0 D\n* ^Subject: Hello\n{\n:0\n* ! ^X-Spam\nx\n}\n"
+        )
+        egrep.compile_procmailrc(procmailrc)
+        cond = procmailrc[0].conditions[0]
+        regex = egrep.compiled(cond, True)
+        self.assertIs(regex, egrep.compile(u"^Subject: Hello", True))
+        self.assertIsNotNone(procmailrc["0.0"].conditions[0].condition._compiled)
+        cond.regex = u"^Subject: Bye"
+        self.assertIs(egrep.compiled(cond, True), egrep.compile(u"^Subject: Bye", True))
+
+
+if __name__ == '__main__':
+    unittest.main()
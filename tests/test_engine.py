@@ -0,0 +1,210 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyprocmail
+
+MESSAGE = b"""From: alice@example.com
+To: bob@example.com
+Subject: hello
+
+Hello Bob
+"""
+
+
+def evaluate(text, executor=None):
+    engine = pyprocmail.Engine(pyprocmail.parseString(text), executor=executor)
+    return engine.evaluate(MESSAGE, {"HOME": "/home/bob", "LOGNAME": "bob"})
+
+
+def targets(result):
+    return [delivery.target for delivery in result.deliveries]
+
+
+class FlagsTestCase(unittest.TestCase):
+
+    executor = pyprocmail.StubExecutor({
+        u"false": (1, b""), u"true": (0, b"X-Filtered: yes\n"),
+    })
+
+    def test_stop_on_delivery(self):
+        result = evaluate(u":0\n* ^Subject: hello\nfirst\n:0\nsecond\n")
+        self.assertEqual(targets(result), [u"/home/bob/first"])
+        self.assertEqual(result.executed, [(None, "1")])
+
+    def test_default(self):
+        result = evaluate(u":0\n* ^Subject: nope\nfirst\n")
+        self.assertEqual(result.delivery.type, "default")
+        self.assertEqual(result.delivery.target, u"/var/mail/bob")
+        self.assertEqual(result.executed, [])
+
+    def test_A(self):
+        result = evaluate(u":0\n* ^Subject: nope\nfirst\n:0 A\nsecond\n:0\nthird\n")
+        self.assertEqual(targets(result), [u"/home/bob/third"])
+        result = evaluate(u":0 c\n* ^Subject: hello\nfirst\n:0 A\nsecond\n")
+        self.assertEqual(targets(result), [u"/home/bob/first", u"/home/bob/second"])
+
+    def test_a(self):
+        text = u":0 fw\n* ^Subject\n| %s\n:0 a\nsuccess\n:0\nother\n"
+        result = evaluate(text % u"true", self.executor)
+        self.assertEqual(targets(result), [u"/home/bob/success"])
+        result = evaluate(text % u"false", self.executor)
+        self.assertEqual(targets(result), [u"/home/bob/other"])
+
+    def test_E(self):
+        result = evaluate(u":0\n* ^Subject: nope\nfirst\n:0 E\nsecond\n")
+        self.assertEqual(targets(result), [u"/home/bob/second"])
+        result = evaluate(u":0 c\n* ^Subject\nfirst\n:0 E\nsecond\n:0\nthird\n")
+        self.assertEqual(targets(result), [u"/home/bob/first", u"/home/bob/third"])
+
+    def test_e(self):
+        text = u":0 fw\n* ^Subject\n| %s\n:0 e\nerror\n:0\nother\n"
+        result = evaluate(text % u"false", self.executor)
+        self.assertEqual(targets(result), [u"/home/bob/error"])
+        result = evaluate(text % u"true", self.executor)
+        self.assertEqual(targets(result), [u"/home/bob/other"])
+
+    def test_filter(self):
+        result = evaluate(
+            u":0 fw\n| true\n:0\n* ^X-Filtered: yes\nfiltered\n", self.executor
+        )
+        self.assertEqual(targets(result), [u"/home/bob/filtered"])
+
+
+class CloneTestCase(unittest.TestCase):
+
+    def test_clone_delivery(self):
+        result = evaluate(u":0 c\n* ^Subject\nfirst\n:0\nsecond\n")
+        self.assertEqual(targets(result), [u"/home/bob/first", u"/home/bob/second"])
+        self.assertEqual([delivery.clone for delivery in result.deliveries], [True, False])
+
+    def test_clone_block(self):
+        result = evaluate(u":0 c\n{\n    A=1\n    :0\n    clone\n}\n:0\nmain\n")
+        self.assertEqual(targets(result), [u"/home/bob/clone", u"/home/bob/main"])
+        self.assertEqual([delivery.recipe_id for delivery in result.deliveries], ["1.1", "2"])
+        # the variables assigned by the clone are not seen by the parent
+        self.assertNotIn("A", result.variables)
+
+
+class ScoreTestCase(unittest.TestCase):
+
+    def test_weights(self):
+        # the greedy regular expression matches once: 1, plus 10 for the subject
+        result = evaluate(u":0\n* 1^1 ^Subject:.*o\n* 10^0 ^Subject\n{ }\n")
+        self.assertEqual(result.executed, [(None, "1")])
+        self.assertEqual(result.variables["="], u"11")
+        result = evaluate(u":0\n* 1^1 o\n{ }\n")
+        self.assertEqual(result.variables["="], u"%d" % MESSAGE.split(b"\n\n")[0].count(b"o"))
+
+    def test_no_score(self):
+        result = evaluate(u":0\n* 1^0 ^X-Nope\nscored\n:0\nother\n")
+        self.assertEqual(targets(result), [u"/home/bob/other"])
+        self.assertEqual(result.variables["="], u"0")
+
+
+class MatchTestCase(unittest.TestCase):
+
+    def test_match(self):
+        result = evaluate(u":0\n* ^Subject: \\/[a-z]+\n$MATCH\n")
+        self.assertEqual(result.variables["MATCH"], u"hello")
+        self.assertEqual(targets(result), [u"/home/bob/hello"])
+
+    def test_variable_match(self):
+        result = evaluate(u"V=abc-def\n:0\n* V ?? -\\/.*\n{ }\n")
+        self.assertEqual(result.variables["MATCH"], u"def")
+
+    def test_recipe_matches_with_engine(self):
+        procmailrc = pyprocmail.parseString(u":0\n* ^Subject: bye\n* B ?? Bob\nbye\n")
+        engine = pyprocmail.Engine(procmailrc, index=False)
+        self.assertFalse(procmailrc[0].matches(MESSAGE, engine=engine))
+        self.assertFalse(procmailrc[0].matches(MESSAGE, engine=engine))
+        self.assertEqual(engine.stats()["evaluated"], 2)
+        self.assertEqual(engine.stats()["skipped"], 2)
+        self.assertTrue(pyprocmail.parseString(u":0\n* Bob\nx\n")[0].matches(MESSAGE))
+
+
+class IncludeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.maildir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.maildir)
+
+    def rcfile(self, name, text):
+        with io.open(os.path.join(self.maildir, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def evaluate(self, text):
+        procmailrc = pyprocmail.parseString(u"MAILDIR=%s\n%s" % (self.maildir, text))
+        engine = pyprocmail.Engine(procmailrc, loader=pyprocmail.Loader())
+        return engine.evaluate(MESSAGE, {"HOME": self.maildir})
+
+    def test_empty_switchrc(self):
+        self.rcfile("sw.rc", u"SWITCHRC=\n:0\n* ^Subject\nafter\n")
+        result = self.evaluate(u"INCLUDERC=sw.rc\n:0\n* ^Subject\nmain\n")
+        self.assertEqual(result.delivery.target, os.path.join(self.maildir, u"main"))
+
+    def test_includerc(self):
+        self.rcfile("inc.rc", u"FOLDER=included\n")
+        result = self.evaluate(u"INCLUDERC=inc.rc\n:0\n$FOLDER\n")
+        self.assertEqual(result.delivery.target, os.path.join(self.maildir, u"included"))
+
+    def test_switchrc(self):
+        self.rcfile("sw.rc", u":0\n* ^Subject\nswitched\n")
+        result = self.evaluate(u"SWITCHRC=sw.rc\n:0\nmain\n")
+        self.assertEqual(result.delivery.target, os.path.join(self.maildir, u"switched"))
+        self.assertEqual(result.delivery.rcfile, os.path.join(self.maildir, u"sw.rc"))
+
+    def test_switchrc_in_clone(self):
+        # the clone ends with the rcfile switched to, the procmailrc goes on
+        self.rcfile("sw.rc", u":0\n* ^Subject\nswitched\n")
+        for switch, targets in [
+            (u"SWITCHRC=sw.rc", [u"switched", u"main"]), (u"SWITCHRC=", [u"main"])
+        ]:
+            result = self.evaluate(u":0 c\n{\n%s\n:0\nclone\n}\n:0\nmain\n" % switch)
+            self.assertEqual(
+                [delivery.target for delivery in result.deliveries],
+                [os.path.join(self.maildir, target) for target in targets]
+            )
+
+    def test_recursive_and_missing_includes(self):
+        self.rcfile("loop.rc", u"INCLUDERC=loop.rc\n:0\n* ^X-Nope\nloop\n")
+        for name in [u"loop.rc", u"missing.rc"]:
+            result = self.evaluate(u"INCLUDERC=%s\n:0\nmain\n" % name)
+            self.assertEqual(result.delivery.target, os.path.join(self.maildir, u"main"))
+
+    def test_included_recipe_ids(self):
+        path = os.path.join(self.maildir, u"inc.rc")
+        self.rcfile("inc.rc", u":0 c\n* ^Subject\nincluded\n")
+        procmailrc = pyprocmail.parseString(
+            u"MAILDIR=%s\nINCLUDERC=inc.rc\n:0\n* ^Subject\nmain\n" % self.maildir
+        )
+        trace = pyprocmail.Trace()
+        result = pyprocmail.Engine(procmailrc, loader=pyprocmail.Loader()).evaluate(
+            MESSAGE, {"HOME": self.maildir}, trace
+        )
+        self.assertEqual(
+            [(delivery.rcfile, delivery.recipe_id) for delivery in result.deliveries],
+            [(path, "1"), (None, "1")]
+        )
+        self.assertEqual(result.executed, [(path, "1"), (None, "1")])
+        hot = dict((key, evaluations) for key, evaluations, _, _, _ in trace.hot_recipes())
+        self.assertEqual(hot, {(path, "1"): 1, (None, "1"): 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import unittest
+
+import pyprocmail
+
+
+def assignment(text):
+    return pyprocmail.parseString(text)[0]
+
+
+class ExpandTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.environment = pyprocmail.Environment(
+            {u"HOME": u"/home/bob", u"EMPTY": u""}, hostname=u"mx"
+        )
+
+    def test_forms(self):
+        expand = self.environment.expand
+        self.assertEqual(expand(u"$HOME/Mail"), u"/home/bob/Mail")
+        self.assertEqual(expand(u"${HOME}Mail"), u"/home/bobMail")
+        self.assertEqual(expand(u"$NOPE/x"), u"/x")
+        self.assertEqual(expand(u"${NOPE:-$HOME}"), u"/home/bob")
+        self.assertEqual(expand(u"${EMPTY:-default}"), u"default")
+        self.assertEqual(expand(u"${EMPTY-default}"), u"")
+        self.assertEqual(expand(u"${NOPE-default}"), u"default")
+        self.assertEqual(expand(u"${HOME:+set}"), u"set")
+        self.assertEqual(expand(u"${EMPTY:+set}"), u"")
+        self.assertEqual(expand(u"${EMPTY+set}"), u"set")
+        self.assertEqual(expand(u"no variable"), u"no variable")
+
+    def test_cache(self):
+        cache = {}
+        environment = pyprocmail.Environment({u"A": u"1"}, cache)
+        result = environment.expand(u"$A-${B:-x}")
+        self.assertEqual(result, u"1-x")
+        self.assertIs(environment.expand(u"$A-${B:-x}"), result)
+        # shared by the environments, reused as long as the values are the same
+        other = pyprocmail.Environment({u"A": u"1"}, cache)
+        self.assertIs(other.expand(u"$A-${B:-x}"), result)
+        other[u"B"] = u"2"
+        self.assertEqual(other.expand(u"$A-${B:-x}"), u"1-2")
+        self.assertEqual(environment.expand(u"$A-${B:-x}"), u"1-x")
+
+
+class ApplyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.environment = pyprocmail.Environment({u"HOME": u"/home/bob"}, hostname=u"mx")
+
+    def test_quotes(self):
+        self.environment.apply(assignment(u"A=$HOME B='$HOME' C=\"$HOME/x\""))
+        self.assertEqual(self.environment[u"A"], u"/home/bob")
+        self.assertEqual(self.environment[u"B"], u"$HOME")
+        self.assertEqual(self.environment[u"C"], u"/home/bob/x")
+
+    def test_backquotes(self):
+        commands = []
+
+        def command(text):
+            commands.append(text)
+            return u"output\n"
+        self.environment.apply(assignment(u"A=`echo $HOME`"), command)
+        self.assertEqual(self.environment[u"A"], u"output")
+        self.assertEqual(commands, [u"echo /home/bob"])
+        self.assertRaises(RuntimeError, self.environment.apply, assignment(u"A=`date`"))
+
+    def test_unset(self):
+        self.environment.apply(assignment(u"HOME"))
+        self.assertNotIn(u"HOME", self.environment)
+
+    def test_special(self):
+        self.environment.apply(assignment(u"MAILDIR=$HOME/Mail A=1 DEFAULT=inbox"))
+        self.environment.apply(assignment(u"DEFAULT"))
+        self.assertEqual(self.environment.assigned, [
+            (u"MAILDIR", u"/home/bob/Mail"), (u"DEFAULT", u"inbox"), (u"DEFAULT", None)
+        ])
+        self.assertEqual(self.environment.maildir, u"/home/bob/Mail")
+        self.assertEqual(self.environment.default, u"")
+
+    def test_host(self):
+        self.environment.apply(assignment(u"HOST=mx"))
+        self.assertFalse(self.environment.foreign_host)
+        self.environment.apply(assignment(u"HOST=backup"))
+        self.assertTrue(self.environment.foreign_host)
+
+    def test_copy(self):
+        copy = self.environment.copy()
+        copy.apply(assignment(u"MAILDIR=/tmp A=1"))
+        self.assertNotIn(u"A", self.environment)
+        self.assertEqual(self.environment.assigned, [])
+        self.assertEqual(copy.as_dict(), {u"HOME": u"/home/bob", u"MAILDIR": u"/tmp", u"A": u"1"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import unittest
+
+import pyprocmail
+from pyprocmail import executors
+
+MESSAGE = b"""From: alice@example.com
+Subject: hello
+
+Hello Bob
+"""
+
+
+class StubExecutorTestCase(unittest.TestCase):
+
+    def test_table(self):
+        executor = pyprocmail.StubExecutor(
+            {u"true": (0, b""), u"cat": lambda input, variables: (0, input)}
+        )
+        self.assertEqual(executor(u"true", b"", {}), (0, b""))
+        self.assertEqual(executor(u"cat", b"abc", {}), (0, b"abc"))
+        self.assertEqual(executor.calls, [u"true", u"cat"])
+        self.assertRaises(KeyError, executor, u"false", b"", {})
+        self.assertEqual(executor.latencies()[u"true"]["calls"], 1)
+
+    def test_default(self):
+        executor = pyprocmail.StubExecutor({}, default=(1, b""))
+        self.assertEqual(executor(u"false", b"", {}), (1, b""))
+
+
+class MemoizingExecutorTestCase(unittest.TestCase):
+
+    def test_memoize(self):
+        stub = pyprocmail.StubExecutor({u"wc -c": lambda input, _: (0, b"%d" % len(input))})
+        executor = pyprocmail.MemoizingExecutor(stub, max_size=2)
+        self.assertEqual(executor(u"wc -c", b"ab", {}), (0, b"2"))
+        self.assertEqual(executor(u"wc -c", b"ab", {}), (0, b"2"))
+        self.assertEqual(executor(u"wc -c", b"abc", {}), (0, b"3"))
+        self.assertEqual((executor.hits, executor.misses), (1, 2))
+        self.assertEqual(stub.calls, [u"wc -c", u"wc -c"])
+
+
+class SubprocessExecutorTestCase(unittest.TestCase):
+
+    def test_run(self):
+        executor = executors.SubprocessExecutor(timeout=10)
+        self.assertEqual(executor(u"cat", b"abc", {}), (0, b"abc"))
+        self.assertEqual(executor(u"exit 3", b"", {}), (3, b""))
+        self.assertEqual(executor(u'echo "$FOLDER"', b"", {"FOLDER": u"spam"}), (0, b"spam\n"))
+        latency = executor.latencies()[u"cat"]
+        self.assertEqual(latency["calls"], 1)
+        self.assertTrue(0 <= latency["mean"] <= latency["max"])
+
+    def test_timeout(self):
+        executor = executors.SubprocessExecutor(timeout=0.2)
+        status, _ = executor(u"sleep 10", b"", {})
+        self.assertEqual(status, -9)
+
+
+class SharedEngineTestCase(unittest.TestCase):
+
+    def test_shell_condition_and_action(self):
+        executor = pyprocmail.StubExecutor({u"spamc -c": (1, b"7.2/5.0\n")})
+        engine = pyprocmail.Engine((), executor)
+        recipe = pyprocmail.parseString(u":0\n* ? spamc -c\n| spamc -c\n")[0]
+        self.assertFalse(recipe.conditions[0].matches(MESSAGE, engine=engine))
+        self.assertEqual(recipe.action.execute(MESSAGE, engine=engine), (1, b"7.2/5.0\n"))
+        self.assertEqual(executor.latencies()[u"spamc -c"]["calls"], 2)
@@ -0,0 +1,97 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import unittest
+
+import pyprocmail
+from pyprocmail import messageview
+
+MESSAGE = b"""From: alice@example.com
+Subject: a long
+ subject
+To: bob@example.com
+
+Hello Bob
+"""
+
+
+def conditions(text):
+    return pyprocmail.parseString(u":0\n%s\nx\n" % text)[0].conditions
+
+
+class MessageViewTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.message = pyprocmail.MessageView(MESSAGE)
+
+    def test_split(self):
+        self.assertEqual(str(self.message.header), MESSAGE.split(b"\n\n")[0] + b"\n")
+        self.assertEqual(str(self.message.body), b"Hello Bob\n")
+        # the body is not copied
+        self.assertIsInstance(self.message.body, buffer)
+        message = pyprocmail.MessageView(b"Subject: no body\n")
+        self.assertEqual(str(message.header), b"Subject: no body\n")
+        self.assertEqual(str(message.body), b"")
+
+    def test_texts(self):
+        grep_header = self.message.grep_header
+        self.assertIn(b"Subject: a long  subject\n", grep_header)
+        self.assertIs(self.message.grep_header, grep_header)
+        self.assertIs(self.message.text(True, False), grep_header)
+        self.assertEqual(str(self.message.text(False, True)), b"Hello Bob\n")
+        both = self.message.text(True, True)
+        self.assertEqual(both, grep_header + b"\nHello Bob\n")
+        self.assertIs(self.message.text(True, True), both)
+
+    def test_parts(self):
+        self.assertEqual(self.message.part(True, True), MESSAGE)
+        self.assertEqual(self.message.part(False, True), b"Hello Bob\n")
+        self.assertEqual(self.message.part(True, False), str(self.message.header))
+
+    def test_variables(self):
+        value = u"caf\xe9"
+        encoded = self.message.variable(u"V", {u"V": value})
+        self.assertEqual(encoded, b"caf\xc3\xa9")
+        self.assertIs(self.message.variable(u"V", {u"V": value}), encoded)
+        self.assertEqual(self.message.variable(u"V", {u"V": u"other"}), b"other")
+        self.assertEqual(self.message.variable(u"W", None), b"")
+        self.assertEqual(str(self.message.variable(u"B", None)), b"Hello Bob\n")
+
+    def test_matches(self):
+        regex, negate, body, variable, size = conditions(
+            u"* ^Subject:.*long +subject\n* ! ^X-Spam\n* B ?? ^Hello\n* V ?? ^abc$\n* < 10"
+        )
+        self.assertTrue(self.message.matches(regex))
+        self.assertTrue(self.message.matches(negate))
+        self.assertTrue(self.message.matches(body))
+        self.assertFalse(self.message.matches(regex, header=False, body=True))
+        self.assertTrue(self.message.matches(variable, variables={u"V": u"abc"}))
+        self.assertFalse(self.message.matches(variable, variables={u"V": u"abcd"}))
+        self.assertRaises(ValueError, self.message.matches, size)
+
+    def test_case(self):
+        regex, = conditions(u"* ^subject")
+        self.assertTrue(self.message.matches(regex))
+        self.assertFalse(self.message.matches(regex, case_sensitive=True))
+
+    def test_condition_matches(self):
+        regex, = conditions(u"* ^To:.*bob")
+        self.assertTrue(regex.matches(self.message))
+        self.assertTrue(regex.matches(MESSAGE))
+
+    def test_view(self):
+        self.assertIs(messageview.view(self.message), self.message)
+        self.assertEqual(messageview.view(MESSAGE).data, MESSAGE)
+        self.assertEqual(messageview.view(MESSAGE.decode("utf-8")).data, MESSAGE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import io
+import os
+import random
+import unittest
+
+from pyparsing import ParseException
+
+import pyprocmail
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+TEXT = u"""#title: variables
+PATH=/bin:/usr/bin # the path
+A=1 B="two words" C='$HOME' D=`date`
+E
+
+#comment: every kind of condition
+:0 HBc:lockfile
+* ^Subject:.*test
+* ! ^From: bob
+* < 1000
+* > 10
+* ? test -f $HOME/flag
+* $ ^To: $LOGNAME
+* VAR ?? ^value
+* 100^0 ^X-Spam
+*
+! alice@example.com bob@example.com
+
+:0 fw
+| formail -A "X-Header: yes"
+
+:0 a
+{
+    # inside the block
+    :0
+    * ^Subject: \\/.*
+    {
+        :0:
+        inner/
+    }
+
+    :0 E
+    VAR=| cat
+}
+"""
+
+# constructs written differently from their rendering
+CONSTRUCTS = [
+    u'A="a\nb"\n',
+    u'A=1 B=2 # c\n',
+    u'INCLUDERC=$HOME/x\nSWITCHRC\n',
+    u'\t:0\n\t* ^X\n\t\tbox\n',
+    u':0\n{ }\n',
+    u':0\n* 1^1 ^X\n* -2^0.5 B ?? y\n{ A=1 }\n',
+    u':0 Bh\n* $ ^To:.*${LOGNAME}\nbox\n',
+    u':0:\n! -oi a\n',
+    u'#title: t\n#comment: c\n#custom: x\n:0\nbox\n',
+    u'A=1\r\n:0\r\nbox\r\n',
+]
+
+# texts both backends refuse
+INVALID = [u":0\n", u":0\n{\n", u"}\n", u":0\n* x\n", u":0 Z\nbox\n", u":0\n{\n:0\nx\n"]
+
+
+def texts():
+    yield TEXT
+    for name in sorted(os.listdir(EXAMPLES)):
+        with io.open(os.path.join(EXAMPLES, name), encoding="utf-8") as f:
+            yield f.read()
+
+
+def locations(procmailrc):
+    locations = procmailrc._locations
+    return [
+        (type(node).__name__, start, end)
+        for node, start, end in zip(locations.nodes, locations.starts, locations.ends)
+    ]
+
+
+class BackendsTestCase(unittest.TestCase):
+    """The pyparsing grammar and the fast parser build the same trees"""
+
+    def parse(self, text):
+        """Return the trees of both backends, None if both raise a ParseException"""
+        trees = []
+        for backend in ["pyparsing", "fast"]:
+            try:
+                trees.append(pyprocmail.parseString(text, backend=backend))
+            except ParseException:
+                trees.append(None)
+        self.assertEqual(trees[0] is None, trees[1] is None, repr(text))
+        return None if trees[0] is None else trees
+
+    def check(self, text):
+        trees = self.parse(text)
+        if trees is None:
+            return False
+        procmailrc, fast = trees
+        self.assertEqual(fast.render(), procmailrc.render(), repr(text))
+        self.assertEqual(pyprocmail.diff(procmailrc, fast), [], repr(text))
+        self.assertEqual([stmt.id for stmt in fast], [stmt.id for stmt in procmailrc])
+        self.assertEqual(locations(fast), locations(procmailrc), repr(text))
+        return True
+
+    def test_texts(self):
+        for text in texts():
+            self.assertTrue(self.check(text))
+
+    def test_constructs(self):
+        for text in CONSTRUCTS:
+            self.assertTrue(self.check(text), repr(text))
+
+    def test_errors(self):
+        for text in INVALID:
+            errors = []
+            for backend in ["pyparsing", "fast"]:
+                with self.assertRaises(ParseException) as context:
+                    pyprocmail.parseString(text, backend=backend)
+                errors.append((context.exception.loc, context.exception.lineno))
+            self.assertEqual(errors[0], errors[1], repr(text))
+
+    def test_backend_argument(self):
+        path = os.path.join(EXAMPLES, "procmailrc1")
+        self.assertEqual(
+            pyprocmail.parse(path, backend="fast").render(), pyprocmail.parse(path).render()
+        )
+        self.assertRaises(ValueError, pyprocmail.parseString, u"A=1\n", backend="lex")
+
+    def test_render_parse(self):
+        for text in texts():
+            rendered = pyprocmail.parseString(text).render()
+            self.assertTrue(self.check(rendered))
+            self.assertEqual(pyprocmail.parseString(rendered, backend="fast").render(), rendered)
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        sources = list(texts())
+        for _ in xrange(300):
+            text = rng.choice(sources)
+            start = rng.randint(0, len(text))
+            stop = min(len(text), start + rng.choice([0, 1, 2, 5]))
+            inserted = u"".join(
+                rng.choice(u"\n #:*!{}$=^a") for _ in xrange(rng.choice([0, 1, 2]))
+            )
+            self.check(text[:start] + inserted + text[stop:])
+
+    def test_iterparse(self):
+        path = os.path.join(EXAMPLES, "procmailrc1")
+        self.assertEqual(
+            [stmt.render() for stmt in pyprocmail.iterparse(path)],
+            [stmt.render() for stmt in pyprocmail.parse(path)]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import unittest
+
+import pyprocmail
+from pyprocmail import messageview, prefilter
+
+RCFILE = u""":0
+* ^From:.*alice@example\\.com
+alice
+
+:0 B
+* invoice
+invoices
+
+:0
+* ^Subject:.*(urgent|asap)
+urgent
+
+:0
+* ? true
+* ^Subject:.*never
+shell
+
+:0
+* ^X-Mailer: \\/.*
+* B ?? unsubscribe
+newsletter
+
+:0
+* ^To:.*team@example\\.com
+{
+    :0
+    * ^Subject:.*meeting
+    meetings
+
+    :0
+    team
+}
+"""
+
+
+def message(header, body=b"Hello\n"):
+    return b"%s\n\n%s" % (header, body)
+
+
+MESSAGES = [
+    message(b"From: alice@example.com\nSubject: hi"),
+    message(b"From: bob@example.com\nSubject: bill", b"Your invoice\n"),
+    message(b"From: bob@example.com\nSubject: ASAP please"),
+    message(b"From: carol@example.com\nX-Mailer: list\nSubject: news", b"unsubscribe\n"),
+    message(b"From: carol@example.com\nTo: team@example.com\nSubject: meeting"),
+    message(b"From: carol@example.com\nTo: team@example.com\nSubject: lunch"),
+    message(b"From: dave@example.com\nSubject: never mind"),
+]
+
+
+class LiteralsTestCase(unittest.TestCase):
+
+    def test_required(self):
+        self.assertEqual(
+            prefilter.literals(u"^From:.*alice@example\\.com"), [u"From:", u"alice@example.com"]
+        )
+        self.assertEqual(prefilter.literals(u"^Subject: \\/.*"), [u"Subject: "])
+        self.assertEqual(prefilter.literals(u"\\<spam\\>"), [u"spam"])
+
+    def test_optional(self):
+        self.assertEqual(prefilter.literals(u"^Subject:.*(urgent|asap)"), [u"Subject:"])
+        self.assertEqual(prefilter.literals(u"urgent|asap"), [])
+        self.assertEqual(prefilter.literals(u"colou?r"), [u"colo"])
+        self.assertEqual(prefilter.literals(u"abcx*def"), [u"abc", u"def"])
+        self.assertEqual(prefilter.literals(u"abcx+def"), [u"abcx", u"def"])
+        self.assertEqual(prefilter.literals(u"ab.cd"), [])
+
+    def test_macros(self):
+        self.assertEqual(prefilter.literals(u"^TO_bob@example\\.com"), [u"bob@example.com"])
+
+    def test_pure(self):
+        conditions = pyprocmail.parseString(
+            u":0\n* ^X\n* ! < 10\n* ? true\n* ^Subject: \\/.*\n* V ?? ^x\nx\n"
+        )[0].conditions
+        self.assertEqual(
+            [prefilter.pure(cond) for cond in conditions], [True, True, False, False, True]
+        )
+
+
+class LiteralIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.procmailrc = pyprocmail.parseString(RCFILE)
+        self.index = prefilter.LiteralIndex(self.procmailrc)
+
+    def test_candidates(self):
+        alice, invoices, urgent, shell, newsletter, team = [
+            stmt for stmt in self.procmailrc if stmt.is_recipe()
+        ]
+        meetings = team.action[0]
+        view = messageview.MessageView(MESSAGES[0])
+        self.assertTrue(self.index.candidate(view, alice))
+        self.assertFalse(self.index.candidate(view, invoices))
+        # "Subject:" is required, not the alternatives
+        self.assertTrue(self.index.candidate(view, urgent))
+        # the conditions from the first one with a side effect are not used
+        self.assertTrue(self.index.candidate(view, shell))
+        self.assertTrue(self.index.candidate(view, newsletter))
+        self.assertFalse(self.index.candidate(view, team))
+        self.assertFalse(self.index.candidate(view, meetings))
+        self.assertEqual((self.index.checked, self.index.skipped), (5, 3))
+
+    def test_parts(self):
+        # "invoice" in the header of a recipe searching the body
+        invoices = self.procmailrc[1]
+        view = messageview.MessageView(message(b"Subject: invoice"))
+        self.assertFalse(self.index.candidate(view, invoices))
+        view = messageview.MessageView(message(b"Subject: bill", b"INVOICE\n"))
+        self.assertTrue(self.index.candidate(view, invoices))
+
+    def test_same_deliveries(self):
+        executor = pyprocmail.StubExecutor({u"true": (0, b"")})
+        indexed = pyprocmail.Engine(self.procmailrc, executor)
+        plain = pyprocmail.Engine(self.procmailrc, executor, index=False)
+        variables = {"HOME": "/home/bob", "LOGNAME": "bob"}
+        for raw in MESSAGES:
+            result = indexed.evaluate(raw, variables)
+            expected = plain.evaluate(raw, variables)
+            self.assertEqual(result.delivery.target, expected.delivery.target, raw)
+            self.assertEqual(result.executed, expected.executed, raw)
+            self.assertEqual(result.variables, expected.variables, raw)
+        self.assertTrue(indexed.stats()["prefiltered"] > 0)
+        self.assertEqual(plain.stats()["prefiltered"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
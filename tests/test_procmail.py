@@ -0,0 +1,323 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import errno
+import io
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from pyparsing import ParseException
+
+import pyprocmail
+from pyprocmail import procmail
+from pyprocmail.procmail import ActionNested, ActionSave, Comment, ConditionRegex
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+TEXT = u"""A=1
+B=2
+:0
+{
+    :0
+    inner
+}
+:0
+outer
+"""
+
+
+class IdIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.procmailrc = pyprocmail.parseString(TEXT)
+        # build the index
+        self.procmailrc.find_recipe("1")
+
+    def test_setitem(self):
+        self.procmailrc[1] = Comment("x")
+        self.assertIs(self.procmailrc["1"], self.procmailrc[1])
+        self.assertEqual(self.procmailrc["1"].render(), u"# x")
+
+    def test_delitem(self):
+        del self.procmailrc[0]
+        self.assertEqual(self.procmailrc["0"].render(), u"B=2")
+        self.assertEqual(self.procmailrc.find_recipe("1").id, "1")
+
+    def test_slices(self):
+        self.procmailrc[0:2] = [Comment("z")]
+        self.assertEqual(self.procmailrc["0"].render(), u"# z")
+        self.assertEqual(self.procmailrc.find_recipe("2").id, "2")
+        del self.procmailrc[:1]
+        self.assertEqual(self.procmailrc.find_recipe("2").id, "1")
+
+    def test_iadd(self):
+        self.procmailrc += [Comment("w")]
+        self.assertEqual(self.procmailrc["4"].render(), u"# w")
+
+    def test_insert(self):
+        inner = self.procmailrc["2.0"]
+        self.procmailrc.insert(0, Comment("first"))
+        self.assertEqual(inner.id, "3.0")
+        self.procmailrc[3].insert(0, Comment("first"))
+        self.assertEqual(inner.id, "3.1")
+        self.assertEqual(inner._recipe_id, "1.1")
+
+    def test_remove_by_identity(self):
+        # the statements of a copy of the tree are equal to the statements of the tree
+        copy = pyprocmail.parseString(TEXT)
+        self.assertEqual(copy[0], self.procmailrc[0])
+        self.assertRaises(ValueError, self.procmailrc.remove, copy[0])
+        self.assertRaises(ValueError, self.procmailrc[2].remove, copy["2.0"])
+        self.assertIs(copy[0].parent, copy)
+        self.assertEqual(len(self.procmailrc), 4)
+        first = self.procmailrc[0]
+        self.procmailrc.remove(first)
+        self.assertIsNone(first.parent)
+        self.assertEqual(self.procmailrc["0"].render(), u"B=2")
+        inner = self.procmailrc["1.0"]
+        self.procmailrc[1].remove(inner)
+        self.assertEqual(len(self.procmailrc[1]), 0)
+        self.assertIsNone(inner.parent)
+
+    def test_replace_nested_action(self):
+        inner = self.procmailrc["2.0"]
+        self.procmailrc[2].action = ActionSave("saved")
+        self.assertRaises(KeyError, lambda: self.procmailrc["2.0"])
+        self.assertRaises(KeyError, self.procmailrc.find_recipe, "1.1")
+        self.assertIsNone(inner.id)
+        self.procmailrc[2].action = ActionNested([Comment("c")])
+        self.assertEqual(self.procmailrc["2.0"].render(), u"# c")
+
+
+EVERY_NODE = u"""A=1 # assignment
+# comment
+:0 c
+* ! ^X-Spam
+* 1^0 > 10
+* V ?? x
+* $ $V
+* ? true
+{
+    :0
+    ! alice@example.com bob@example.com
+
+    :0 w
+    | cat
+}
+:0
+box
+"""
+
+
+def nodes(stmt):
+    """The statement `stmt` and the nodes it is made of"""
+    yield stmt
+    if stmt.is_recipe():
+        for node in [stmt.header, stmt.action] + stmt.conditions:
+            while node is not None:
+                yield node
+                node = getattr(node, "condition", None)
+                if not isinstance(node, procmail.Condition):
+                    node = None
+        if stmt.action.is_nested():
+            for child in stmt.action:
+                for node in nodes(child):
+                    yield node
+
+
+class SlotsTestCase(unittest.TestCase):
+
+    def test_no_instance_dict(self):
+        types = set()
+        for stmt in pyprocmail.parseString(EVERY_NODE):
+            for node in nodes(stmt):
+                types.add(type(node).__name__)
+                self.assertFalse(hasattr(node, "__dict__"), type(node))
+                self.assertRaises(AttributeError, setattr, node, "unknown", 1)
+        self.assertEqual(len(types), 15)
+
+    def test_statement_lists(self):
+        for cls in [procmail.Recipe, procmail.ProcmailRc]:
+            for name in ["_statements", "_child_id", "_child_recipe_id", "_modified"]:
+                self.assertIn(name, cls.__dict__)
+
+
+NESTED = u""":0
+* ^From:.*boss
+{
+    :0
+    * ^Subject:.*urgent
+    {
+        :0
+        * ^X-Priority: 1
+        urgent
+    }
+}
+:0
+! archive@example.com
+"""
+
+
+class RenderCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.procmailrc = pyprocmail.parseString(NESTED)
+        self.procmailrc.render()
+        self.leaf = self.procmailrc[0].action[0].action[0]
+
+    def assertRendered(self, text):
+        self.assertEqual(self.procmailrc.render(), pyprocmail.parseString(text).render())
+
+    def test_unchanged(self):
+        forward = self.procmailrc[1].render()
+        self.assertIs(self.procmailrc[0].render(), self.procmailrc[0].render())
+        block = self.procmailrc[0].action
+        self.assertIs(block.render(), block.render())
+        self.leaf.action.path = u"important"
+        self.assertRendered(NESTED.replace(u"        urgent\n", u"        important\n"))
+        self.assertIs(self.procmailrc[1].render(), forward)
+
+    def test_attributes(self):
+        self.leaf.header.c = True
+        self.assertRendered(NESTED.replace(u"        :0\n", u"        :0 c\n"))
+        self.leaf.conditions[0].regex = u"^X-Priority: 2"
+        self.assertRendered(
+            NESTED.replace(u"        :0\n", u"        :0 c\n").replace(u": 1", u": 2")
+        )
+
+    def test_modified_in_place(self):
+        self.leaf.conditions.append(ConditionRegex(u"^To:.*bob"))
+        self.assertRendered(NESTED.replace(u": 1\n", u": 1\n        * ^To:.*bob\n"))
+        self.procmailrc[1].action.recipients.append(u"backup@example.com")
+        self.assertRendered(
+            NESTED.replace(u": 1\n", u": 1\n        * ^To:.*bob\n")
+            .replace(u"archive@example.com", u"archive@example.com backup@example.com")
+        )
+
+    def test_blocks(self):
+        self.procmailrc[0].action[0].append(Comment(u"end"))
+        text = NESTED.replace(u"urgent\n    }", u"urgent\n        # end\n    }")
+        self.assertRendered(text)
+        self.procmailrc[0].action[0].pop(0)
+        self.assertRendered(text.replace(u"        :0\n        * ^X-Priority: 1\n", u"")
+                            .replace(u"        urgent\n", u""))
+
+
+class Chunks(list):
+    """A file object keeping the chunks written"""
+
+    def write(self, data):
+        self.append(data)
+
+
+class RenderToTestCase(unittest.TestCase):
+
+    def render_to(self, procmailrc, charset="utf-8"):
+        f = io.BytesIO()
+        procmailrc.render_to(f, charset)
+        return f.getvalue()
+
+    def test_same_bytes(self):
+        with io.open(os.path.join(EXAMPLES, "procmailrc1"), encoding="utf-8") as f:
+            example = f.read()
+        for text in [TEXT, NESTED, EVERY_NODE, example]:
+            procmailrc = pyprocmail.parseString(text)
+            self.assertEqual(self.render_to(procmailrc), procmailrc.render().encode("utf-8"))
+        # with a part of the renderings cached
+        procmailrc = pyprocmail.parseString(NESTED)
+        procmailrc.render()
+        procmailrc[0].action[0].action[0].action.path = u"important"
+        self.assertEqual(self.render_to(procmailrc), procmailrc.render().encode("utf-8"))
+
+    def test_charset(self):
+        procmailrc = pyprocmail.parseString(u"# caf\xe9\n:0\ncaf\xe9\n")
+        self.assertEqual(
+            self.render_to(procmailrc, "latin-1"), procmailrc.render().encode("latin-1")
+        )
+
+    def test_streamed(self):
+        procmailrc = pyprocmail.parseString(
+            u":0\n{\n%s}\n" % (u":0\n* ^Subject: x\nbox\n" * 100)
+        )
+        chunks = Chunks()
+        procmailrc.render_to(chunks)
+        self.assertEqual(b"".join(chunks), procmailrc.render().encode("utf-8"))
+        self.assertTrue(len(chunks) > 100)
+        self.assertTrue(max(len(chunk) for chunk in chunks) < 100)
+
+
+class WriteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "procmailrc")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def mode(self):
+        return stat.S_IMODE(os.stat(self.path).st_mode)
+
+    def test_new_file_mode(self):
+        umask = os.umask(0o027)
+        try:
+            pyprocmail.parseString(TEXT).write(self.path)
+        finally:
+            os.umask(umask)
+        self.assertEqual(self.mode(), 0o640)
+        self.assertEqual(
+            pyprocmail.parse(self.path).render(), pyprocmail.parseString(TEXT).render()
+        )
+
+    def test_preserve_mode(self):
+        pyprocmail.parseString(TEXT).write(self.path)
+        os.chmod(self.path, 0o640)
+        pyprocmail.parseString(TEXT).write(self.path, preserve=True)
+        self.assertEqual(self.mode(), 0o640)
+
+    def test_preserve_foreign_owner(self):
+        pyprocmail.parseString(TEXT).write(self.path)
+        stat = os.stat(self.path)
+
+        def chown(path, uid, gid):
+            raise OSError(errno.EPERM, "Operation not permitted")
+        # the file looks owned by another user, who cannot be given the file
+        saved = os.getuid, os.chown
+        os.getuid = lambda: stat.st_uid + 1
+        os.chown = chown
+        try:
+            pyprocmail.parseString(TEXT).write(self.path, preserve=True)
+        finally:
+            os.getuid, os.chown = saved
+        self.assertEqual(os.listdir(self.directory), ["procmailrc"])
+
+    def test_validate(self):
+        procmailrc = pyprocmail.parseString(TEXT)
+        self.assertIs(procmailrc.write(self.path, validate="none"), procmailrc)
+        self.assertEqual(
+            procmailrc.write(self.path, validate="fast").render(), procmailrc.render()
+        )
+        self.assertRaises(ValueError, procmailrc.write, self.path, validate="quick")
+        # a tree rendering an invalid procmailrc does not replace the file
+        procmailrc[-1].action = ActionSave(u"")
+        with self.assertRaises(ParseException):
+            procmailrc.write(self.path)
+        self.assertEqual(os.listdir(self.directory), ["procmailrc"])
+        self.assertEqual(
+            pyprocmail.parse(self.path).render(), pyprocmail.parseString(TEXT).render()
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import json
+import os
+import unittest
+import zlib
+
+import pyprocmail
+from pyprocmail import serialize
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+
+class SerializeTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        for name in sorted(os.listdir(EXAMPLES)):
+            procmailrc = pyprocmail.parse(os.path.join(EXAMPLES, name))
+            loaded = pyprocmail.loads(pyprocmail.dumps(procmailrc))
+            self.assertEqual(loaded.render(), procmailrc.render())
+            self.assertEqual(pyprocmail.diff(procmailrc, loaded), [])
+
+    def test_invalid_data(self):
+        data = pyprocmail.dumps(pyprocmail.parse(os.path.join(EXAMPLES, "procmailrc1")))
+
+        def dump(tree):
+            return serialize.MAGIC + chr(serialize.VERSION) + zlib.compress(json.dumps(tree))
+        recipe = [2, [u"0", u"", False, None], [], [2, None, u"INBOX"]] + [None] * 5
+        invalid = [
+            b"", serialize.MAGIC, serialize.MAGIC + chr(serialize.VERSION),
+            serialize.MAGIC + chr(serialize.VERSION) + b"garbage", data[:len(data) // 2],
+            serialize.MAGIC + chr(serialize.VERSION + 1) + data[len(serialize.MAGIC) + 1:],
+            dump(5), dump([[9]]), dump([[0]]), dump([[2, 1]]), dump([[True, u"x"]]),
+            # a comment from an int
+            dump([[0, 5]]),
+            dump([[1, [[u"A", 1, None]], None, None, None, None]]),
+            dump([recipe[:1] + [[0, u"", False, None]] + recipe[2:]]),
+            dump([recipe[:2] + [[[3, None, 7]]] + recipe[3:]]),
+            dump([recipe[:3] + [[0, None, [u"bob", None]]] + recipe[4:]]),
+            dump([recipe[:4] + [[u"title"]] + recipe[5:]]),
+        ]
+        self.assertEqual(pyprocmail.loads(dump([recipe])).render(), u"\n:0\nINBOX\n")
+        for value in invalid:
+            self.assertRaises(ValueError, pyprocmail.loads, value)
+
+
+if __name__ == '__main__':
+    unittest.main()
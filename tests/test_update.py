@@ -0,0 +1,104 @@
+# ⁻*- coding: utf-8 -*-
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License version 3 for
+# more details.
+#
+# You should have received a copy of the GNU General Public License version 3
+# along with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# (c) 2015 Valentin Samir
+import io
+import os
+import random
+import unittest
+
+from pyparsing import ParseException
+
+import pyprocmail
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+TEXT = u"""#title: first
+A=1 #title: t
+:0
+INBOX
+
+#comment: nested
+:0 HB:
+* ^Subject: x
+*\tVAR ?? ! y
+{
+    B=2
+    :0 c
+    ! bob@example.com
+}
+"""
+
+# the characters inserted by the random edits
+CHARS = u"\n\n  \t#:*!{}$=abc"
+
+
+class UpdateTestCase(unittest.TestCase):
+
+    def check(self, old_text, new_text):
+        """update a tree parsed from `old_text` to `new_text` and compare it to a fresh parse"""
+        try:
+            expected = pyprocmail.parseString(new_text, backend="fast")
+        except ParseException:
+            expected = None
+        procmailrc = pyprocmail.parseString(old_text, backend="fast")
+        try:
+            pyprocmail.update(procmailrc, old_text, new_text)
+        except ParseException:
+            self.assertIsNone(expected, repr(new_text))
+            return False
+        self.assertIsNotNone(expected, repr(new_text))
+        self.assertEqual(procmailrc.render(), expected.render(), repr(new_text))
+        self.assertEqual([stmt.id for stmt in procmailrc], [stmt.id for stmt in expected])
+        self.assertEqual(self.locations(procmailrc), self.locations(expected), repr(new_text))
+        return True
+
+    def locations(self, procmailrc):
+        locations = procmailrc._locations
+        return [
+            (type(node).__name__, start, end)
+            for node, start, end in zip(locations.nodes, locations.starts, locations.ends)
+        ]
+
+    def test_kept_statement_locations(self):
+        old_text = u":0\n* ^Subject: x\n *\tVAR ?? ! y\nINBOX\n"
+        new_text = u":0\n* ^Subject: x\n*\tVAR ?? ! y\nINBOX\n"
+        self.check(old_text, new_text)
+        procmailrc = pyprocmail.parseString(old_text, backend="fast")
+        pyprocmail.update(procmailrc, old_text, new_text)
+        self.assertEqual(procmailrc.location(procmailrc[0].conditions[1]).start, 17)
+
+    def test_locations_forgotten(self):
+        procmailrc = pyprocmail.parseString(u"A=1\n:0\nINBOX\n", backend="fast")
+        self.assertEqual(procmailrc.location(procmailrc[1]).line, 2)
+        del procmailrc[0]
+        self.assertIsNone(procmailrc.location(procmailrc[0]))
+
+    def test_edit_merged_into_previous_statement(self):
+        self.check(u"A=1 #title: t\n:0\nINBOX\n", u"A=1 #titl t\n:0\nINBOX\n")
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        texts = [TEXT]
+        for name in sorted(os.listdir(EXAMPLES)):
+            with io.open(os.path.join(EXAMPLES, name), encoding="utf-8") as f:
+                texts.append(f.read())
+        checked = 0
+        for _ in xrange(1000):
+            text = rng.choice(texts)
+            start = rng.randint(0, len(text))
+            stop = min(len(text), start + rng.choice([0, 0, 1, 1, 2, 5]))
+            inserted = u"".join(rng.choice(CHARS) for _ in xrange(rng.choice([0, 1, 1, 2])))
+            checked += self.check(text, text[:start] + inserted + text[stop:])
+        self.assertGreater(checked, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()